@@ -0,0 +1,102 @@
+"""
+Compare ways of serving the Hugging Face plugin on CPU with a thread pool:
+
+- default threads: every concurrent generation uses torch's default thread
+  count (all cores), so the pool runs `pool size` x `cores` busy threads
+- partitioned: the cores are split between the concurrent generations
+  (the server's default, see TORCH_THREADS)
+- int8: partitioned, with the linear layers dynamically quantized to int8
+- compiled: partitioned, with the forward pass compiled by torch.compile
+
+Each mode runs in its own process, so that thread settings and memory don't
+leak from one to the next. The script reports the generated tokens per second
+over all concurrent generations, and the resident memory (RSS) of the process
+once the model is loaded and after generating. Linux only.
+
+Usage:
+    python benchmarks/cpu_inference.py --model facebook/opt-350m --pool-size 4 --requests 16
+"""
+import argparse
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+PROMPTS = [
+    "The history of the printing press begins",
+    "Once upon a time, in a small village by the sea,",
+    "The three most important ideas in economics are",
+    "Here is a short poem about the autumn:",
+]
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def run(model_name: str, params: dict, threads, pool_size: int, requests: int, max_tokens: int):
+    import torch
+    from gourami.core import metrics
+    from gourami.core.cpu import limit_torch_threads
+    from gourami.plugins.huggingface_plugin import HuggingFaceConfig, HuggingFaceModel
+
+    model = HuggingFaceModel(HuggingFaceConfig(model_name=model_name, max_tokens=max_tokens, device="cpu", **params))
+    limit_torch_threads(threads)
+    loaded_mb = rss_mb()
+
+    def generate(prompt: str) -> int:
+        request = metrics.RequestStats()
+        token = metrics.current_request.set(request)
+        try:
+            model.predict(prompt)
+        finally:
+            metrics.current_request.reset(token)
+        return request.output_tokens
+
+    with torch.inference_mode(), ThreadPoolExecutor(max_workers=pool_size) as executor:
+        # Warm up every thread (and compile), so that it isn't measured
+        list(executor.map(generate, PROMPTS * pool_size))
+
+        prompts = [PROMPTS[i % len(PROMPTS)] for i in range(requests)]
+        start = time.perf_counter()
+        tokens = sum(executor.map(generate, prompts))
+        elapsed = time.perf_counter() - start
+
+    return tokens / elapsed, torch.get_num_threads(), loaded_mb, rss_mb()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="facebook/opt-350m")
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--max-tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    from gourami.core.cpu import available_cores
+    partitioned = max(1, available_cores() // args.pool_size)
+
+    modes = [
+        ("default threads", {}, None),
+        ("partitioned", {}, partitioned),
+        ("int8", {"quantization": "int8"}, partitioned),
+        ("compiled", {"torch_compile": True}, partitioned),
+    ]
+
+    print(f"{available_cores()} cores, pool size {args.pool_size}")
+    print(f"{'mode':<16} {'threads':>8} {'tokens/s':>10} {'loaded RSS (MB)':>16} {'final RSS (MB)':>15}")
+    context = multiprocessing.get_context("spawn")
+    for name, params, threads in modes:
+        with context.Pool(1) as pool:
+            speed, used_threads, loaded_mb, final_mb = pool.apply(
+                run,
+                (args.model, params, threads, args.pool_size, args.requests, args.max_tokens)
+            )
+        print(f"{name:<16} {used_threads:>8} {speed:>10.1f} {loaded_mb:>16.0f} {final_mb:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
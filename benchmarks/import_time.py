@@ -0,0 +1,103 @@
+"""
+Measure what `gourami start` imports before serving:
+
+- cli: the command line entry point (`gourami.cli.main`)
+- app: the server application loaded by each worker (`gourami.api.main`),
+  which indexes the plugins and sets up the routes
+
+Each module is imported in a fresh interpreter with `python -X importtime`,
+several times. The script reports the median wall time, the modules that take
+the longest to import, and fails when a plugin SDK or a deep learning library
+(openai, anthropic, google.generativeai, torch, transformers...) is imported:
+they must only be imported once their plugin is chosen.
+
+With --max-ms, it also fails when the median import time exceeds that budget.
+The check of the imported modules also runs with the tests, see
+tests/test_import_time.py.
+
+Usage:
+    python benchmarks/import_time.py --runs 5 --max-ms 1500
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+MODULES = {
+    "cli": "gourami.cli.main",
+    "app": "gourami.api.main",
+}
+
+# Heavy modules that only the plugins using them may import
+LAZY_MODULES = [
+    "openai",
+    "anthropic",
+    "google.generativeai",
+    "torch",
+    "transformers",
+    "sentence_transformers",
+    "numpy",
+]
+
+
+def import_once(module: str):
+    """
+    Import a module in a new interpreter.
+
+    Returns:
+        tuple: The wall time in ms, and the cumulative import time in us of every imported module
+    """
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True
+    )
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+
+    # Lines look like "import time:   self [us] | cumulative | imported package"
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, cumulative_us, name = [part.strip() for part in line.replace("import time:", "|", 1).split("|")]
+        cumulative[name] = int(cumulative_us)
+    return elapsed_ms, cumulative
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest modules to show")
+    parser.add_argument("--max-ms", type=float, default=None, help="Fail above this median import time")
+    args = parser.parse_args()
+
+    failures = []
+    for label, module in MODULES.items():
+        times = []
+        for _ in range(args.runs):
+            elapsed_ms, cumulative = import_once(module)
+            times.append(elapsed_ms)
+        median = statistics.median(times)
+
+        print(f"{label} ({module}): median {median:.0f} ms over {args.runs} runs")
+        slowest = sorted(cumulative.items(), key=lambda item: item[1], reverse=True)[:args.top]
+        for name, us in slowest:
+            print(f"  {us / 1000:>8.1f} ms  {name}")
+
+        imported = [name for name in LAZY_MODULES if name in cumulative]
+        if imported:
+            failures.append(f"{module} imports {', '.join(imported)}")
+        if args.max_ms is not None and median > args.max_ms:
+            failures.append(f"{module} takes {median:.0f} ms to import, over {args.max_ms:.0f} ms")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
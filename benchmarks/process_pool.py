@@ -0,0 +1,96 @@
+"""
+Compare the two ways of running a model on a process pool:
+
+- per-request: the bound method `model.predict` is submitted, so the model is
+  pickled and sent to a worker with every message (the previous behaviour)
+- resident: workers receive the model once through the pool initializer, with
+  its weights in shared memory, and requests only carry the message
+
+For each mode the script reports the mean per-request latency and the memory
+held by the worker processes (RSS, and PSS which splits shared pages between
+the processes that map them). Linux only, requires torch.
+
+Usage:
+    python benchmarks/process_pool.py --weights-mb 256 --workers 4 --requests 200
+"""
+import argparse
+import multiprocessing
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Type
+
+from gourami.core.model import BaseModelConfig, ChatModel
+from gourami.core.workers import create_process_pool, worker_predict
+
+
+class BallastModel(ChatModel):
+    """A model that holds `weights_mb` of weights and echoes the message."""
+
+    @classmethod
+    def get_config_class(cls) -> Type[BaseModelConfig]:
+        return BaseModelConfig
+
+    def __init__(self, weights_mb: int):
+        import torch
+        self.weights = torch.ones(weights_mb * 1024 * 1024 // 4, dtype=torch.float32)
+
+    def predict(self, message: str) -> str:
+        return message[::-1]
+
+    def share_memory(self) -> bool:
+        self.weights.share_memory_()
+        return True
+
+
+def memory_kb(pid: int, field: str) -> int:
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def run(executor: ProcessPoolExecutor, submit, requests: int, workers: int):
+    # Warm up every worker, so that startup isn't counted as request overhead
+    for future in [submit(executor, "warm up") for _ in range(workers * 2)]:
+        future.result()
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        submit(executor, "Hello, Gourami!").result()
+    latency_ms = (time.perf_counter() - start) / requests * 1000
+
+    pids = list(executor._processes)
+    rss_mb = sum(memory_kb(pid, "Rss") for pid in pids) / 1024
+    pss_mb = sum(memory_kb(pid, "Pss") for pid in pids) / 1024
+    return latency_ms, rss_mb, pss_mb
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights-mb", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    model = BallastModel(args.weights_mb)
+    print(f"Pickled model size: {len(pickle.dumps(model.predict)) / 2**20:.1f} MB")
+    print(f"{'mode':<12} {'latency (ms)':>14} {'workers RSS (MB)':>18} {'workers PSS (MB)':>18}")
+
+    per_request = ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=multiprocessing.get_context("spawn")
+    )
+    with per_request:
+        results = run(per_request, lambda ex, msg: ex.submit(model.predict, msg), args.requests, args.workers)
+    print(f"{'per-request':<12} {results[0]:>14.2f} {results[1]:>18.1f} {results[2]:>18.1f}")
+
+    resident = create_process_pool(model, "ballast", args.workers)
+    with resident:
+        results = run(resident, lambda ex, msg: ex.submit(worker_predict, msg), args.requests, args.workers)
+    print(f"{'resident':<12} {results[0]:>14.2f} {results[1]:>18.1f} {results[2]:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
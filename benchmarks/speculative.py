@@ -0,0 +1,85 @@
+"""
+Compare decoding speeds of the Hugging Face plugin on CPU:
+
+- baseline: one forward pass of the model per generated token
+- assisted: a smaller draft model proposes tokens, verified in one forward pass
+- prompt lookup: drafts are copied from n-grams of the prompt, no extra model
+
+Decoding is greedy, so all modes produce the same text. For each mode the
+script reports the generated tokens per second, and for the speculative ones
+the tokens emitted per forward pass of the model and the acceptance rate of the
+drafted tokens. Prompt lookup shines on prompts whose answer quotes them
+(summaries, code edits), the corpus mixes both kinds.
+
+Usage:
+    python benchmarks/speculative.py --target facebook/opt-350m --draft facebook/opt-125m --max-tokens 64
+"""
+import argparse
+import time
+
+from gourami.core import metrics
+from gourami.plugins.huggingface_plugin import HuggingFaceConfig, HuggingFaceModel
+
+PROMPTS = [
+    "The history of the printing press begins",
+    "Once upon a time, in a small village by the sea,",
+    "Repeat the following sentence: the quick brown fox jumps over the lazy dog, the quick brown fox jumps over the lazy dog.",
+    "def fibonacci(n):\n    if n < 2:\n        return n\n    return fibonacci(n - 1) + fibonacci(n - 2)\n\n# The same function, with a docstring:\ndef fibonacci(n):",
+]
+
+
+def run(model: HuggingFaceModel, runs: int):
+    # Warm up, so that lazy initialization isn't measured
+    model.predict(PROMPTS[0])
+
+    tokens = steps = drafted = 0
+    elapsed = 0.0
+    for _ in range(runs):
+        for prompt in PROMPTS:
+            request = metrics.RequestStats()
+            token = metrics.current_request.set(request)
+            start = time.perf_counter()
+            try:
+                model.predict(prompt)
+            finally:
+                elapsed += time.perf_counter() - start
+                metrics.current_request.reset(token)
+            tokens += request.output_tokens
+            steps += request.target_forwards
+            drafted += request.draft_forwards
+
+    return tokens / elapsed, tokens, steps, drafted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", default="facebook/opt-350m")
+    parser.add_argument("--draft", default="facebook/opt-125m", help="Must share the target's tokenizer")
+    parser.add_argument("--prompt-lookup", type=int, default=10, help="Length of the drafts looked up in the prompt")
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    base = dict(model_name=args.target, max_tokens=args.max_tokens, repetition_penalty=1.0, device="cpu")
+    modes = [
+        ("baseline", {}),
+        ("assisted", {"assistant_model_name": args.draft}),
+        ("prompt lookup", {"prompt_lookup_num_tokens": args.prompt_lookup}),
+    ]
+
+    print(f"{'mode':<14} {'tokens/s':>10} {'speedup':>8} {'tokens/step':>12} {'acceptance':>11}")
+    baseline = None
+    for name, params in modes:
+        model = HuggingFaceModel(HuggingFaceConfig(**base, **params))
+        speed, tokens, steps, drafted = run(model, args.runs)
+        baseline = baseline or speed
+
+        per_step = f"{tokens / steps:.2f}" if steps else "-"
+        # Accepted drafts are the tokens not emitted by a forward pass of the target
+        acceptance = f"{(tokens - steps) / drafted:.0%}" if drafted else "-"
+        print(f"{name:<14} {speed:>10.1f} {speed / baseline:>7.2f}x {per_step:>12} {acceptance:>11}")
+        del model
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import json
+from typing import Any, Dict, Optional, Tuple, Union
+
+# Frames exchanged with clients that opt into streaming (?stream=true), into
+# JSON messages (?protocol=json) or into multiplexed requests (?protocol=mux)
+# on the /chat WebSocket.
+#
+# In the multiplexed protocol, every frame is an envelope carrying the id of
+# its request, as a JSON text frame or a MessagePack binary frame. Responses
+# are encoded like the request they answer.
+
+Frame = Union[str, bytes]
+
+
+class InvalidRequest(ValueError):
+    """A request frame that can't be processed, with its id if it could be read."""
+    def __init__(self, message: str, request_id: Optional[str] = None):
+        super().__init__(message)
+        self.request_id = request_id
+
+
+class Envelope:
+    """A request of the multiplexed protocol."""
+    def __init__(
+        self,
+        request_id: str,
+        message: str,
+        model: Optional[str] = None,
+        stream: Optional[bool] = None,
+        params: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        trace: Optional[bool] = None
+    ):
+        self.id = request_id
+        self.message = message
+        self.model = model
+        self.stream = stream
+        self.params = params or {}
+        self.timeout = timeout
+        self.trace = trace
+
+
+def parse_request(text: str) -> Tuple[str, Optional[str]]:
+    """
+    Read a JSON request frame: `{"message": "...", "model": "..."}`, model being optional.
+
+    Returns:
+        tuple: The message and the requested model, if any
+
+    Raises:
+        ValueError: If the frame is not a valid request
+    """
+    try:
+        request = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON: {e}")
+
+    if not isinstance(request, dict) or not isinstance(request.get("message"), str):
+        raise ValueError("Requests must be objects with a 'message' string")
+
+    model = request.get("model")
+    if model is not None and not isinstance(model, str):
+        raise ValueError("'model' must be a string")
+
+    return request["message"], model
+
+
+def parse_envelope(frame: Frame) -> Envelope:
+    """
+    Read a multiplexed request frame:
+    `{"id": "...", "message": "...", "model": "...", "stream": true, "params": {...}, "timeout": 5, "trace": true}`,
+    all but id and message being optional.
+
+    Raises:
+        InvalidRequest: If the frame is not a valid request
+    """
+    if isinstance(frame, bytes):
+        try:
+            import msgpack
+        except ImportError:
+            raise InvalidRequest("MessagePack frames require the msgpack package")
+        try:
+            request = msgpack.unpackb(frame)
+        except Exception as e:
+            raise InvalidRequest(f"Invalid MessagePack: {e}")
+    else:
+        try:
+            request = json.loads(frame)
+        except json.JSONDecodeError as e:
+            raise InvalidRequest(f"Invalid JSON: {e}")
+
+    if not isinstance(request, dict):
+        raise InvalidRequest("Requests must be objects")
+
+    request_id = request.get("id")
+    if not isinstance(request_id, str) or not request_id:
+        raise InvalidRequest("Requests must have an 'id' string")
+    if not isinstance(request.get("message"), str):
+        raise InvalidRequest("Requests must have a 'message' string", request_id)
+
+    model = request.get("model")
+    if model is not None and not isinstance(model, str):
+        raise InvalidRequest("'model' must be a string", request_id)
+    stream = request.get("stream")
+    if stream is not None and not isinstance(stream, bool):
+        raise InvalidRequest("'stream' must be a boolean", request_id)
+    params = request.get("params")
+    if params is not None and not isinstance(params, dict):
+        raise InvalidRequest("'params' must be an object", request_id)
+    timeout = request.get("timeout")
+    if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0):
+        raise InvalidRequest("'timeout' must be a positive number of seconds", request_id)
+    trace = request.get("trace")
+    if trace is not None and not isinstance(trace, bool):
+        raise InvalidRequest("'trace' must be a boolean", request_id)
+
+    return Envelope(request_id, request["message"], model, stream, params, timeout, trace)
+
+
+def _encode(frame: Dict[str, Any], request_id: Optional[str], binary: bool) -> Frame:
+    if request_id is not None:
+        frame = {"id": request_id, **frame}
+    if binary:
+        try:
+            import msgpack
+            return msgpack.packb(frame)
+        except ImportError:
+            # Only to tell the client that its MessagePack frames can't be read
+            pass
+    return json.dumps(frame)
+
+
+def message_frame(content: str, request_id: Optional[str] = None, binary: bool = False) -> Frame:
+    """A complete response, when not streaming."""
+    return _encode({"type": "message", "content": content}, request_id, binary)
+
+
+def delta_frame(content: str, request_id: Optional[str] = None, binary: bool = False) -> Frame:
+    """A chunk of the response being generated."""
+    return _encode({"type": "delta", "content": content}, request_id, binary)
+
+
+def end_frame(request_id: Optional[str] = None, binary: bool = False) -> Frame:
+    """Marks the end of the current response."""
+    return _encode({"type": "end"}, request_id, binary)
+
+
+def error_frame(message: str, request_id: Optional[str] = None, binary: bool = False) -> Frame:
+    """Reports a failure while generating the current response."""
+    return _encode({"type": "error", "message": message}, request_id, binary)
+
+
+def busy_frame(message: str, retry_after: float, request_id: Optional[str] = None, binary: bool = False) -> Frame:
+    """Reports that the request was rejected because the server is overloaded."""
+    return _encode({"type": "busy", "message": message, "retry_after": retry_after}, request_id, binary)
+
+
+def trace_frame(trace: Dict[str, Any], request_id: Optional[str] = None, binary: bool = False) -> Frame:
+    """Reports when the last response went through each hop of the server, see gourami.core.tracing."""
+    return _encode({"type": "trace", **trace}, request_id, binary)
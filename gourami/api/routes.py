@@ -1,65 +1,824 @@
+import asyncio
+import codecs
+import hmac
+import json
+import os
+import signal
+import tempfile
+import threading
+import time
+from contextlib import aclosing
 from logging import getLogger
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException
-from gourami.core.model import ChatModel
-from gourami.core.config import get_settings, ExecutionStrategy
+from typing import Awaitable, Dict, List, Optional, Tuple, TypeVar, Union
+from fastapi import APIRouter, Query, Request, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from gourami.core.config import get_settings, reload_settings, ExecutionStrategy
+from gourami.core import cancellation, metrics, profiling, tracing
+from gourami.core.admission import DEFAULT_PRIORITY, AdmissionController, Overloaded
+from gourami.core.bulk import parse_items, run_bulk
+from gourami.core.cache import ResponseCache
+from gourami.core.cpu import intra_op_threads, limit_torch_threads
+from gourami.core.engine import ModelEngine
+from gourami.core.prefork import get_preloaded
+from gourami.core.registry import ModelRegistry, ModelSpec, build_model_specs
+from gourami.core.semantic_cache import SemanticCache
+from gourami.core.sessions import Session, SessionCache
+from gourami.core.workers import create_process_pool
+from gourami.api import protocol
 from gourami.plugins import get_model
-from gourami.plugins.custom_plugin import CustomModelLoader
-from concurrent.futures import ProcessPoolExecutor,ThreadPoolExecutor
-import asyncio
+from gourami.utils.logging import MESSAGES_LOGGER
+from concurrent.futures import ThreadPoolExecutor
+import uuid
 
 router = APIRouter()
 settings = get_settings()
 
-# Create executor according to chosen execution strategy 
+T = TypeVar("T")
+
+# Bodies of /batch jobs past this size are spooled to disk
+BATCH_SPOOL_BYTES = 8 * 1024 * 1024
+
+# Threads are shared by all models, process pools are created per model
+executor = None
 if settings.EXECUTION_STRATEGY == ExecutionStrategy.THREAD_POOL:
     executor = ThreadPoolExecutor(max_workers=settings.POOL_SIZE)
-elif settings.EXECUTION_STRATEGY == ExecutionStrategy.PROCESS_POOL:
-    executor = ProcessPoolExecutor(max_workers=settings.POOL_SIZE)
-else:
+elif settings.EXECUTION_STRATEGY != ExecutionStrategy.PROCESS_POOL:
     raise ValueError(f"Unsupported execution strategy: {settings.EXECUTION_STRATEGY}")
 
-try:
-    model = get_model(model_type=settings.MODEL_TYPE)
-except Exception as e:
+if DEFAULT_PRIORITY not in settings.PRIORITY_CLASSES:
+    raise ValueError(f"priority_classes must include the {DEFAULT_PRIORITY!r} class")
+unknown_priorities = set(settings.API_KEYS.values()) - set(settings.PRIORITY_CLASSES)
+if unknown_priorities:
+    raise ValueError(f"Unknown priority classes in api_keys: {', '.join(sorted(unknown_priorities))}")
+
+cache = None
+if settings.CACHE_ENABLED:
+    cache = ResponseCache(
+        max_entries=settings.CACHE_MAX_ENTRIES,
+        max_bytes=settings.CACHE_MAX_BYTES,
+        ttl=settings.CACHE_TTL,
+        path=settings.CACHE_PATH
+    )
+
+semantic_cache = None
+if settings.SEMANTIC_CACHE_ENABLED:
+    # Its embedding model is loaded at startup, see load_semantic_cache
+    semantic_cache = SemanticCache(
+        model_name=settings.SEMANTIC_CACHE_MODEL,
+        threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+        capacity=settings.SEMANTIC_CACHE_CAPACITY,
+        path=settings.SEMANTIC_CACHE_PATH,
+        save_every=settings.SEMANTIC_CACHE_SAVE_EVERY
+    )
+
+sessions = SessionCache(
+    max_bytes=settings.SESSION_CACHE_MAX_BYTES,
+    max_states=settings.SESSION_CACHE_MAX_STATES
+)
+
+
+def load_engine(spec: ModelSpec) -> ModelEngine:
+    """
+    Load a model and set up the engine serving it.
+    """
+    # Forked server workers share the model loaded by the master, see run_server
+    model = get_preloaded(spec)
+    if model is None:
+        model = get_model(model_type=spec.model_type, model_params=spec.model_params)
+
+    threads = intra_op_threads(settings)
+    if settings.EXECUTION_STRATEGY == ExecutionStrategy.PROCESS_POOL:
+        model_executor = create_process_pool(model, spec.model_type, settings.POOL_SIZE, spec.model_params, threads)
+    else:
+        model_executor = executor
+        # The pool's threads share the process' torch settings
+        limit_torch_threads(threads)
+
+    # Executor-bound models can't run more requests than the pool (and batches) hold,
+    # async models are only bounded if MAX_CONCURRENCY is set
+    max_concurrency = settings.MAX_CONCURRENCY
+    if max_concurrency is None and not model.supports_async:
+        max_concurrency = settings.POOL_SIZE
+        if model.supports_batching:
+            max_concurrency *= settings.BATCH_MAX_SIZE
+
+    admission = AdmissionController(
+        max_concurrency=max_concurrency,
+        max_queue=settings.MAX_QUEUE_SIZE,
+        queue_timeout=settings.QUEUE_TIMEOUT,
+        max_per_client=settings.MAX_IN_FLIGHT_PER_CONNECTION,
+        priority_classes=settings.PRIORITY_CLASSES,
+        fair=settings.FAIR_SCHEDULING,
+        # Requests cost their prompt tokens, or 1
+        quantum=settings.SCHEDULER_QUANTUM if settings.COST_AWARE_SCHEDULING else 1
+    )
+
+    return ModelEngine(
+        model,
+        model_executor,
+        model_type=spec.model_type,
+        batch_max_size=settings.BATCH_MAX_SIZE,
+        batch_window_ms=settings.BATCH_WINDOW_MS,
+        cache=cache,
+        semantic_cache=semantic_cache,
+        sessions=sessions,
+        admission=admission,
+        coalesce=settings.COALESCE_REQUESTS,
+        request_timeout=settings.REQUEST_TIMEOUT,
+        cost_aware=settings.COST_AWARE_SCHEDULING,
+        name=spec.name
+    )
+
+
+specs, default_model = build_model_specs(settings)
+memory_budget = settings.MODEL_MEMORY_BUDGET_MB * 1024 * 1024 if settings.MODEL_MEMORY_BUDGET_MB else None
+registry = ModelRegistry(specs, default_model, load_engine, memory_budget=memory_budget)
+
+# Background load of the default model, started with the server
+preload_task: Optional[asyncio.Task] = None
+# Reload triggered by SIGUSR1
+reload_task: Optional[asyncio.Task] = None
+
+
+async def warm_up(engine: ModelEngine):
+    # Each worker of a process pool initializes its own model
+    copies = settings.POOL_SIZE if settings.EXECUTION_STRATEGY == ExecutionStrategy.PROCESS_POOL else 1
+    await engine.warm_up(settings.WARMUP_MESSAGE, copies=copies)
+
+
+async def reload_models() -> List[str]:
+    """
+    Serve the models of the config file as it is now, without a restart (see
+    ModelRegistry.reload). Only the model settings are reloaded, see
+    RELOADABLE_SETTINGS, the others keep their values until a restart.
+
+    Returns:
+        list: The names of the models that changed
+    """
+    specs, default = build_model_specs(reload_settings())
+    return await registry.reload(specs, default, warm_up=warm_up if settings.WARMUP_MESSAGE else None)
+
+
+async def _reload_in_background():
+    try:
+        await reload_models()
+    except Exception:
+        # Logged by the registry, the current models keep serving
+        pass
+
+
+def _request_timeout(requested: Optional[float]) -> Optional[float]:
+    """
+    The deadline of a request that asked for `requested` seconds, which can't
+    be longer than REQUEST_TIMEOUT.
+    """
+    if requested is None or settings.REQUEST_TIMEOUT is None:
+        return requested or settings.REQUEST_TIMEOUT
+    return min(requested, settings.REQUEST_TIMEOUT)
+
+
+def _scheduling(connection: Union[WebSocket, Request], default_tenant: str) -> Tuple[str, str]:
+    """
+    Who the requests of a connection are accounted to for fair queuing, and
+    their priority class: the API key sent in the X-API-Key header (or the
+    api_key query parameter, for browsers' WebSockets) and the class
+    configured for it in API_KEYS, otherwise `default_tenant` and the default class.
+    """
+    api_key = connection.headers.get("x-api-key") or connection.query_params.get("api_key")
+    if not api_key:
+        return default_tenant, DEFAULT_PRIORITY
+    # Unknown keys are still served, grouped as one tenant
+    return api_key, settings.API_KEYS.get(api_key, DEFAULT_PRIORITY)
+
+
+async def _until_disconnected(work: Awaitable[T], disconnected: asyncio.Event) -> T:
+    """
+    Await `work`, cancelling it if the client disconnects meanwhile, so that
+    the model stops generating a response nobody will read.
+
+    Raises:
+        WebSocketDisconnect: If the client disconnected first
+    """
+    task = asyncio.ensure_future(work)
+    gone = asyncio.ensure_future(disconnected.wait())
+    try:
+        await asyncio.wait((task, gone), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        gone.cancel()
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    if task.cancelled():
+        raise WebSocketDisconnect(1001)
+    return task.result()
+
+
+def _query_flag(websocket: WebSocket, name: str, default: bool) -> bool:
+    """
+    Read a boolean option from the connection URL (e.g. /chat?stream=true).
+    """
+    value = websocket.query_params.get(name)
+    if value is None:
+        return default
+    return value.lower() in ("1", "true", "yes")
+
+
+async def _serve_multiplexed(
+    websocket: WebSocket,
+    connection_model: str,
+    session: Optional[Session],
+    connection_id: str,
+    stream: bool,
+    tenant: str,
+    priority: str,
+    traced: bool = False
+):
+    """
+    Serve a connection using the multiplexed protocol (?protocol=mux, see
+    gourami.api.protocol): requests run concurrently, each of its frames
+    carrying its id, and responses are sent as soon as they are ready, in any
+    order. Requests may pick their model, streaming and generation parameters,
+    and whether they are traced (all of them are with `traced`).
+
+    Returns when the client disconnects, cancelling the requests in progress.
+    """
     logger = getLogger("app")
-    logger.error(f"Error loading model: {e}")
-    loop = asyncio.get_event_loop()
-    loop.stop()
+    messages_logger = getLogger(MESSAGES_LOGGER)
+    in_flight: Dict[str, asyncio.Task] = {}
+    # Frames of concurrent responses must not interleave
+    send_lock = asyncio.Lock()
+
+    async def send(frame: protocol.Frame):
+        async with send_lock:
+            if isinstance(frame, bytes):
+                await websocket.send_bytes(frame)
+            else:
+                await websocket.send_text(frame)
+
+    async def send_failure(frame: protocol.Frame):
+        try:
+            await send(frame)
+        except Exception:
+            # The client left meanwhile
+            pass
+
+    async def handle(request: protocol.Envelope, binary: bool, trace: Optional[tracing.Trace]):
+        # This task's context only, the engine marks the hops of the model call
+        tracing.current_trace.set(trace)
+        try:
+            timeout = _request_timeout(request.timeout)
+            async with registry.use(request.model or connection_model) as engine:
+                engine = engine.with_overrides(request.params)
+                if request.stream if request.stream is not None else stream:
+                    chunks = engine.stream(
+                        request.message,
+                        session=session,
+                        client=connection_id,
+                        timeout=timeout,
+                        tenant=tenant,
+                        priority=priority
+                    )
+                    async with aclosing(chunks):
+                        async for chunk in chunks:
+                            await send(protocol.delta_frame(chunk, request.id, binary))
+                    await send(protocol.end_frame(request.id, binary))
+                else:
+                    response = await engine.predict(
+                        request.message,
+                        session=session,
+                        client=connection_id,
+                        timeout=timeout,
+                        tenant=tenant,
+                        priority=priority
+                    )
+                    await send(protocol.message_frame(response, request.id, binary))
+            if trace is not None:
+                trace.mark("send")
+                await send(protocol.trace_frame(trace.to_dict(), request.id, binary))
+            messages_logger.info(f"Response {request.id} sent to {websocket.client}")
+        except Overloaded as e:
+            logger.warning(f"Rejected message from {websocket.client}: {e.reason}")
+            await send_failure(protocol.busy_frame(e.reason, e.retry_after, request.id, binary))
+        except cancellation.Cancelled as e:
+            logger.warning(f"Request {request.id} from {websocket.client} stopped: {e.reason}")
+            await send_failure(protocol.error_frame(e.reason, request.id, binary))
+        except Exception as e:
+            logger.error(f"Error processing request {request.id}: {e}")
+            await send_failure(protocol.error_frame(str(e), request.id, binary))
+        finally:
+            in_flight.pop(request.id, None)
+
+    try:
+        while True:
+            event = await websocket.receive()
+            if event["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(event.get("code", 1000))
+            received = tracing.Trace()
+
+            frame = event.get("text")
+            if frame is None:
+                frame = event.get("bytes")
+            binary = isinstance(frame, bytes)
+
+            try:
+                request = protocol.parse_envelope(frame)
+                if request.id in in_flight:
+                    raise protocol.InvalidRequest(f"Request {request.id} is already in progress", request.id)
+                if request.model is not None and request.model not in registry:
+                    raise protocol.InvalidRequest(f"Unknown model: {request.model}", request.id)
+            except protocol.InvalidRequest as e:
+                await send(protocol.error_frame(str(e), e.request_id, binary))
+                continue
+
+            if len(in_flight) >= settings.MAX_IN_FLIGHT_PER_CONNECTION:
+                # Cache hits never reach admission, bound the tasks of the connection here
+                logger.warning(f"Rejected request {request.id} from {websocket.client}: too many requests in flight")
+                await send(protocol.busy_frame("Too many requests in flight for this connection", 1, request.id, binary))
+                continue
+
+            messages_logger.info(f"Received request {request.id} from {websocket.client}")
+            trace = received if (request.trace if request.trace is not None else traced) else None
+            in_flight[request.id] = asyncio.create_task(handle(request, binary, trace))
+    finally:
+        tasks = list(in_flight.values())
+        for task in tasks:
+            task.cancel()
+        # Requests that were sending their response when the client left fail too
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 
 @router.websocket("/chat")
 async def chat(websocket: WebSocket):
     """
     Handle WebSocket communication for real-time chatbot interaction.
+
+    By default, each text frame is a message and each response is sent back as
+    a text frame. With ?protocol=json, frames are JSON objects (see
+    gourami.api.protocol), which may pick the model per message. The model can
+    also be picked for the whole connection with ?model=<name>. With
+    ?protocol=mux, messages are processed concurrently, see _serve_multiplexed.
+
+    With ?trace=true, each response is followed by a trace frame telling when
+    the message went through each hop of the server (see gourami.core.tracing).
+    Plain text clients can't tell it from a response, their traces are logged.
+
+    The connection is read while a response is being generated, so that the
+    generation stops as soon as the client disconnects. Once
+    MAX_IN_FLIGHT_PER_CONNECTION messages are waiting, reading pauses until
+    the next one is taken, and the client's frames wait in the socket.
     """
     logger = getLogger("app")
+    messages_logger = getLogger(MESSAGES_LOGGER)
 
     await websocket.accept()
     logger.info(f"New WebSocket connection: {websocket.client}")
 
+    stream = _query_flag(websocket, "stream", settings.STREAM_RESPONSES)
+    json_protocol = websocket.query_params.get("protocol") == "json"
+    multiplexed = websocket.query_params.get("protocol") == "mux"
+    traced = _query_flag(websocket, "trace", False)
+
+    connection_id = uuid.uuid4().hex
+    tenant, priority = _scheduling(websocket, connection_id)
+    connection_model = websocket.query_params.get("model") or registry.default
+    if connection_model not in registry:
+        await websocket.close(code=1008, reason=f"Unknown model: {connection_model}")
+        return
+
+    # Keep the conversation history for the lifetime of the connection
+    session = None
+    if _query_flag(websocket, "session", settings.SESSIONS_ENABLED):
+        session = sessions.open()
+
+    # Frames received while a response is being generated, with their trace if
+    # traced. Bounded like the requests of a multiplexed connection
+    inbox: asyncio.Queue = asyncio.Queue(maxsize=settings.MAX_IN_FLIGHT_PER_CONNECTION)
+    disconnected = asyncio.Event()
+
+    async def read_frames():
+        try:
+            while True:
+                event = await websocket.receive()
+                if event["type"] == "websocket.disconnect":
+                    break
+                # Waits for room, pushing back on a client that doesn't wait for its responses
+                await inbox.put((event, tracing.Trace() if traced else None))
+        finally:
+            disconnected.set()
+
+    async def respond(message: str, model_name: str, trace: Optional[tracing.Trace]):
+        # This task's context only, the engine marks the hops of the model call
+        tracing.current_trace.set(trace)
+        async with registry.use(model_name) as engine:
+            if stream:
+                # Forward each chunk as soon as the model produces it
+                try:
+                    # Closed right away if the client leaves, so that shared generations know
+                    chunks = engine.stream(message, session=session, client=connection_id, tenant=tenant, priority=priority)
+                    async with aclosing(chunks):
+                        async for chunk in chunks:
+                            await websocket.send_text(protocol.delta_frame(chunk))
+                except (WebSocketDisconnect, Overloaded, cancellation.Cancelled):
+                    raise
+                except Exception as e:
+                    await websocket.send_text(protocol.error_frame(str(e)))
+                    raise
+                await websocket.send_text(protocol.end_frame())
+            else:
+                # Send the message to the model and get a response
+                model_response = await engine.predict(
+                    message,
+                    session=session,
+                    client=connection_id,
+                    tenant=tenant,
+                    priority=priority
+                )
+
+                # Send the model response back to the user
+                if json_protocol:
+                    await websocket.send_text(protocol.message_frame(model_response))
+                else:
+                    await websocket.send_text(model_response)
+        if trace is not None:
+            trace.mark("send")
+
+    reader = None
     try:
+        if multiplexed:
+            await _serve_multiplexed(websocket, connection_model, session, connection_id, stream, tenant, priority, traced)
+            return
+
+        reader = asyncio.create_task(read_frames())
         while True:
             # Receive a message from the user
-            message = await websocket.receive_text()
+            event, trace = await _until_disconnected(inbox.get(), disconnected)
+            message = event["text"]
 
-            logger.info(f"Received message from {websocket.client}")
+            messages_logger.info(f"Received message from {websocket.client}")
 
-            # Send the message to the model and get a response
+            model_name = connection_model
+            if json_protocol:
+                try:
+                    message, requested_model = protocol.parse_request(message)
+                except ValueError as e:
+                    await websocket.send_text(protocol.error_frame(str(e)))
+                    continue
+                if requested_model is not None:
+                    if requested_model not in registry:
+                        await websocket.send_text(protocol.error_frame(f"Unknown model: {requested_model}"))
+                        continue
+                    model_name = requested_model
 
-            model_response = await asyncio.get_event_loop().run_in_executor(
-                executor, model.predict, message
-            )
+            try:
+                await _until_disconnected(respond(message, model_name, trace), disconnected)
+            except cancellation.Cancelled as e:
+                logger.warning(f"Message from {websocket.client} stopped: {e.reason}")
+                if stream or json_protocol:
+                    await websocket.send_text(protocol.error_frame(e.reason))
+                    continue
+                await websocket.close(code=1011, reason=e.reason)
+                return
+            except Overloaded as e:
+                logger.warning(f"Rejected message from {websocket.client}: {e.reason}")
+                if stream or json_protocol:
+                    await websocket.send_text(protocol.busy_frame(e.reason, e.retry_after))
+                    continue
+                # Plain text clients can't tell a busy notice from a response
+                await websocket.close(code=1013, reason=f"{e.reason}, retry after {e.retry_after}s")
+                return
 
-            # Send the model response back to the user
-            await websocket.send_text(model_response)
-            logger.info(f"Response sent to {websocket.client}") 
+            messages_logger.info(f"Response sent to {websocket.client}") 
+            if trace is not None:
+                if stream or json_protocol:
+                    await websocket.send_text(protocol.trace_frame(trace.to_dict()))
+                else:
+                    logger.info(f"Trace of a message from {websocket.client}: {json.dumps(trace.to_dict())}")
 
     except WebSocketDisconnect:
         logger.info(f"WebSocket disconnected: {websocket.client}")
     except Exception as e:
         logger.error(f"Error processing message: {e}")
         await websocket.close(code=1000)  # Close connection gracefully
+    finally:
+        if reader is not None:
+            reader.cancel()
+        if session is not None:
+            sessions.close(session.id)
+
+@router.post("/batch")
+async def batch(
+    request: Request,
+    model: Optional[str] = None,
+    batch_size: int = Query(default=8, ge=1),
+    window: int = Query(default=1024, ge=1),
+    max_retries: int = Query(default=10, ge=0)
+):
+    """
+    Offline bulk inference: the body holds JSON lines `{"id": ..., "message": "..."}`
+    (see gourami.core.bulk.parse_items), and the results are streamed back as
+    NDJSON as they complete, in no particular order. Call it with one model
+    per job.
+
+    Messages are grouped into batches of similar length, keeping the pool
+    busy. Batches rejected by admission control wait and retry, up to
+    `max_retries` times, so a job yields to interactive traffic; the messages
+    of a batch that still can't be admitted get an error result.
+    """
+    model_name = model or registry.default
+    if model_name not in registry:
+        raise HTTPException(status_code=404, detail=f"Unknown model: {model_name}")
+
+    # Spooled to disk past a few MB rather than held in memory. Read in full
+    # before answering: most HTTP clients only read the response once they
+    # have sent the whole request
+    body = tempfile.SpooledTemporaryFile(max_size=BATCH_SPOOL_BYTES)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        async for chunk in request.stream():
+            decoder.decode(chunk)
+            body.write(chunk)
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        body.close()
+        raise HTTPException(status_code=400, detail="The body must be UTF-8 JSON lines")
+    body.seek(0)
+
+    job_id = uuid.uuid4().hex
+    tenant, priority = _scheduling(request, job_id)
+    # The batches run under a single client, bounded by the per-client admission limit
+    concurrency = min(settings.POOL_SIZE, settings.MAX_IN_FLIGHT_PER_CONNECTION)
+    getLogger("app").info(f"Batch job {job_id} started on model {model_name}")
+
+    async def results():
+        try:
+            async with registry.use(model_name) as engine:
+                async def predict_batch(messages):
+                    for attempt in range(max_retries + 1):
+                        try:
+                            return await engine.predict_batch(messages, client=job_id, tenant=tenant, priority=priority)
+                        except Overloaded as e:
+                            if attempt == max_retries:
+                                raise
+                            await asyncio.sleep(e.retry_after)
+
+                # Read and parsed off the event loop as the job goes, see run_bulk
+                items = parse_items(line.decode("utf-8") for line in body)
+                async with aclosing(run_bulk(items, predict_batch, batch_size, concurrency, window)) as bulk:
+                    async for result in bulk:
+                        yield json.dumps(result) + "\n"
+        finally:
+            body.close()
+        getLogger("app").info(f"Batch job {job_id} finished")
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@router.on_event("startup")
+async def preload_default_model():
+    """
+    Load the default model in the background, so that the port is bound right away.
+    """
+    global preload_task
+    if settings.PRELOAD_MODEL:
+        preload_task = asyncio.create_task(
+            registry.preload(warm_up=warm_up if settings.WARMUP_MESSAGE else None)
+        )
+
+def _load_semantic_cache():
+    try:
+        semantic_cache.load()
+    except Exception as e:
+        getLogger("app").error(f"Error loading the semantic cache, messages won't be matched by meaning: {e}")
+
+@router.on_event("startup")
+async def load_semantic_cache():
+    """
+    Load the semantic cache in the background, like the default model, so that
+    the port is bound right away. Messages miss it meanwhile.
+    """
+    if semantic_cache is not None:
+        asyncio.get_running_loop().run_in_executor(None, _load_semantic_cache)
+
+@router.on_event("startup")
+async def handle_reload_signal():
+    """
+    Reload the models on SIGUSR1, which the master forwards to every worker.
+    """
+    def start_reload():
+        global reload_task
+        getLogger("app").info("Received SIGUSR1, reloading the models")
+        reload_task = asyncio.create_task(_reload_in_background())
+
+    if not hasattr(signal, "SIGUSR1"):
+        return
+    # Only the main thread can handle signals, not e.g. an app embedded in a test client
+    if threading.current_thread() is not threading.main_thread():
+        getLogger("app").warning("Not serving from the main thread, SIGUSR1 won't reload the models")
+        return
+    asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, start_reload)
+
+@router.get("/livez")
+async def liveness():
+    """
+    The server is up and its event loop responds.
+    """
+    return {"status": "alive"}
+
+@router.get("/readyz")
+async def readiness():
+    """
+    The server can take traffic: the default model is loaded (and warmed up) when
+    it's preloaded. Answers 503 while loading, after a failure or when the
+    preload was cancelled, e.g. by a shutdown.
+    """
+    model = registry.stats()["models"][registry.default]
+    if preload_task is None:
+        return {"status": "ready", "model": model}
+    if not preload_task.done():
+        return JSONResponse(status_code=503, content={"status": "starting", "model": model})
+    if preload_task.cancelled():
+        return JSONResponse(status_code=503, content={"status": "cancelled", "model": model})
+    if preload_task.exception() is not None or not preload_task.result():
+        return JSONResponse(status_code=503, content={"status": "failed", "model": model})
+    return {"status": "ready", "model": model}
 
 @router.get("/health")
 async def health_check():
-    return {"status": "healthy", "model_loaded": model is not None}
\ No newline at end of file
+    return {"status": "healthy", "model_loaded": registry.get_loaded() is not None}
+
+@router.get("/models")
+async def models():
+    """
+    The models that can be requested, and whether they are loaded.
+    """
+    return registry.stats()
+
+@router.get("/stats")
+async def stats():
+    """
+    Runtime counters of the serving components.
+    """
+    return {
+        "cache": cache.stats() if cache is not None else None,
+        "semantic_cache": semantic_cache.stats() if semantic_cache is not None else None,
+        "sessions": sessions.stats(),
+        "admission": {
+            name: engine.admission.stats()
+            for name, engine in registry.loaded().items()
+            if engine.admission is not None
+        },
+        "coalescing": {
+            name: engine.single_flight.stats()
+            for name, engine in registry.loaded().items()
+            if engine.single_flight is not None
+        }
+    }
+
+def _check_admin(request: Request):
+    """
+    Admin endpoints are only available when ADMIN_TOKEN is set, and to requests bearing it.
+
+    Raises:
+        HTTPException: 404 if ADMIN_TOKEN isn't set, 401 if the request doesn't bear it
+    """
+    if settings.ADMIN_TOKEN is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    expected = f"Bearer {settings.ADMIN_TOKEN}"
+    if not hmac.compare_digest(request.headers.get("authorization", ""), expected):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+@router.post("/admin/reload")
+async def admin_reload(request: Request):
+    """
+    Reload the models from the config file, see reload_models. Only available
+    when ADMIN_TOKEN is set, and to requests bearing it.
+    """
+    _check_admin(request)
+
+    if settings.WORKERS > 1:
+        # Each worker serves its own models, the master has them all reload
+        os.kill(os.getppid(), signal.SIGUSR1)
+        return JSONResponse(status_code=202, content={"status": "reloading", "workers": settings.WORKERS})
+
+    try:
+        changed = await reload_models()
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"status": "failed", "error": str(e)})
+    return {"status": "reloaded", "changed": changed}
+
+# Profiles slow the server down and cProfile can't run twice at once, one at a time
+profiling_lock = asyncio.Lock()
+
+
+def _download(content: bytes, extension: str) -> Response:
+    filename = f"gourami-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.{extension}"
+    return Response(
+        content=content,
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.post("/debug/profile")
+async def debug_profile(
+    request: Request,
+    seconds: float = Query(10, gt=0, le=300),
+    mode: str = Query("sample", pattern="^(sample|cprofile)$"),
+    interval: float = Query(0.01, ge=0.001, le=1)
+):
+    """
+    Profile the CPU time of the server for `seconds` and download the result.
+
+    - sample (default): the stacks of every thread are sampled every
+      `interval` seconds, as a collapsed-stack file for flamegraph.pl or speedscope
+    - cprofile: the event loop thread is profiled deterministically, as a pstats
+      file for pstats.Stats or snakeviz. Slower, and blind to the executor threads
+
+    With several workers, only the worker serving this request is profiled;
+    process pool workers never are. Only available to admins, see _check_admin.
+    """
+    _check_admin(request)
+    if profiling_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+
+    async with profiling_lock:
+        if mode == "cprofile":
+            return _download(await profiling.profile_event_loop(seconds), "pstats")
+        # Not on the models' executor, whose threads may all be busy
+        samples = await asyncio.get_running_loop().run_in_executor(None, profiling.sample_stacks, seconds, interval)
+        return _download(profiling.collapse(samples), "collapsed")
+
+@router.post("/debug/allocations")
+async def debug_allocations(
+    request: Request,
+    seconds: float = Query(10, gt=0, le=300),
+    frames: int = Query(25, ge=1, le=100),
+    output: str = Query("collapsed", alias="format", pattern="^(collapsed|snapshot)$")
+):
+    """
+    Trace the memory allocations of the server for `seconds`, keeping `frames`
+    frames of traceback each, and download the result:
+
+    - collapsed (default): the bytes allocated meanwhile and still held, per
+      traceback, as a collapsed-stack file for flamegraph.pl or speedscope
+    - snapshot: the tracemalloc snapshot at the end, for tracemalloc.Snapshot.load
+
+    Allocations are markedly slower while tracing. With several workers, only
+    the worker serving this request is traced. Only available to admins, see _check_admin.
+    """
+    _check_admin(request)
+    if profiling_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+
+    async with profiling_lock:
+        baseline, snapshot = await profiling.trace_allocations(seconds, frames)
+    loop = asyncio.get_running_loop()
+    if output == "snapshot":
+        return _download(await loop.run_in_executor(None, profiling.dump_snapshot, snapshot), "tracemalloc")
+    return _download(await loop.run_in_executor(None, profiling.collapse_allocations, baseline, snapshot), "collapsed")
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    Latency, throughput and queue metrics, in the Prometheus text format.
+    """
+    admission = {
+        name: engine.admission.stats()
+        for name, engine in registry.loaded().items()
+        if engine.admission is not None
+    }
+    gauges = [
+        metrics.render_gauge(
+            "gourami_queue_depth",
+            "Messages waiting for admission.",
+            ["model"],
+            [((name,), stats["queue_depth"]) for name, stats in admission.items()]
+        ),
+        metrics.render_gauge(
+            "gourami_priority_queue_depth",
+            "Messages waiting for admission, by priority class.",
+            ["model", "priority"],
+            [
+                ((name, priority), depth["requests"])
+                for name, stats in admission.items()
+                for priority, depth in stats["queues"].items()
+            ]
+        ),
+        metrics.render_gauge(
+            "gourami_running_requests",
+            "Messages being processed by the model.",
+            ["model"],
+            [((name,), stats["running"]) for name, stats in admission.items()]
+        ),
+    ]
+    return PlainTextResponse(metrics.render(gauges), media_type="text/plain; version=0.0.4")
+
+@router.on_event("shutdown")
+def stop_preload():
+    for task in (preload_task, reload_task):
+        if task is not None and not task.done():
+            task.cancel()
+
+@router.on_event("shutdown")
+def save_semantic_cache():
+    if semantic_cache is not None:
+        semantic_cache.save()
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+import click
+from gourami.core.bulk import load_checkpoint, parse_items, run_bulk
+
+
+async def run_job(
+    model,
+    input_file: str,
+    output_file: str,
+    batch_size: int,
+    concurrency: int,
+    window: int,
+    resume: bool
+) -> dict:
+    """
+    Run every message of `input_file` through `model`, appending the results to
+    `output_file` as JSON lines. The results file is the checkpoint: with
+    `resume`, messages it already answers are skipped.
+    """
+    done = load_checkpoint(output_file) if resume else set()
+    if done:
+        click.echo(f"Resuming, {len(done)} messages already answered", err=True)
+
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    loop = asyncio.get_running_loop()
+
+    async def predict_batch(messages: List[str]) -> List[str]:
+        if model.supports_async:
+            return list(await asyncio.gather(*(model.apredict(message) for message in messages)))
+        return await loop.run_in_executor(executor, model.predict_batch, messages)
+
+    answered = failed = 0
+    started = last_report = time.perf_counter()
+    try:
+        with open(input_file, encoding="utf-8") as source, open(output_file, "a" if resume else "w", encoding="utf-8") as sink:
+            results = run_bulk(parse_items(source), predict_batch, batch_size, concurrency, window, skip=done)
+            async for result in results:
+                sink.write(json.dumps(result) + "\n")
+                if "error" in result:
+                    failed += 1
+                else:
+                    answered += 1
+
+                now = time.perf_counter()
+                if now - last_report >= 10:
+                    # Completed results survive an interruption
+                    sink.flush()
+                    last_report = now
+                    click.echo(f"{answered} answered, {failed} failed, {answered / (now - started):.1f} messages/s", err=True)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "answered": answered,
+        "failed": failed,
+        "skipped": len(done),
+        "duration": elapsed,
+        "throughput": answered / elapsed if elapsed else 0.0,
+    }
+
+
+@click.command()
+@click.argument('input_file', type=click.Path(exists=True, dir_okay=False))
+@click.argument('output_file', type=click.Path(dir_okay=False))
+@click.option('-t', '--model-type', help="Plugin to run, defaults to the configured model_type.")
+@click.option('--model-params', help="Parameters of the plugin as JSON, default to the configured model_params.")
+@click.option('-f', '--config-file', type=click.Path(exists=True), help="Configuration file to read model_type and model_params from.")
+@click.option('-b', '--batch-size', type=click.IntRange(min=1), default=8, show_default=True, help="Messages per predict_batch call.")
+@click.option('-c', '--concurrency', type=click.IntRange(min=1), help="Batches running at once, defaults to pool_size.")
+@click.option('--window', type=click.IntRange(min=1), default=1024, show_default=True, help="Messages sorted by length together.")
+@click.option('--resume/--restart', default=True, show_default=True, help="Skip the messages already answered in OUTPUT_FILE, or overwrite it.")
+def batch(input_file, output_file, model_type, model_params, config_file, batch_size, concurrency, window, resume):
+    """
+    Run the messages of INPUT_FILE through a model, without a server, and write
+    the results to OUTPUT_FILE.
+
+    INPUT_FILE holds JSON lines with a "message" field and an optional "id",
+    unique ("line-<n>" by default), or one message per line. Each line of
+    OUTPUT_FILE is {"id": ..., "response": "..."} or {"id": ..., "error": "..."},
+    in completion order. An interrupted job resumes where it stopped, failed
+    messages are retried.
+    """
+    from gourami.core.config import configure_settings
+    from gourami.core.cpu import available_cores, limit_torch_threads
+    from gourami.plugins import get_model
+
+    settings = configure_settings(config_path=config_file)
+    concurrency = concurrency or settings.POOL_SIZE
+    params = json.loads(model_params) if model_params else settings.model_params
+
+    model = get_model(model_type=model_type or settings.MODEL_TYPE, model_params=params)
+    # Each running batch gets its share of the cores
+    limit_torch_threads(settings.TORCH_THREADS or max(1, available_cores() // concurrency))
+
+    report = asyncio.run(run_job(model, input_file, output_file, batch_size, concurrency, window, resume))
+
+    click.echo(f"Answered:    {report['answered']} ({report['failed']} failed, {report['skipped']} already answered)")
+    click.echo(f"Duration:    {report['duration']:.2f} s")
+    click.echo(f"Throughput:  {report['throughput']:.2f} messages/s")
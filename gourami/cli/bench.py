@@ -0,0 +1,223 @@
+import asyncio
+import json
+import math
+import random
+import time
+from itertools import count
+from typing import List, Optional
+from urllib.parse import urlencode
+import click
+
+# Used when no prompt file is given
+DEFAULT_PROMPTS = [
+    "Hello, Gourami!",
+    "What is the capital of France?",
+    "Summarize the plot of Moby Dick in two sentences.",
+    "Write a haiku about the sea.",
+    "How do I reverse a list in Python?",
+    "Explain the difference between TCP and UDP.",
+    "Give me three ideas for a birthday party.",
+    "What are the health benefits of green tea?",
+    "Translate 'good morning' to Italian.",
+    "Why is the sky blue?",
+]
+
+
+class _Result:
+    def __init__(self, outcome: str, latency: float, ttft: Optional[float] = None, chars: int = 0):
+        # ok, busy or error
+        self.outcome = outcome
+        self.latency = latency
+        self.ttft = ttft
+        self.chars = chars
+
+
+def load_prompts(path: Optional[str]) -> List[str]:
+    """
+    Read a prompt corpus: one prompt per line, or JSON lines with a "message" field.
+    """
+    if path is None:
+        return list(DEFAULT_PROMPTS)
+
+    prompts = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                line = json.loads(line)["message"]
+            prompts.append(line)
+
+    if not prompts:
+        raise click.BadParameter(f"No prompts found in {path}")
+    return prompts
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of a list of values, None if it's empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = math.ceil(q / 100 * len(ordered))
+    return ordered[max(rank, 1) - 1]
+
+
+async def send_message(websocket, message: str, started: float) -> _Result:
+    """
+    Send a message on a JSON protocol connection and wait for its full response.
+
+    `started` is when the message was due, so that time spent waiting for a free
+    connection counts towards its latency.
+    """
+    await websocket.send(json.dumps({"message": message}))
+
+    ttft = None
+    chars = 0
+    while True:
+        frame = json.loads(await websocket.recv())
+        now = time.perf_counter()
+        if frame["type"] == "delta":
+            if ttft is None:
+                ttft = now - started
+            chars += len(frame["content"])
+        elif frame["type"] == "message":
+            return _Result("ok", now - started, now - started, len(frame["content"]))
+        elif frame["type"] == "end":
+            return _Result("ok", now - started, ttft, chars)
+        elif frame["type"] == "busy":
+            return _Result("busy", now - started)
+        elif frame["type"] == "error":
+            return _Result("error", now - started)
+
+
+async def run_benchmark(
+    url: str,
+    prompts: List[str],
+    clients: int,
+    requests: int,
+    rate: Optional[float],
+    poisson: bool,
+    warmup: int,
+    seed: int
+) -> dict:
+    import websockets
+
+    rng = random.Random(seed)
+    order = list(prompts)
+    rng.shuffle(order)
+    messages = (order[i % len(order)] for i in count())
+
+    connections = await asyncio.gather(*(websockets.connect(url, max_size=None) for _ in range(clients)))
+    idle: asyncio.Queue = asyncio.Queue()
+    for websocket in connections:
+        idle.put_nowait(websocket)
+
+    results: List[_Result] = []
+
+    async def issue(message: str, started: float, record: bool):
+        websocket = await idle.get()
+        try:
+            result = await send_message(websocket, message, started)
+        finally:
+            idle.put_nowait(websocket)
+        if record:
+            results.append(result)
+
+    try:
+        # Warm-up requests are sent one by one and not measured
+        for _ in range(warmup):
+            await issue(next(messages), time.perf_counter(), record=False)
+
+        begin = time.perf_counter()
+        if rate is None:
+            # Closed loop: every client sends its next message as soon as it gets a response
+            remaining = iter(range(requests))
+
+            async def client():
+                for _ in remaining:
+                    await issue(next(messages), time.perf_counter(), record=True)
+
+            await asyncio.gather(*(client() for _ in range(clients)))
+        else:
+            # Open loop: messages are due at a fixed rate, whether or not the server keeps up
+            tasks = []
+            due = begin
+            for _ in range(requests):
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.ensure_future(issue(next(messages), due, record=True)))
+                due += rng.expovariate(rate) if poisson else 1 / rate
+            await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - begin
+    finally:
+        await asyncio.gather(*(websocket.close() for websocket in connections))
+
+    ok = [result for result in results if result.outcome == "ok"]
+    latencies = [result.latency for result in ok]
+    ttfts = [result.ttft for result in ok if result.ttft is not None]
+
+    return {
+        "requests": len(results),
+        "ok": len(ok),
+        "busy": sum(result.outcome == "busy" for result in results),
+        "errors": sum(result.outcome == "error" for result in results),
+        "duration": elapsed,
+        "throughput": len(ok) / elapsed if elapsed else 0.0,
+        "output_chars_per_second": sum(result.chars for result in ok) / elapsed if elapsed else 0.0,
+        "latency": {f"p{q}": percentile(latencies, q) for q in (50, 95, 99)},
+        "ttft": {f"p{q}": percentile(ttfts, q) for q in (50, 95, 99)},
+    }
+
+
+def _format_seconds(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 1000:.1f} ms"
+
+
+@click.command()
+@click.option('-u', '--url', default="ws://localhost:5000/chat", show_default=True, help="URL of the /chat endpoint.")
+@click.option('-c', '--clients', type=click.IntRange(min=1), default=8, show_default=True, help="Concurrent WebSocket connections.")
+@click.option('-n', '--requests', type=click.IntRange(min=1), default=200, show_default=True, help="Messages to send.")
+@click.option('-r', '--rate', type=click.FloatRange(min=0, min_open=True), help="Target messages per second (open loop). By default each client sends its next message once answered (closed loop).")
+@click.option('--poisson', is_flag=True, help="With --rate, space messages randomly (Poisson arrivals) instead of evenly.")
+@click.option('--prompts', 'prompts_file', type=click.Path(exists=True), help="Prompt corpus, one prompt per line or JSON lines with a \"message\" field.")
+@click.option('--stream/--no-stream', default=True, show_default=True, help="Request streamed responses, needed to measure the time to first token.")
+@click.option('-m', '--model', help="Model to send the messages to.")
+@click.option('--warmup', type=click.IntRange(min=0), default=0, show_default=True, help="Messages sent before measuring.")
+@click.option('--seed', type=int, default=0, show_default=True, help="Seed of the prompt order and Poisson arrivals.")
+@click.option('--json', 'as_json', is_flag=True, help="Print the report as JSON.")
+def bench(url, clients, requests, rate, poisson, prompts_file, stream, model, warmup, seed, as_json):
+    """
+    Measure the throughput and latency a Gourami server sustains.
+
+    Start the server with the synthetic plugin (model_type: synthetic) to
+    benchmark the server itself, without a GPU or network.
+    """
+    query = {"protocol": "json", "stream": "true" if stream else "false"}
+    if model:
+        query["model"] = model
+    separator = "&" if "?" in url else "?"
+    url = f"{url}{separator}{urlencode(query)}"
+
+    report = asyncio.run(run_benchmark(
+        url,
+        load_prompts(prompts_file),
+        clients,
+        requests,
+        rate,
+        poisson,
+        warmup,
+        seed
+    ))
+
+    if as_json:
+        click.echo(json.dumps(report, indent=2))
+        return
+
+    click.echo(f"Requests:    {report['requests']} ({report['ok']} ok, {report['busy']} busy, {report['errors']} errors)")
+    click.echo(f"Duration:    {report['duration']:.2f} s")
+    click.echo(f"Throughput:  {report['throughput']:.2f} req/s, {report['output_chars_per_second']:.0f} chars/s")
+    for name in ("latency", "ttft"):
+        values = ", ".join(f"{q} {_format_seconds(v)}" for q, v in report[name].items())
+        click.echo(f"{'Latency' if name == 'latency' else 'TTFT':<12} {values}")
@@ -1,6 +1,8 @@
 import click
 from gourami.utils.logging import setup_logging
 from gourami.cli.server import run_server
+from gourami.cli.batch import batch
+from gourami.cli.bench import bench
 from gourami.core.config import configure_settings
 
 @click.group()
@@ -11,8 +13,9 @@ def cli():
 @click.command()
 @click.option('-p','--port', type=int)
 @click.option('-h','--host', type=str)
+@click.option('-w','--workers', type=click.IntRange(min=1), help="Server processes sharing the port and the model weights.")
 @click.option('-f','--config-file', type=click.Path(exists=True))
-def start(port, host, config_file):
+def start(port, host, workers, config_file):
     """
     Start the Gourami server.
     """
@@ -27,6 +30,8 @@ def start(port, host, config_file):
     run_server()
 
 cli.add_command(start)
+cli.add_command(bench)
+cli.add_command(batch)
 
 if __name__ == '__main__':
     cli()
\ No newline at end of file
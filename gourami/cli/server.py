@@ -1,6 +1,188 @@
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict
 import uvicorn
-from gourami.core.config import get_settings
+from uvicorn.logging import DefaultFormatter
+from gourami.core.config import get_settings, reload_settings
+from gourami.core.cpu import intra_op_threads, limit_torch_threads
+
+# A worker that exits sooner than this after starting is restarted with a delay,
+# so that a worker failing at startup doesn't make the master spin
+_MIN_WORKER_LIFETIME = 1.0
+
+
+class _Master:
+    """
+    Pre-fork master: binds the listening socket, loads the model, then forks
+    server workers that inherit both.
+
+    Workers that exit unexpectedly are replaced. SIGHUP replaces every worker
+    gracefully, SIGINT/SIGTERM stop them, letting in-flight requests complete
+    for up to WORKER_SHUTDOWN_TIMEOUT seconds. SIGUSR1 has the workers reload
+    their models from the config file without restarting.
+    """
+    def __init__(self, settings):
+        self.settings = settings
+        self.workers: Dict[int, float] = {}  # pid -> start time
+        self.stopping = False
+        self.restarting = False
+        self.reloading = False
+
+        # The master doesn't serve requests, it can log synchronously
+        self.logger = logging.getLogger("app")
+        self.logger.setLevel(logging.INFO)
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(DefaultFormatter(fmt="%(levelprefix)s %(message)s", use_colors=True))
+        self.logger.handlers = [handler]
+
+    def run(self):
+        from gourami.core.prefork import preload_default_model
+
+        sock = socket.socket(socket.AF_INET6 if ":" in self.settings.HOST else socket.AF_INET)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.settings.HOST, self.settings.PORT))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        self.logger.info(f"Master {os.getpid()} listening on {self.settings.HOST}:{self.settings.PORT}")
+
+        if self.settings.PRELOAD_MODEL:
+            preload_default_model(self.settings)
+
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_restart)
+        signal.signal(signal.SIGUSR1, self._on_reload)
+
+        for _ in range(self.settings.WORKERS):
+            self._spawn(sock)
+
+        stop_deadline = None
+        while self.workers:
+            if self.stopping and stop_deadline is None:
+                self.logger.info("Stopping workers")
+                self._signal_all(signal.SIGTERM)
+                stop_deadline = time.monotonic() + self.settings.WORKER_SHUTDOWN_TIMEOUT + 5
+            elif stop_deadline is not None and time.monotonic() > stop_deadline:
+                self.logger.warning("Workers didn't stop in time, killing them")
+                self._signal_all(signal.SIGKILL)
+                stop_deadline = float("inf")
+
+            if self.restarting and not self.stopping:
+                self.restarting = False
+                self._restart_all(sock)
+
+            if self.reloading and not self.stopping:
+                self.reloading = False
+                self._reload_all()
+
+            self._reap(sock)
+            time.sleep(0.1)
+
+        sock.close()
+
+    def _spawn(self, sock: socket.socket):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = time.monotonic()
+            self.logger.info(f"Started worker {pid}")
+            return
+
+        # Worker process: never return into the master loop
+        exit_code = 1
+        try:
+            self._serve(sock)
+            exit_code = 0
+        except BaseException:
+            self.logger.exception("Worker failed")
+        finally:
+            os._exit(exit_code)
+
+    def _serve(self, sock: socket.socket):
+        for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+            signal.signal(signum, signal.SIG_DFL)
+        # Until the server installs its reload handler
+        signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+
+        # Split the cores between the workers rather than have each of them use all of them
+        limit_torch_threads(intra_op_threads(self.settings))
+
+        config = uvicorn.Config(
+            "gourami.api.main:app",
+            timeout_graceful_shutdown=self.settings.WORKER_SHUTDOWN_TIMEOUT
+        )
+        uvicorn.Server(config).run(sockets=[sock])
+
+    def _reap(self, sock: socket.socket):
+        while self.workers:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+
+            started = self.workers.pop(pid, None)
+            if started is None:
+                continue
+            if self.stopping:
+                self.logger.info(f"Worker {pid} stopped")
+                continue
+
+            self.logger.warning(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting it")
+            if time.monotonic() - started < _MIN_WORKER_LIFETIME:
+                time.sleep(_MIN_WORKER_LIFETIME)
+            self._spawn(sock)
+
+    def _restart_all(self, sock: socket.socket):
+        # Start the replacements first, so that the socket is always served
+        old = list(self.workers)
+        self.logger.info(f"Replacing workers {old}")
+        for _ in old:
+            self._spawn(sock)
+        for pid in old:
+            # Graceful stop: expected exits are not restarted
+            self.workers.pop(pid, None)
+            self._kill(pid, signal.SIGTERM)
+
+    def _reload_all(self):
+        # Workers forked from now on, to replace others, start with the new configuration
+        try:
+            reload_settings()
+        except Exception:
+            self.logger.exception("Can't read the new configuration, workers keep the current one")
+            return
+        self.logger.info("Reloading the models of every worker")
+        self._signal_all(signal.SIGUSR1)
+
+    def _signal_all(self, signum: int):
+        for pid in list(self.workers):
+            self._kill(pid, signum)
+
+    def _kill(self, pid: int, signum: int):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _on_stop(self, signum, frame):
+        self.stopping = True
+
+    def _on_restart(self, signum, frame):
+        self.restarting = True
+
+    def _on_reload(self, signum, frame):
+        self.reloading = True
+
 
 def run_server():
     settings = get_settings()
-    uvicorn.run("gourami.api.main:app", host=settings.HOST, port=settings.PORT, reload=False)
\ No newline at end of file
+
+    if settings.WORKERS == 1:
+        uvicorn.run("gourami.api.main:app", host=settings.HOST, port=settings.PORT, reload=False)
+        return
+
+    if not hasattr(os, "fork"):
+        raise RuntimeError("Serving with several workers requires os.fork, which this platform lacks")
+
+    _Master(settings).run()
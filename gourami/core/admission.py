@@ -0,0 +1,282 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+# The priority class of requests that don't ask for one
+DEFAULT_PRIORITY = "default"
+
+
+class Overloaded(Exception):
+    """
+    Raised when a request is turned away because the server is saturated.
+    """
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    """A request waiting for a slot."""
+    __slots__ = ("future", "tenant", "cost", "rank")
+
+    def __init__(self, future: asyncio.Future, tenant: Optional[str], cost: float, rank: int):
+        self.future = future
+        self.tenant = tenant
+        self.cost = cost
+        self.rank = rank
+
+
+class _ClassQueue:
+    """
+    The waiting requests of a priority class, one FIFO queue per tenant, served
+    by deficit round-robin: tenants take turns, each turn a tenant is credited
+    `quantum` and its requests go through as long as they cost no more than its
+    credit. Idle tenants lose their credit.
+    """
+    def __init__(self, quantum: float):
+        self.quantum = quantum
+        # Tenants with waiting requests, in turn order, the head's turn being in progress
+        self.tenants: "OrderedDict[Optional[str], Deque[_Waiter]]" = OrderedDict()
+        self.deficits: Dict[Optional[str], float] = {}
+        self.size = 0
+
+    def push(self, waiter: _Waiter):
+        waiters = self.tenants.get(waiter.tenant)
+        if waiters is None:
+            waiters = self.tenants[waiter.tenant] = deque()
+            self.deficits[waiter.tenant] = self.quantum
+        waiters.append(waiter)
+        self.size += 1
+
+    def pop(self) -> _Waiter:
+        while True:
+            tenant, waiters = next(iter(self.tenants.items()))
+            head = waiters[0]
+            if head.cost <= self.deficits[tenant]:
+                self.deficits[tenant] -= head.cost
+                self._remove_head(tenant, waiters)
+                return head
+            # Out of credit: the next tenant's turn, and more credit for the next one of this tenant
+            self.deficits[tenant] += self.quantum
+            self.tenants.move_to_end(tenant)
+
+    def remove(self, waiter: _Waiter):
+        waiters = self.tenants[waiter.tenant]
+        if waiters[0] is waiter:
+            self._remove_head(waiter.tenant, waiters)
+            return
+        waiters.remove(waiter)
+        self.size -= 1
+
+    def _remove_head(self, tenant: Optional[str], waiters: Deque[_Waiter]):
+        waiters.popleft()
+        self.size -= 1
+        if not waiters:
+            del self.tenants[tenant]
+            del self.deficits[tenant]
+
+
+class AdmissionController:
+    """
+    Bounds the work accepted by a model, and decides which waiting request goes next.
+
+    At most `max_concurrency` requests run at once (None for no limit), up to
+    `max_queue` more wait for their turn and for no longer than
+    `queue_timeout` seconds, and a single client may have at most
+    `max_per_client` requests running or waiting. Anything beyond that is
+    rejected right away with Overloaded, instead of piling up in the
+    executor's unbounded queue.
+
+    Requests of a higher priority class (see `priority_classes`) always go
+    first. Within a class, the tenants (connections or API keys) take turns
+    by deficit round-robin, so that a tenant sending many requests can't
+    starve the others (unless `fair` is False). Each request costs 1 by default, tenants then get the
+    same number of requests through; with the prompt's token count as its
+    cost, they get the same number of prompt tokens, and tenants sending short
+    prompts get ahead of those sending long ones.
+    """
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        max_queue: int = 64,
+        queue_timeout: Optional[float] = 30,
+        max_per_client: Optional[int] = None,
+        priority_classes: Optional[Dict[str, int]] = None,
+        fair: bool = True,
+        quantum: float = 1
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_per_client = max_per_client
+        # Class name -> rank, higher ranks go first
+        self.priority_classes = priority_classes or {DEFAULT_PRIORITY: 0}
+        # Without fair queuing, each class is a single FIFO queue
+        self.fair = fair
+        self.quantum = quantum
+
+        self._per_client: Dict[str, int] = {}
+
+        self._running = 0
+        self._queues: Dict[int, _ClassQueue] = {}
+        self._queued = 0
+
+        # Moving average of how long a request holds its slot, to suggest a retry delay
+        self._service_time = 1.0
+
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queued
+
+    @asynccontextmanager
+    async def admit(
+        self,
+        client: Optional[str] = None,
+        timeout: Optional[float] = None,
+        tenant: Optional[str] = None,
+        priority: Optional[str] = None,
+        cost: float = 1
+    ) -> AsyncIterator[None]:
+        """
+        Wait for a slot and hold it for the duration of the block.
+
+        Args:
+            client (str): Identifies who sent the request, e.g. the WebSocket connection
+            timeout (float): Time left before the request's deadline, when shorter than `queue_timeout`
+            tenant (str): Who the request is accounted to for fair queuing, defaults to the client
+            priority (str): The priority class of the request, defaults to "default"
+            cost (float): The work the request represents, e.g. its prompt tokens
+
+        Raises:
+            Overloaded: If the client has too many requests in flight, the queue
+                is full or the request waited too long
+            ValueError: If the priority class doesn't exist
+        """
+        rank = self._rank(priority)
+
+        if client is not None and self.max_per_client is not None:
+            if self._per_client.get(client, 0) >= self.max_per_client:
+                self.rejected += 1
+                raise Overloaded("Too many requests in flight for this client", self.retry_after())
+
+        if client is not None:
+            self._per_client[client] = self._per_client.get(client, 0) + 1
+        try:
+            if not self.fair:
+                tenant = None
+            elif tenant is None:
+                tenant = client
+            await self._acquire(timeout, tenant, cost, rank)
+            started = time.monotonic()
+            try:
+                yield
+            finally:
+                self._service_time = 0.9 * self._service_time + 0.1 * (time.monotonic() - started)
+                self._release()
+        finally:
+            if client is not None:
+                self._per_client[client] -= 1
+                if not self._per_client[client]:
+                    del self._per_client[client]
+
+    def retry_after(self) -> float:
+        """
+        Estimate, in seconds, when a rejected request is likely to be admitted.
+        """
+        concurrency = self.max_concurrency or 1
+        return max(1, math.ceil(self._service_time * (self._queued + 1) / concurrency))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._running,
+            "queue_depth": self._queued,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "queues": self.queue_depths(),
+        }
+
+    def queue_depths(self) -> Dict[str, Dict[str, int]]:
+        """
+        The requests and tenants waiting in each priority class.
+        """
+        depths = {}
+        for name, rank in self.priority_classes.items():
+            queue = self._queues.get(rank)
+            depths[name] = {
+                "requests": queue.size if queue is not None else 0,
+                "tenants": len(queue.tenants) if queue is not None else 0,
+            }
+        return depths
+
+    def _rank(self, priority: Optional[str]) -> int:
+        try:
+            return self.priority_classes[priority if priority is not None else DEFAULT_PRIORITY]
+        except KeyError:
+            raise ValueError(f"Unknown priority class: {priority}")
+
+    async def _acquire(self, timeout: Optional[float], tenant: Optional[str], cost: float, rank: int):
+        if self.max_concurrency is None or (self._running < self.max_concurrency and not self._queued):
+            self._running += 1
+            self.admitted += 1
+            return
+
+        if self._queued >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded("Server busy, queue full", self.retry_after())
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), tenant, cost, rank)
+        queue = self._queues.get(rank)
+        if queue is None:
+            queue = self._queues[rank] = _ClassQueue(self.quantum)
+        queue.push(waiter)
+        self._queued += 1
+        try:
+            if timeout is None or (self.queue_timeout is not None and self.queue_timeout < timeout):
+                timeout = self.queue_timeout
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter):
+                self.admitted += 1
+                return
+            self.timed_out += 1
+            raise Overloaded("Server busy, queue wait deadline exceeded", self.retry_after())
+        except BaseException:
+            # The client went away while waiting
+            if not self._abandon(waiter):
+                self._release()
+            raise
+
+        self.admitted += 1
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """
+        Leave the queue, returning False if a slot was handed over in the meantime.
+        """
+        if waiter.future.done():
+            return False
+        waiter.future.cancel()
+        self._queues[waiter.rank].remove(waiter)
+        self._queued -= 1
+        return True
+
+    def _release(self):
+        # Hand the slot over to the next waiter rather than freeing it,
+        # so that newcomers can't overtake the queue
+        if self._queued:
+            rank = max(rank for rank, queue in self._queues.items() if queue.size)
+            waiter = self._queues[rank].pop()
+            self._queued -= 1
+            waiter.future.set_result(None)
+            return
+        self._running -= 1
@@ -0,0 +1,81 @@
+import asyncio
+from concurrent.futures import Executor
+from logging import getLogger
+from typing import Callable, List, Optional, Tuple
+
+
+class BatchScheduler:
+    """
+    Groups concurrent requests into a single batched generation.
+
+    Requests are collected until either `max_batch_size` messages are waiting
+    or `window_ms` milliseconds have passed since the first one arrived. The
+    batch then runs as one `predict_batch` call on the executor and
+    each result is handed back to the request that produced it.
+
+    Batches are static: a batch runs until all of its sequences are finished,
+    and requests arriving meanwhile wait for the next batch.
+    """
+    def __init__(
+        self,
+        predict_batch: Callable[[List[str]], List[str]],
+        executor: Executor,
+        max_batch_size: int = 8,
+        window_ms: float = 10
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+
+        self.predict_batch = predict_batch
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.window = window_ms / 1000
+
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def submit(self, message: str) -> str:
+        """
+        Queue a message for the next batch and wait for its response.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((message, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.get_running_loop().create_task(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]):
+        # Requests whose client went away while waiting don't need a result
+        batch = [(message, future) for message, future in batch if not future.done()]
+        if not batch:
+            return
+
+        loop = asyncio.get_running_loop()
+        messages = [message for message, _ in batch]
+        getLogger("app").debug(f"Running batch of {len(messages)} messages")
+
+        try:
+            responses = await loop.run_in_executor(self.executor, self.predict_batch, messages)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), response in zip(batch, responses):
+            if not future.done():
+                future.set_result(response)
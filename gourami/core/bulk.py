@@ -0,0 +1,167 @@
+import asyncio
+import itertools
+import json
+import os
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Set
+
+# Offline bulk inference, shared by the /batch endpoint and the `gourami batch` command
+
+
+class BulkItem:
+    """A message of a bulk job, or the reason its line couldn't be read."""
+    def __init__(self, item_id: Any, message: Optional[str] = None, error: Optional[str] = None):
+        self.id = item_id
+        self.message = message
+        self.error = error
+
+
+def parse_items(lines: Iterable[str]) -> Iterator[BulkItem]:
+    """
+    Read the messages of a bulk job: JSON lines with a "message" field and an
+    optional "id", a string or an integer, or one message per line. Messages
+    without an id are identified by their line number, as "line-<n>", and so
+    are the lines that can't be read. Blank lines are skipped but counted.
+
+    Ids must be unique, results are matched to messages by id (e.g. to resume
+    a job, see load_checkpoint): a message reusing the id of a previous one
+    is not run.
+    """
+    seen: Set[Any] = set()
+    for number, line in enumerate(lines, 1):
+        line_id = f"line-{number}"
+        line = line.strip()
+        if not line:
+            continue
+
+        if not line.startswith("{"):
+            item_id, message = line_id, line
+        else:
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield BulkItem(line_id, error=f"Invalid JSON: {e}")
+                continue
+            item_id = request.get("id", line_id)
+            message = request.get("message")
+            if isinstance(item_id, bool) or not isinstance(item_id, (str, int)):
+                yield BulkItem(line_id, error="'id' must be a string or an integer")
+                continue
+            if not isinstance(message, str):
+                yield BulkItem(line_id, error="Requests must have a 'message' string")
+                continue
+
+        if item_id in seen:
+            yield BulkItem(line_id, error=f"Duplicate id: {item_id}")
+            continue
+        seen.add(item_id)
+        yield BulkItem(item_id, message)
+
+
+async def run_bulk(
+    items: Iterable[BulkItem],
+    predict_batch: Callable[[List[str]], Awaitable[List[str]]],
+    batch_size: int = 8,
+    concurrency: int = 4,
+    window: int = 1024,
+    skip: Optional[Set[Any]] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run the messages of a bulk job for throughput rather than latency, yielding
+    `{"id": ..., "response": "..."}` (or `"error"`) results as they complete,
+    in no particular order.
+
+    Messages are read `window` at a time and sorted by length, longest first,
+    so that each batch groups messages of similar length (less padding, and
+    batches that finish together), and the longest ones don't end up last.
+    Up to `concurrency` batches run at once, to keep every worker busy, and the
+    next window is read before they run out of work. Windows are read on the
+    default executor, reading and parsing lines may block, e.g. on a file.
+
+    Args:
+        items: The messages, see parse_items
+        predict_batch: Returns the responses to a list of messages, in order
+        batch_size (int): Messages per predict_batch call
+        concurrency (int): predict_batch calls in progress at once
+        window (int): Messages sorted together, bounding the memory held
+        skip (set): Ids of messages to leave out, e.g. already answered
+    """
+    skip = skip or set()
+    iterator = iter(items)
+    loop = asyncio.get_running_loop()
+    exhausted = False
+    batches: Deque[List[BulkItem]] = deque()
+    running: Set[asyncio.Future] = set()
+
+    async def run(batch: List[BulkItem]) -> List[Dict[str, Any]]:
+        try:
+            responses = await predict_batch([item.message for item in batch])
+        except Exception as e:
+            return [{"id": item.id, "error": str(e)} for item in batch]
+        return [{"id": item.id, "response": response} for item, response in zip(batch, responses)]
+
+    try:
+        while True:
+            if not exhausted and len(batches) < concurrency:
+                read = await loop.run_in_executor(None, _take, iterator, window)
+                exhausted = len(read) < window
+                pending = []
+                for item in read:
+                    if item.id in skip:
+                        continue
+                    if item.error is not None:
+                        yield {"id": item.id, "error": item.error}
+                        continue
+                    pending.append(item)
+
+                pending.sort(key=lambda item: len(item.message), reverse=True)
+                for start in range(0, len(pending), batch_size):
+                    batches.append(pending[start:start + batch_size])
+
+            while batches and len(running) < concurrency:
+                running.add(asyncio.ensure_future(run(batches.popleft())))
+
+            if not running:
+                if exhausted and not batches:
+                    return
+                continue
+
+            done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                for result in task.result():
+                    yield result
+    finally:
+        # The consumer stopped early, e.g. the client disconnected
+        for task in running:
+            task.cancel()
+
+
+def _take(iterator: Iterator[BulkItem], count: int) -> List[BulkItem]:
+    return list(itertools.islice(iterator, count))
+
+
+def load_checkpoint(path: str) -> Set[Any]:
+    """
+    Return the ids already answered in the results file of an interrupted job,
+    so that it can resume. Failed messages are not included, they are retried.
+
+    A line cut short by the interruption is removed from the file.
+    """
+    if not os.path.exists(path):
+        return set()
+
+    with open(path, "rb+") as f:
+        content = f.read()
+        complete = content.rfind(b"\n") + 1
+        if complete < len(content):
+            f.truncate(complete)
+
+    done = set()
+    for line in content[:complete].splitlines():
+        try:
+            result = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(result, dict) and "response" in result and isinstance(result.get("id"), (str, int)):
+            done.add(result["id"])
+    return done
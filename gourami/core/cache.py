@@ -0,0 +1,216 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# Config fields that don't affect the response and must not end up in cache keys
+_SECRET_FIELDS = ("api_key", "hf_token")
+
+
+def config_fingerprint(model_type: str, config: Optional[Dict[str, Any]]) -> str:
+    """
+    Identify a model and its effective configuration: responses of models
+    with different fingerprints can't be used for one another.
+
+    Args:
+        model_type (str): The model plugin type
+        config (dict): The effective model configuration
+
+    Returns:
+        str: A hex digest
+    """
+    params = {k: v for k, v in (config or {}).items() if k not in _SECRET_FIELDS}
+    payload = json.dumps([model_type, params], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def make_cache_key(model_type: str, config: Optional[Dict[str, Any]], message: str, mode: str = "predict") -> str:
+    """
+    Build the key identifying a response: the same model, configured the same
+    way, answering the same message in the same mode. Plugins may format
+    predicted and streamed responses differently, e.g. stripped or not.
+
+    Args:
+        model_type (str): The model plugin type
+        config (dict): The effective model configuration
+        message (str): The user's message
+        mode (str): "predict" or "stream"
+
+    Returns:
+        str: A hex digest usable as cache key
+    """
+    payload = json.dumps([config_fingerprint(model_type, config), mode, message])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SqliteCacheStore:
+    """
+    Persistent cache tier backed by a sqlite database, survives restarts.
+    """
+    def __init__(self, path: str, ttl: float = 0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        """Return the stored value and its creation time, if present and not expired."""
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl and time.time() - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            return row
+
+    def set(self, key: str, value: str, created: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created) VALUES (?, ?, ?)",
+                (key, value, created)
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+
+class ResponseCache:
+    """
+    Exact-match response cache.
+
+    Responses are kept in an in-memory LRU bounded both by number of entries and
+    by total size, and expire after `ttl` seconds (0 disables expiry). When a
+    `path` is given, responses are also written to a sqlite store that is looked
+    up on memory misses and survives restarts.
+    """
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float = 3600,
+        path: Optional[str] = None
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.store = SqliteCacheStore(path, ttl) if path else None
+
+        # key -> (value, created, size)
+        self._entries: "OrderedDict[str, Tuple[str, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Return the cached response for a key, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, created, _ = entry
+                if not self._expired(created):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+
+        if self.store is not None:
+            row = self.store.get(key)
+            if row is not None:
+                value, created = row
+                with self._lock:
+                    self.disk_hits += 1
+                    self._insert(key, value, created)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: str):
+        """
+        Cache a response.
+        """
+        created = time.time()
+        with self._lock:
+            self._insert(key, value, created)
+
+        if self.store is not None:
+            self.store.set(key, value, created)
+
+    async def aget(self, key: str) -> Optional[str]:
+        """
+        Like get, but keeps disk lookups off the event loop.
+        """
+        if self.store is None:
+            return self.get(key)
+        return await asyncio.get_running_loop().run_in_executor(None, self.get, key)
+
+    async def aset(self, key: str, value: str):
+        """
+        Like set, but keeps disk writes off the event loop.
+        """
+        if self.store is None:
+            return self.set(key, value)
+        await asyncio.get_running_loop().run_in_executor(None, self.set, key, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.store is not None:
+            self.store.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def _expired(self, created: float) -> bool:
+        return bool(self.ttl) and time.time() - created > self.ttl
+
+    def _insert(self, key: str, value: str, created: float):
+        # Must be called with the lock held
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, created, size)
+        self._bytes += size
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        # Must be called with the lock held
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
@@ -0,0 +1,224 @@
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterator, List, Optional, TypeVar
+
+# Cooperative cancellation of model calls. The engine gives each call a token,
+# cancelled when its caller goes away or its deadline passes; plugins check it
+# between generation steps, so that an abandoned request stops using a worker.
+
+T = TypeVar("T")
+
+
+class Cancelled(Exception):
+    """
+    Raised when a request is stopped before its response is complete.
+    """
+    def __init__(self, reason: str = "Request cancelled"):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class DeadlineExceeded(Cancelled):
+    """
+    Raised when a request didn't complete before its deadline.
+    """
+    def __init__(self, reason: str = "Deadline exceeded"):
+        super().__init__(reason)
+
+
+class CancellationToken:
+    """
+    Tells the code running a request, on any thread, that it should stop.
+
+    Args:
+        timeout (float): Seconds from now after which the request expires, None for no deadline
+    """
+    def __init__(self, timeout: Optional[float] = None):
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.reason: Optional[str] = None
+        self.expired = False
+        self._event = threading.Event()
+        self._callbacks: List[Callable[[], Any]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        # Also checked here, for the threads polling the token
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.expire()
+            return True
+        return False
+
+    def remaining(self) -> Optional[float]:
+        """
+        Seconds left before the deadline, None if there is none.
+        """
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def cancel(self, reason: str = "Request cancelled", expired: bool = False):
+        """
+        Cancel the request and run the callbacks registered with on_cancel, once.
+        """
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self.expired = expired
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                # Aborting is best effort, the request is cancelled regardless
+                pass
+
+    def expire(self):
+        """
+        Cancel the request because its deadline passed.
+        """
+        self.cancel("Deadline exceeded", expired=True)
+
+    def on_cancel(self, callback: Callable[[], Any]) -> Callable[[], None]:
+        """
+        Call `callback` when the request is cancelled, right away if it already is.
+        It runs on the thread cancelling the request.
+
+        Returns:
+            callable: Unregisters the callback
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until the request is cancelled or `timeout` seconds have passed.
+
+        Returns:
+            bool: Whether the request was cancelled
+        """
+        remaining = self.remaining()
+        if remaining is not None and (timeout is None or remaining < timeout):
+            self._event.wait(remaining)
+            return self.cancelled
+        return self._event.wait(timeout)
+
+    def error(self) -> Cancelled:
+        """
+        The exception telling the caller why its request stopped.
+        """
+        return DeadlineExceeded() if self.expired else Cancelled(self.reason or "Request cancelled")
+
+    def check(self):
+        """
+        Raises:
+            Cancelled: If the request is cancelled, DeadlineExceeded if it expired
+        """
+        if self.cancelled:
+            raise self.error()
+
+    def _remove(self, callback: Callable[[], Any]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+# The token of the request being served in the current context, see ModelEngine
+current_token: ContextVar[Optional[CancellationToken]] = ContextVar("current_token", default=None)
+
+
+def is_cancelled() -> bool:
+    """
+    Whether the current request is cancelled. Plugins call this between
+    generation steps; it's always False outside of a request, e.g. in a process
+    pool worker.
+    """
+    token = current_token.get()
+    return token is not None and token.cancelled
+
+
+def sleep(seconds: float) -> bool:
+    """
+    Sleep like time.sleep, waking up early if the current request is cancelled.
+
+    Returns:
+        bool: Whether the request was cancelled
+    """
+    token = current_token.get()
+    if token is None:
+        time.sleep(seconds)
+        return False
+    return token.wait(seconds)
+
+
+def check():
+    """
+    Raises:
+        Cancelled: If the current request is cancelled
+    """
+    token = current_token.get()
+    if token is not None:
+        token.check()
+
+
+@contextmanager
+def abort_on_cancel(abort: Callable[[], Any]) -> Iterator[None]:
+    """
+    Call `abort` if the current request is cancelled during the block, e.g. to
+    close an HTTP response that a thread is blocked reading.
+    """
+    token = current_token.get()
+    if token is None:
+        yield
+        return
+
+    remove = token.on_cancel(abort)
+    try:
+        yield
+    finally:
+        remove()
+
+
+async def interruptible(awaitable: Awaitable[T]) -> T:
+    """
+    Await `awaitable`, unless the current request is cancelled first: it's then
+    cancelled and Cancelled is raised. Work already running on a thread or in
+    another process is only stopped if it checks the token.
+    """
+    token = current_token.get()
+    if token is None:
+        return await awaitable
+
+    future = asyncio.ensure_future(awaitable)
+    loop = asyncio.get_running_loop()
+    interrupted = loop.create_future()
+
+    def interrupt():
+        loop.call_soon_threadsafe(lambda: interrupted.done() or interrupted.set_result(None))
+
+    remove = token.on_cancel(interrupt)
+    try:
+        await asyncio.wait((future, interrupted), return_when=asyncio.FIRST_COMPLETED)
+    except BaseException:
+        future.cancel()
+        raise
+    finally:
+        remove()
+        interrupted.cancel()
+
+    if not future.done():
+        future.cancel()
+        raise token.error()
+    return future.result()
@@ -0,0 +1,100 @@
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+
+class _Flight:
+    """A computation in progress and the chunks it has produced so far."""
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    async def wait(self):
+        """Wait for the next chunk or for the end of the computation."""
+        await self._changed.wait()
+
+    def notify(self):
+        # Each change gets a fresh event, so waiters only wake up once per change
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent requests: the first request for a key starts
+    the computation, the ones arriving while it runs share its output.
+
+    The computation runs in its own task, so that waiters can leave at any time.
+    It's cancelled once every waiter has left.
+    """
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def join(self, key: str, produce: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """
+        Yield the chunks of the computation for `key`, starting it with `produce()`
+        if none is in flight. Waiters joining late get the chunks produced so far
+        first.
+
+        Raises:
+            Exception: The error raised by the computation, to every waiter
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight()
+            flight.task = asyncio.ensure_future(self._run(key, flight, produce()))
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            index = 0
+            while True:
+                if index < len(flight.chunks):
+                    index += 1
+                    yield flight.chunks[index - 1]
+                elif flight.done:
+                    break
+                else:
+                    await flight.wait()
+
+            if flight.error is not None:
+                raise flight.error
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.done:
+                # Nobody is interested anymore
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._flights),
+            "started": self.started,
+            "coalesced": self.coalesced,
+        }
+
+    async def _run(self, key: str, flight: _Flight, chunks: AsyncIterator[str]):
+        try:
+            async for chunk in chunks:
+                flight.chunks.append(chunk)
+                flight.notify()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            flight.notify()
+            self._forget(key, flight)
+
+    def _forget(self, key: str, flight: _Flight):
+        # A new flight may already have taken the key
+        if self._flights.get(key) is flight:
+            del self._flights[key]
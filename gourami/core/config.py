@@ -1,7 +1,7 @@
 from enum import Enum
 import json
 import os
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from pydantic import Field, ConfigDict
 from pydantic_settings import BaseSettings
 
@@ -12,10 +12,58 @@ class ExecutionStrategy(str, Enum):
 class Settings(BaseSettings):
     HOST: str = Field(default="0.0.0.0")
     PORT: int = Field(default=5000)
+    WORKERS: int = Field(default=1, ge=1)
+    WORKER_SHUTDOWN_TIMEOUT: float = Field(default=30, gt=0)
     DISABLE_LOGGING: bool = Field(default=True)
+    LOG_QUEUE_SIZE: int = Field(default=10000, gt=0)
+    LOG_SAMPLE_RATE: float = Field(default=1.0, ge=0, le=1.0)
+    CAPTURE_STDOUT: bool = Field(default=False)
     MODEL_TYPE: str = Field(default="huggingface")
     EXECUTION_STRATEGY: ExecutionStrategy = Field(default=ExecutionStrategy.THREAD_POOL)
     POOL_SIZE: int = Field(default=4)
+    TORCH_THREADS: Optional[int] = Field(default=None, gt=0)
+    MODELS: Dict[str, Dict[str, Any]] = Field(default_factory=dict)
+    DEFAULT_MODEL: Optional[str] = Field(default=None)
+    MODEL_MEMORY_BUDGET_MB: Optional[int] = Field(default=None, gt=0)
+    PRELOAD_MODEL: bool = Field(default=True)
+    WARMUP_MESSAGE: Optional[str] = Field(default=None)
+    MAX_CONCURRENCY: Optional[int] = Field(default=None, gt=0)
+    MAX_QUEUE_SIZE: int = Field(default=64, ge=0)
+    QUEUE_TIMEOUT: Optional[float] = Field(default=30, gt=0)
+    MAX_IN_FLIGHT_PER_CONNECTION: int = Field(default=4, gt=0)
+    REQUEST_TIMEOUT: Optional[float] = Field(default=None, gt=0)
+    FAIR_SCHEDULING: bool = Field(default=True)
+    COST_AWARE_SCHEDULING: bool = Field(default=False)
+    SCHEDULER_QUANTUM: int = Field(default=256, gt=0)
+    PRIORITY_CLASSES: Dict[str, int] = Field(default_factory=lambda: {"default": 0})
+    API_KEYS: Dict[str, str] = Field(default_factory=dict)
+    STREAM_RESPONSES: bool = Field(default=False)
+    UPSTREAM_MAX_CONNECTIONS: int = Field(default=100, gt=0)
+    UPSTREAM_MAX_KEEPALIVE: int = Field(default=20, ge=0)
+    UPSTREAM_KEEPALIVE_EXPIRY: float = Field(default=30, ge=0)
+    UPSTREAM_TIMEOUT: float = Field(default=60, gt=0)
+    UPSTREAM_CONNECT_TIMEOUT: float = Field(default=5, gt=0)
+    UPSTREAM_MAX_RETRIES: int = Field(default=2, ge=0)
+    UPSTREAM_HEDGING: bool = Field(default=False)
+    UPSTREAM_HEDGE_PERCENTILE: float = Field(default=95, gt=0, lt=100)
+    SESSIONS_ENABLED: bool = Field(default=False)
+    SESSION_CACHE_MAX_BYTES: int = Field(default=2 * 1024 ** 3, gt=0)
+    SESSION_CACHE_MAX_STATES: int = Field(default=64, gt=0)
+    BATCH_MAX_SIZE: int = Field(default=1, ge=1)
+    BATCH_WINDOW_MS: float = Field(default=10, ge=0)
+    COALESCE_REQUESTS: bool = Field(default=False)
+    CACHE_ENABLED: bool = Field(default=False)
+    CACHE_MAX_ENTRIES: int = Field(default=1024, gt=0)
+    CACHE_MAX_BYTES: int = Field(default=64 * 1024 * 1024, gt=0)
+    CACHE_TTL: float = Field(default=3600, ge=0)
+    CACHE_PATH: Optional[str] = Field(default=None)
+    SEMANTIC_CACHE_ENABLED: bool = Field(default=False)
+    SEMANTIC_CACHE_MODEL: str = Field(default="sentence-transformers/all-MiniLM-L6-v2")
+    SEMANTIC_CACHE_THRESHOLD: float = Field(default=0.92, ge=-1.0, le=1.0)
+    SEMANTIC_CACHE_CAPACITY: int = Field(default=10000, gt=0)
+    SEMANTIC_CACHE_PATH: Optional[str] = Field(default=None)
+    SEMANTIC_CACHE_SAVE_EVERY: int = Field(default=100, ge=0)
+    ADMIN_TOKEN: Optional[str] = Field(default=None)
 
     model_params: Dict[str, Any] = Field(
         default_factory=dict,
@@ -30,10 +78,18 @@ class Settings(BaseSettings):
     )
 
 
-def configure_settings(params: Optional[Dict[str, Any]] = None, config_path: Optional[str] = None) -> Settings:
+def configure_settings(
+    params: Optional[Dict[str, Any]] = None,
+    config_path: Optional[str] = None,
+    strict: bool = False
+) -> Settings:
     """
     Configure settings by setting environment variables.
+
+    With `strict`, a config file that can't be read raises instead of being ignored.
     """
+    global _configuration
+    _configuration = (params, config_path)
     settings_dict = {}
     
     # Load config file if specified
@@ -43,12 +99,19 @@ def configure_settings(params: Optional[Dict[str, Any]] = None, config_path: Opt
                 config_data = json.load(f)
                 settings_dict.update(config_data)
         except Exception as e:
+            if strict:
+                raise
             print(f"Error loading config file: {e}")
 
     # Apply CLI overrides
     if params:
         settings_dict.update(params)
     
+    # Settings removed from the config file since the previous call fall back to their defaults
+    for env_key in _configured_env:
+        os.environ.pop(env_key, None)
+    _configured_env.clear()
+
     # Set environment variables with prefix
     for key, value in settings_dict.items():
         if value is not None:
@@ -57,13 +120,44 @@ def configure_settings(params: Optional[Dict[str, Any]] = None, config_path: Opt
             if isinstance(value, dict):
                 value = json.dumps(value)
             os.environ[env_key] = str(value)
+            _configured_env.append(env_key)
 
     global _settings_instance
     _settings_instance = Settings()
 
     return _settings_instance
 
+
+# Settings a hot reload applies, the others keep their values until a restart
+RELOADABLE_SETTINGS = ("MODEL_TYPE", "model_params", "MODELS", "DEFAULT_MODEL")
+
+
+def reload_settings() -> Settings:
+    """
+    Read the config file again, with the same CLI overrides, for a hot reload:
+    the RELOADABLE_SETTINGS of the current settings are updated in place, so
+    that everything holding them (routes, plugins, HTTP clients...) keeps
+    seeing the same values for the others.
+
+    Raises:
+        Exception: If the config file can't be read or the settings are invalid
+    """
+    global _settings_instance
+    current = _settings_instance
+    params, config_path = _configuration
+    fresh = configure_settings(params=params, config_path=config_path, strict=True)
+    if current is None:
+        return fresh
+
+    for name in RELOADABLE_SETTINGS:
+        setattr(current, name, getattr(fresh, name))
+    _settings_instance = current
+    return current
+
 _settings_instance: Optional[Settings] = None
+# Arguments of the last configure_settings call, and the variables it set
+_configuration: Tuple[Optional[Dict[str, Any]], Optional[str]] = (None, None)
+_configured_env: List[str] = []
 
 def get_settings():
     global _settings_instance
@@ -0,0 +1,39 @@
+import os
+import sys
+from typing import Optional
+
+
+def available_cores() -> int:
+    """
+    Number of cores the process may run on, which is less than the machine's
+    when it's pinned to some of them (e.g. by a container's cpuset).
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def intra_op_threads(settings) -> int:
+    """
+    Threads each generation may use for its tensor operations.
+
+    Every server worker runs up to POOL_SIZE generations at once, and each of
+    them starts its own team of torch threads. Unless TORCH_THREADS is set, the
+    cores are split between all of them rather than each using every core,
+    which makes the threads preempt each other.
+    """
+    if settings.TORCH_THREADS is not None:
+        return settings.TORCH_THREADS
+    return max(1, available_cores() // (settings.WORKERS * settings.POOL_SIZE))
+
+
+def limit_torch_threads(threads: Optional[int]):
+    """
+    Set the intra-op thread count of torch in the current process, if it's loaded.
+    """
+    # Plugins import torch when loading their model, API plugins don't need it
+    if threads is None or "torch" not in sys.modules:
+        return
+
+    import torch
+    torch.set_num_threads(threads)
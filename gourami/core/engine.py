@@ -0,0 +1,600 @@
+import asyncio
+import copy
+import functools
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import aclosing, asynccontextmanager, nullcontext
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+from gourami.core import cancellation, metrics, tracing
+from gourami.core.admission import DEFAULT_PRIORITY, AdmissionController, Overloaded
+from gourami.core.batching import BatchScheduler
+from gourami.core.cache import ResponseCache, config_fingerprint, make_cache_key
+from gourami.core.coalescing import SingleFlight
+from gourami.core.model import ChatModel
+from gourami.core.semantic_cache import SemanticCache
+from gourami.core.sessions import Session, SessionCache
+from gourami.core.workers import worker_predict, worker_predict_batch, worker_predict_session
+
+# Marks the end of a stream produced on a worker thread
+_END_OF_STREAM = object()
+# Marks a stream whose request was cancelled while waiting for its next chunk
+_CANCELLED = object()
+
+
+class _CacheLookup:
+    """Outcome of a cache lookup, and what is needed to cache the response on a miss."""
+    def __init__(self):
+        self.response: Optional[str] = None
+        self.key: Optional[str] = None
+        self.namespace: Optional[str] = None
+        self.embedding = None
+
+
+class ModelEngine:
+    """
+    Runs a ChatModel on an executor and exposes its results to the event loop.
+
+    Each model call gets a cancellation token (see gourami.core.cancellation),
+    cancelled when the caller stops waiting for it or when `request_timeout`
+    seconds have passed, so that the plugin stops generating.
+    """
+    def __init__(
+        self,
+        model: ChatModel,
+        executor: Executor,
+        model_type: str = "",
+        batch_max_size: int = 1,
+        batch_window_ms: float = 10,
+        cache: Optional[ResponseCache] = None,
+        semantic_cache: Optional[SemanticCache] = None,
+        sessions: Optional[SessionCache] = None,
+        admission: Optional[AdmissionController] = None,
+        coalesce: bool = False,
+        request_timeout: Optional[float] = None,
+        cost_aware: bool = False,
+        name: Optional[str] = None
+    ):
+        self.model = model
+        self.executor = executor
+        self.model_type = model_type
+        # The name the model is served as, metrics are labelled by it
+        self.name = name or model_type
+        self.cache = cache
+        self.semantic_cache = semantic_cache
+        self.sessions = sessions
+        self.admission = admission
+        self.request_timeout = request_timeout
+        # Admission weighs requests by their prompt tokens rather than counting them
+        self.cost_aware = cost_aware
+        # Per-request parameters of the model, sent along to process pool workers
+        self.overrides: Optional[Dict[str, Any]] = None
+        # Identical concurrent requests share one computation
+        self.single_flight = SingleFlight() if coalesce else None
+
+        # Process pool workers hold their own resident model, see create_process_pool
+        if isinstance(executor, ProcessPoolExecutor):
+            self._predict, self._predict_batch = worker_predict, worker_predict_batch
+        else:
+            self._predict, self._predict_batch = model.predict, model.predict_batch
+
+        # Only group requests when the plugin can run them as one generation
+        self.batcher = None
+        if batch_max_size > 1 and model.supports_batching:
+            self.batcher = BatchScheduler(self._predict_batch, executor, batch_max_size, batch_window_ms)
+
+    def close(self):
+        """
+        Release the resources tied to this engine's model.
+
+        Process pools are created for a single model, so their workers are stopped.
+        Thread pools may be shared and are left running.
+        """
+        if isinstance(self.executor, ProcessPoolExecutor):
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        self.model = None
+        self._predict = self._predict_batch = None
+        self.batcher = None
+
+    def with_overrides(self, params: Optional[Dict[str, Any]]) -> "ModelEngine":
+        """
+        Return a view of this engine whose model generates with other parameters
+        (see ChatModel.with_overrides), for a single request.
+
+        The view shares the caches, admission control and coalescing of the
+        engine. Cache keys include the parameters, so responses are only shared
+        between requests using the same ones. Its requests aren't batched.
+
+        Raises:
+            ValueError: If a parameter can't be set per request or is invalid
+        """
+        if not params:
+            return self
+
+        engine = copy.copy(self)
+        engine.model = self.model.with_overrides(params)
+        engine.overrides = params
+        if isinstance(self.executor, ProcessPoolExecutor):
+            engine._predict = functools.partial(worker_predict, overrides=params)
+            engine._predict_batch = functools.partial(worker_predict_batch, overrides=params)
+        else:
+            engine._predict, engine._predict_batch = engine.model.predict, engine.model.predict_batch
+        # Batches run with a single configuration
+        engine.batcher = None
+        return engine
+
+    def cache_key(self, message: str, mode: str = "predict") -> str:
+        """
+        Key of the response to a message in a mode ("predict" or "stream"), given
+        the model's effective configuration.
+        """
+        return make_cache_key(self.model_type, self._config(), message, mode)
+
+    async def predict(
+        self,
+        message: str,
+        session: Optional[Session] = None,
+        client: Optional[str] = None,
+        timeout: Optional[float] = None,
+        tenant: Optional[str] = None,
+        priority: Optional[str] = None
+    ) -> str:
+        """
+        Return the full model response for a message.
+
+        When a session is given and the model supports it, the message is
+        answered as the next turn of that conversation. `client` identifies the
+        sender for admission control, `tenant` who it's accounted to for fair
+        queuing (the client by default) and `priority` its priority class.
+        `timeout` is the time the response may take, queueing included, and
+        defaults to `request_timeout`.
+
+        Raises:
+            Overloaded: If the model can't take more work right now
+            DeadlineExceeded: If the response isn't ready in time
+        """
+        timeout = timeout if timeout is not None else self.request_timeout
+        if session is not None and self.model.supports_sessions:
+            async with self._serving(client, "predict", timeout, tenant, priority, self._cost([message])):
+                return await self._predict_session(session, message)
+
+        lookup = await self._lookup(message, "predict")
+        if lookup.response is not None:
+            metrics.REQUESTS.inc(self.name, self.model_type, "cache_hit")
+            return lookup.response
+
+        if self.single_flight is None:
+            chunks = self._generate(message, client, "predict", lookup, timeout, tenant, priority)
+        else:
+            # The priority of the request starting the computation applies to it
+            chunks = self._join(
+                lookup.key or self.cache_key(message, "predict"),
+                functools.partial(self._generate, message, client, "predict", lookup, None, tenant, priority),
+                timeout
+            )
+        async with aclosing(chunks):
+            return "".join([chunk async for chunk in chunks])
+
+    async def stream(
+        self,
+        message: str,
+        session: Optional[Session] = None,
+        client: Optional[str] = None,
+        timeout: Optional[float] = None,
+        tenant: Optional[str] = None,
+        priority: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Yield the model response as text deltas, as soon as the model produces them.
+
+        Closing the iterator early cancels the generation. When the deadline
+        passes, DeadlineExceeded is raised after the chunks produced so far.
+        """
+        timeout = timeout if timeout is not None else self.request_timeout
+        if session is not None and self.model.supports_sessions:
+            async with self._serving(client, "stream", timeout, tenant, priority, self._cost([message])) as request:
+                async for chunk in self._stream_session(session, message):
+                    request.mark_first_token()
+                    yield chunk
+            return
+
+        lookup = await self._lookup(message, "stream")
+        if lookup.response is not None:
+            metrics.REQUESTS.inc(self.name, self.model_type, "cache_hit")
+            yield lookup.response
+            return
+
+        if self.single_flight is None:
+            chunks = self._generate(message, client, "stream", lookup, timeout, tenant, priority)
+        else:
+            chunks = self._join(
+                lookup.key or self.cache_key(message, "stream"),
+                functools.partial(self._generate, message, client, "stream", lookup, None, tenant, priority),
+                timeout
+            )
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                yield chunk
+
+    async def predict_batch(
+        self,
+        messages: List[str],
+        client: Optional[str] = None,
+        timeout: Optional[float] = None,
+        tenant: Optional[str] = None,
+        priority: Optional[str] = None
+    ) -> List[str]:
+        """
+        Return the responses to several messages of an offline job, in order.
+
+        The messages run as one predict_batch call, taking a single admission
+        slot. They bypass the caches, coalescing and the batch window, which
+        serve interactive traffic, and `request_timeout`.
+
+        Raises:
+            Overloaded: If the model can't take more work right now
+        """
+        async with self._serving(client, "batch", timeout, tenant, priority, self._cost(messages)):
+            if self.model.supports_async:
+                return list(await cancellation.interruptible(
+                    asyncio.gather(*(self.model.apredict(message) for message in messages))
+                ))
+
+            loop = asyncio.get_running_loop()
+            return await cancellation.interruptible(
+                loop.run_in_executor(self.executor, self._bind(self._predict_batch, messages))
+            )
+
+    async def warm_up(self, message: str, copies: int = 1):
+        """
+        Run a throwaway generation, so that the first real request doesn't pay for
+        lazy initialization (CUDA context, kernels, process pool workers...).
+
+        Caches and admission control are bypassed. `copies` generations run at
+        once, e.g. to start every worker of a process pool.
+        """
+        await asyncio.gather(*(self._predict_uncached(message) for _ in range(copies)))
+
+    def _cost(self, messages: List[str]) -> float:
+        """
+        What a model call weighs for fair queuing: its prompt tokens when
+        scheduling is cost-aware, otherwise 1.
+        """
+        if not self.cost_aware or self.admission is None:
+            return 1
+        cost = 0
+        for message in messages:
+            tokens = self.model.count_tokens(message)
+            # Roughly 4 characters per token, for plugins without a tokenizer
+            cost += tokens if tokens is not None else len(message) / 4
+        return max(1, cost)
+
+    @asynccontextmanager
+    async def _serving(
+        self,
+        client: Optional[str],
+        mode: str,
+        timeout: Optional[float] = None,
+        tenant: Optional[str] = None,
+        priority: Optional[str] = None,
+        cost: float = 1
+    ) -> AsyncIterator[metrics.RequestStats]:
+        """
+        Admit a model call and measure it, making its stats the current request's
+        so that the plugin can report to them, and its cancellation token the
+        current one so that the plugin can stop early.
+
+        A response completed after the token was cancelled may be truncated: the
+        token's error is raised instead, so that it isn't cached either.
+        """
+        request = metrics.RequestStats()
+        request.priority = priority or DEFAULT_PRIORITY
+        trace = tracing.current_trace.get()
+        if trace is not None:
+            trace.mark("enqueue", request.started)
+        token = cancellation.CancellationToken(timeout)
+        context_tokens = (metrics.current_request.set(request), cancellation.current_token.set(token))
+        # Wakes up the waits and aborts the upstream requests of the call at its deadline
+        timer = asyncio.get_running_loop().call_later(timeout, token.expire) if timeout is not None else None
+        outcome = "error"
+        try:
+            # Cache hits are served right away, only model calls go through admission
+            admit = nullcontext() if self.admission is None else self.admission.admit(
+                client, token.remaining(), tenant, priority, cost
+            )
+            async with admit:
+                request.queue_wait["admission"] = time.perf_counter() - request.started
+                if trace is not None:
+                    trace.mark("start")
+                # Don't start work that nobody will wait for
+                token.check()
+                yield request
+            token.check()
+            outcome = "completed"
+        except Overloaded:
+            outcome = "rejected"
+            raise
+        except cancellation.Cancelled:
+            outcome = "deadline_exceeded" if token.expired else "cancelled"
+            raise
+        except (asyncio.CancelledError, GeneratorExit):
+            # The caller went away, the plugin can stop generating
+            token.cancel("Request abandoned")
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            # E.g. an upstream request aborted at the deadline
+            if token.cancelled:
+                outcome = "deadline_exceeded" if token.expired else "cancelled"
+                raise token.error() from e
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+            for var, context_token in zip((metrics.current_request, cancellation.current_token), context_tokens):
+                try:
+                    var.reset(context_token)
+                except ValueError:
+                    # An abandoned stream being closed by the event loop, from another context
+                    pass
+            metrics.observe_request(self.name, self.model_type, mode, request, outcome)
+            if trace is not None:
+                if request.first_token is not None:
+                    trace.mark("first_token", request.first_token)
+                trace.mark("finish")
+
+    def _bind(self, fn: Callable, *args):
+        # Calls that stay in this process run in the request's context
+        if isinstance(self.executor, ProcessPoolExecutor):
+            return functools.partial(fn, *args)
+        return metrics.bind(fn, *args)
+
+    def _config(self) -> Optional[dict]:
+        config = getattr(self.model, "config", None)
+        return config.dict() if config is not None else None
+
+    async def _lookup(self, message: str, mode: str) -> _CacheLookup:
+        # Predictions and streams are cached and coalesced apart, see make_cache_key
+        lookup = _CacheLookup()
+
+        if self.cache is not None:
+            lookup.key = self.cache_key(message, mode)
+            lookup.response = await self.cache.aget(lookup.key)
+            if lookup.response is not None:
+                return lookup
+
+        if self.semantic_cache is not None:
+            lookup.namespace = f"{config_fingerprint(self.model_type, self._config())}:{mode}"
+            lookup.response, lookup.embedding = await self.semantic_cache.alookup(lookup.namespace, message)
+            # Let later exact repeats skip the embedding
+            if lookup.response is not None and lookup.key is not None:
+                await self.cache.aset(lookup.key, lookup.response)
+
+        return lookup
+
+    async def _store(self, lookup: _CacheLookup, response: str):
+        if lookup.key is not None:
+            await self.cache.aset(lookup.key, response)
+        if lookup.embedding is not None:
+            await self.semantic_cache.aadd(lookup.namespace, lookup.embedding, response)
+
+    async def _predict_session(self, session: Session, message: str) -> str:
+        # Responses depend on the history, so they are neither cached nor batched
+        async with session.lock:
+            if self.model.supports_async:
+                response = await cancellation.interruptible(self.model.apredict(message, session=session))
+            else:
+                loop = asyncio.get_running_loop()
+                if isinstance(self.executor, ProcessPoolExecutor):
+                    call = functools.partial(worker_predict_session, list(session.messages), message, self.overrides)
+                else:
+                    call = metrics.bind(functools.partial(self.model.predict, message, session=session))
+                # Not interrupted: the session's state is only consistent once the plugin returns
+                response = await loop.run_in_executor(self.executor, call)
+
+            # A truncated response isn't a turn of the conversation
+            cancellation.check()
+            session.add_turn(message, response)
+
+        if self.sessions is not None:
+            self.sessions.touch(session)
+        return response
+
+    async def _stream_session(self, session: Session, message: str) -> AsyncIterator[str]:
+        async with session.lock:
+            if isinstance(self.executor, ProcessPoolExecutor) and not self.model.supports_async:
+                # Generators can't cross a process boundary, send the full response instead
+                loop = asyncio.get_running_loop()
+                response = await loop.run_in_executor(
+                    self.executor,
+                    functools.partial(worker_predict_session, list(session.messages), message, self.overrides)
+                )
+                yield response
+            else:
+                if self.model.supports_async:
+                    chunks = self._iterate_async(self.model.astream(message, session=session))
+                else:
+                    chunks = self._iterate_in_executor(
+                        functools.partial(self.model.stream, message, session=session),
+                        interruptible=False
+                    )
+
+                parts = []
+                async for chunk in chunks:
+                    parts.append(chunk)
+                    yield chunk
+                response = "".join(parts)
+
+            cancellation.check()
+            session.add_turn(message, response)
+
+        if self.sessions is not None:
+            self.sessions.touch(session)
+
+    async def _join(
+        self,
+        key: str,
+        produce: Callable[[], AsyncIterator[str]],
+        timeout: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """
+        Yield the chunks of the computation shared by the requests for `key`, see
+        SingleFlight.join. It runs without a deadline, since its requests may
+        have different ones: each request stops waiting at its own, raising
+        DeadlineExceeded, and the computation is cancelled once none is left.
+        """
+        chunks = self.single_flight.join(key, produce)
+        async with aclosing(chunks):
+            if timeout is None:
+                async for chunk in chunks:
+                    yield chunk
+                return
+
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), max(0.0, deadline - time.monotonic()))
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    raise cancellation.DeadlineExceeded()
+                yield chunk
+
+    async def _generate(
+        self,
+        message: str,
+        client: Optional[str],
+        mode: str,
+        lookup: _CacheLookup,
+        timeout: Optional[float] = None,
+        tenant: Optional[str] = None,
+        priority: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Run the model on a message that missed the caches, then cache the response.
+        Predictions come as a single chunk.
+        """
+        chunks = []
+        async with self._serving(client, mode, timeout, tenant, priority, self._cost([message])) as request:
+            if mode == "stream":
+                async for chunk in self._stream_uncached(message):
+                    request.mark_first_token()
+                    chunks.append(chunk)
+                    yield chunk
+            else:
+                chunks.append(await self._predict_uncached(message))
+                yield chunks[0]
+        await self._store(lookup, "".join(chunks))
+
+    async def _predict_uncached(self, message: str) -> str:
+        if self.model.supports_async:
+            return await cancellation.interruptible(self.model.apredict(message))
+
+        # Batched generations run for all of their requests, a cancelled request only leaves
+        if self.batcher is not None:
+            return await cancellation.interruptible(self.batcher.submit(message))
+
+        loop = asyncio.get_running_loop()
+        return await cancellation.interruptible(
+            loop.run_in_executor(self.executor, self._bind(self._predict, message))
+        )
+
+    async def _stream_uncached(self, message: str) -> AsyncIterator[str]:
+        if self.model.supports_async:
+            async for chunk in self._iterate_async(self.model.astream(message)):
+                yield chunk
+            return
+
+        # Generators can't cross a process boundary, send the full response instead
+        if isinstance(self.executor, ProcessPoolExecutor):
+            yield await self._predict_uncached(message)
+            return
+
+        async for chunk in self._iterate_in_executor(functools.partial(self.model.stream, message)):
+            yield chunk
+
+    async def _iterate_in_executor(
+        self,
+        make_iterator: Callable[[], Iterator[str]],
+        interruptible: bool = True
+    ) -> AsyncIterator[str]:
+        """
+        Consume a blocking iterator on the executor, yielding its items on the event loop.
+
+        The iterator is closed as soon as the request is cancelled. Unless
+        `interruptible` is False, the stream then ends right away rather than
+        when the plugin notices.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        def produce():
+            chunks = make_iterator()
+            try:
+                for chunk in chunks:
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk)
+                    if cancellation.is_cancelled():
+                        break
+            finally:
+                # Stops the generation of plugins that can't check the token themselves
+                close = getattr(chunks, "close", None)
+                if close is not None:
+                    close()
+                loop.call_soon_threadsafe(queue.put_nowait, _END_OF_STREAM)
+
+        future = loop.run_in_executor(self.executor, metrics.bind(produce))
+
+        token = cancellation.current_token.get()
+        remove = None
+        if interruptible and token is not None:
+            remove = token.on_cancel(lambda: loop.call_soon_threadsafe(queue.put_nowait, _CANCELLED))
+        try:
+            while True:
+                chunk = await queue.get()
+                if chunk is _END_OF_STREAM:
+                    break
+                if chunk is _CANCELLED:
+                    raise token.error()
+                yield chunk
+        finally:
+            if remove is not None:
+                remove()
+
+        # Surface errors raised by the model while streaming
+        await future
+
+    async def _iterate_async(self, chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+        """
+        Consume an async iterator of the model in a task of its own, so that it
+        can be stopped (aborting its upstream request) as soon as the request is
+        cancelled, even while waiting for its next chunk.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def produce():
+            async with aclosing(chunks):
+                async for chunk in chunks:
+                    queue.put_nowait(chunk)
+
+        producer = asyncio.ensure_future(produce())
+        producer.add_done_callback(lambda _: queue.put_nowait(_END_OF_STREAM))
+
+        token = cancellation.current_token.get()
+        remove = None
+        if token is not None:
+            remove = token.on_cancel(lambda: loop.call_soon_threadsafe(producer.cancel))
+        try:
+            while True:
+                chunk = await queue.get()
+                if chunk is _END_OF_STREAM:
+                    break
+                yield chunk
+        finally:
+            if remove is not None:
+                remove()
+            producer.cancel()
+
+        if producer.cancelled() and token is not None:
+            raise token.error()
+        # Surface errors raised by the model while streaming
+        producer.result()
@@ -0,0 +1,335 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Recording is meant to stay cheap enough for the hot path: an observation is a
+# bisect and a couple of additions under a lock, rendering only happens on scrape
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """
+    A Prometheus histogram, with one series per combination of label values.
+    """
+    def __init__(self, name: str, documentation: str, labels: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # Label values -> per bucket counts (not cumulative, +Inf last), then the sum
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = [(values, list(series)) for values, series in self._series.items()]
+
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for values, series in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series):
+                cumulative += count
+                labels = _format_labels(self.labels, values, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, values)
+            lines.append(f"{self.name}_sum{labels} {series[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Counter:
+    """
+    A Prometheus counter, with one series per combination of label values.
+    """
+    def __init__(self, name: str, documentation: str, labels: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._series: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1):
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = list(self._series.items())
+
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for values, value in snapshot:
+            lines.append(f"{self.name}{_format_labels(self.labels, values)} {value}")
+        return lines
+
+
+def render_gauge(name: str, documentation: str, labels: Sequence[str], samples: Iterable[Tuple[Sequence[str], float]]) -> List[str]:
+    """
+    Render a gauge whose values are read at scrape time, e.g. a queue depth.
+    """
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+    for values, value in samples:
+        lines.append(f"{name}{_format_labels(labels, values)} {value}")
+    return lines
+
+
+REQUESTS = Counter(
+    "gourami_requests_total",
+    "Messages handled, by outcome (completed, cache_hit, rejected, cancelled, deadline_exceeded or error).",
+    ["model", "model_type", "outcome"]
+)
+QUEUE_WAIT = Histogram(
+    "gourami_queue_wait_seconds",
+    "Time spent waiting for admission or for a free executor worker.",
+    ["model", "model_type", "queue"],
+    LATENCY_BUCKETS
+)
+REQUEST_DURATION = Histogram(
+    "gourami_request_duration_seconds",
+    "Time to produce a full response, queueing included.",
+    ["model", "model_type", "mode"],
+    LATENCY_BUCKETS
+)
+PRIORITY_QUEUE_WAIT = Histogram(
+    "gourami_priority_queue_wait_seconds",
+    "Time spent waiting for admission, by priority class.",
+    ["model", "model_type", "priority"],
+    LATENCY_BUCKETS
+)
+TIME_TO_FIRST_TOKEN = Histogram(
+    "gourami_time_to_first_token_seconds",
+    "Time until the first chunk of a streamed response, queueing included.",
+    ["model", "model_type"],
+    LATENCY_BUCKETS
+)
+STAGE_DURATION = Histogram(
+    "gourami_stage_duration_seconds",
+    "Time spent in each stage of a plugin (tokenize, generate, upstream...).",
+    ["model", "model_type", "stage"],
+    LATENCY_BUCKETS
+)
+INPUT_TOKENS = Histogram(
+    "gourami_input_tokens",
+    "Prompt tokens per request, as reported by the plugin.",
+    ["model", "model_type"],
+    TOKEN_BUCKETS
+)
+OUTPUT_TOKENS = Histogram(
+    "gourami_output_tokens",
+    "Generated tokens per request, as reported by the plugin.",
+    ["model", "model_type"],
+    TOKEN_BUCKETS
+)
+SPECULATIVE_STEPS = Counter(
+    "gourami_speculative_steps_total",
+    "Forward passes of the target model in speculative decoding, each emits one token of its own.",
+    ["model", "model_type"]
+)
+SPECULATIVE_DRAFTED = Counter(
+    "gourami_speculative_draft_tokens_total",
+    "Tokens proposed by draft models.",
+    ["model", "model_type"]
+)
+SPECULATIVE_ACCEPTED = Counter(
+    "gourami_speculative_accepted_tokens_total",
+    "Drafted tokens accepted by the target model (draft model or prompt lookup).",
+    ["model", "model_type"]
+)
+TOKENS_PER_SECOND = Histogram(
+    "gourami_output_tokens_per_second",
+    "Generation speed, after the first token when streaming.",
+    ["model", "model_type"],
+    RATE_BUCKETS
+)
+
+_METRICS = [
+    REQUESTS,
+    QUEUE_WAIT,
+    PRIORITY_QUEUE_WAIT,
+    REQUEST_DURATION,
+    TIME_TO_FIRST_TOKEN,
+    STAGE_DURATION,
+    INPUT_TOKENS,
+    OUTPUT_TOKENS,
+    TOKENS_PER_SECOND,
+    SPECULATIVE_STEPS,
+    SPECULATIVE_DRAFTED,
+    SPECULATIVE_ACCEPTED,
+]
+
+
+class RequestStats:
+    """
+    Measurements of a single model call, filled in by the engine and the plugin.
+    """
+    __slots__ = (
+        "started", "first_token", "input_tokens", "output_tokens", "queue_wait", "stages",
+        "target_forwards", "draft_forwards", "priority"
+    )
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token: Optional[float] = None
+        self.input_tokens: Optional[int] = None
+        self.output_tokens: Optional[int] = None
+        self.queue_wait: Dict[str, float] = {}
+        self.stages: Dict[str, float] = {}
+        # Only counted by models decoding speculatively
+        self.target_forwards = 0
+        self.draft_forwards = 0
+        # The priority class the request was scheduled in
+        self.priority: Optional[str] = None
+
+    def mark_first_token(self):
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+
+
+# The request being served in the current context, see ModelEngine and bind
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+def record_tokens(input_tokens: Optional[int] = None, output_tokens: Optional[int] = None):
+    """
+    Report the token counts of the current request. Plugins call this; it does
+    nothing outside of a request, e.g. in a process pool worker.
+    """
+    request = current_request.get()
+    if request is None:
+        return
+    if input_tokens is not None:
+        request.input_tokens = (request.input_tokens or 0) + input_tokens
+    if output_tokens is not None:
+        request.output_tokens = (request.output_tokens or 0) + output_tokens
+
+
+def count_forward(draft: bool = False):
+    """
+    Count a forward pass of the target (or draft) model of speculative decoding.
+    The accepted tokens are derived from these and the output tokens.
+    """
+    request = current_request.get()
+    if request is None:
+        return
+    if draft:
+        request.draft_forwards += 1
+    else:
+        request.target_forwards += 1
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Time a stage of the current request, e.g. `with stage("tokenize"): ...`.
+    """
+    request = current_request.get()
+    if request is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        request.stages[name] = request.stages.get(name, 0.0) + time.perf_counter() - started
+
+
+def bind(fn: Callable[..., Any], *args) -> Callable[[], Any]:
+    """
+    Wrap a call about to be submitted to a thread pool, so that it runs in the
+    current context (the plugin can then report to the current request) and the
+    time it waits for a free thread is recorded.
+    """
+    context = copy_context()
+    submitted = time.perf_counter()
+
+    def run():
+        request = context.get(current_request)
+        if request is not None:
+            request.queue_wait["executor"] = time.perf_counter() - submitted
+        return context.run(fn, *args)
+
+    return run
+
+
+def observe_request(model: str, model_type: str, mode: str, request: RequestStats, outcome: str):
+    """
+    Record the measurements of a finished request of the model served as `model`.
+    """
+    REQUESTS.inc(model, model_type, outcome)
+    # Whatever their outcome, so that a starved class shows
+    if request.priority is not None and "admission" in request.queue_wait:
+        PRIORITY_QUEUE_WAIT.observe(request.queue_wait["admission"], model, model_type, request.priority)
+    if outcome != "completed":
+        return
+
+    finished = time.perf_counter()
+    REQUEST_DURATION.observe(finished - request.started, model, model_type, mode)
+
+    for queue, wait in request.queue_wait.items():
+        QUEUE_WAIT.observe(wait, model, model_type, queue)
+    for name, duration in request.stages.items():
+        STAGE_DURATION.observe(duration, model, model_type, name)
+
+    generation_started = request.started + sum(request.queue_wait.values())
+    if request.first_token is not None:
+        TIME_TO_FIRST_TOKEN.observe(request.first_token - request.started, model, model_type)
+        generation_started = request.first_token
+
+    if request.input_tokens is not None:
+        INPUT_TOKENS.observe(request.input_tokens, model, model_type)
+    if request.output_tokens is not None:
+        OUTPUT_TOKENS.observe(request.output_tokens, model, model_type)
+        elapsed = finished - generation_started
+        if elapsed > 0:
+            TOKENS_PER_SECOND.observe(request.output_tokens / elapsed, model, model_type)
+
+        # Every target forward pass emits one token, the others are accepted drafts
+        if request.target_forwards:
+            SPECULATIVE_STEPS.inc(model, model_type, amount=request.target_forwards)
+            SPECULATIVE_DRAFTED.inc(model, model_type, amount=request.draft_forwards)
+            SPECULATIVE_ACCEPTED.inc(model, model_type, amount=max(0, request.output_tokens - request.target_forwards))
+
+
+def render(extra: Iterable[List[str]] = ()) -> str:
+    """
+    Render all metrics in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    for gauge in extra:
+        lines.extend(gauge)
+    return "\n".join(lines) + "\n"
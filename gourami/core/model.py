@@ -1,5 +1,6 @@
+import copy
 from abc import ABC, abstractmethod
-from typing import Type
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple, Type
 from pydantic import BaseModel, Field, ConfigDict
 
 class BaseModelConfig(BaseModel):
@@ -9,6 +10,21 @@ class BaseModelConfig(BaseModel):
     model_config = ConfigDict(extra="allow") 
 
 class ChatModel(ABC):
+    # Whether predict_batch runs a real batched generation, so that
+    # concurrent requests are worth grouping together
+    supports_batching: bool = False
+
+    # Whether apredict/astream are implemented natively, so that requests can
+    # be awaited on the event loop instead of going through the executor
+    supports_async: bool = False
+
+    # Whether predict/stream (and apredict/astream) accept a `session` keyword
+    # argument, the gourami.core.sessions.Session holding the conversation so far
+    supports_sessions: bool = False
+
+    # Config fields that a request may set for itself, see with_overrides
+    request_params: Tuple[str, ...] = ("temperature", "max_tokens")
+
     @classmethod
     @abstractmethod
     def get_config_class(cls) -> Type[BaseModelConfig]:
@@ -20,3 +36,78 @@ class ChatModel(ABC):
         """Process the user's message and return a response."""
         pass
 
+    def stream(self, message: str, **kwargs) -> Iterator[str]:
+        """
+        Process the user's message and yield the response as text deltas.
+
+        Plugins that can produce output incrementally should override this.
+        The default implementation yields the whole response as a single chunk.
+        """
+        yield self.predict(message, **kwargs)
+
+    def predict_batch(self, messages: List[str]) -> List[str]:
+        """
+        Process several messages at once and return their responses in order.
+
+        The default implementation handles the messages one at a time.
+        """
+        return [self.predict(message) for message in messages]
+
+    async def apredict(self, message: str) -> str:
+        """Process the user's message on the event loop and return a response."""
+        raise NotImplementedError(f"{type(self).__name__} does not support async prediction")
+
+    async def astream(self, message: str, **kwargs) -> AsyncIterator[str]:
+        """
+        Process the user's message on the event loop and yield the response as text deltas.
+
+        The default implementation yields the whole response as a single chunk.
+        """
+        yield await self.apredict(message, **kwargs)
+
+    def count_tokens(self, message: str) -> Optional[int]:
+        """
+        Return the number of tokens of a message, for the scheduler to weigh
+        requests by their cost. It runs on the event loop, so it must be cheap.
+
+        The default implementation returns None: the plugin has no tokenizer.
+        """
+        return None
+
+    def share_memory(self) -> bool:
+        """
+        Move the model weights to shared memory, so that worker processes can map
+        them instead of holding a private copy.
+
+        Returns:
+            bool: Whether the model can now be sent to worker processes without copying its weights
+        """
+        return False
+
+    def memory_footprint(self) -> int:
+        """
+        Return the memory held by the model weights, in bytes (0 if negligible or unknown).
+        """
+        return 0
+
+    def with_overrides(self, params: Dict[str, Any]) -> "ChatModel":
+        """
+        Return a copy of the model generating with other `request_params`, e.g. a
+        lower temperature, for a single request. The copy shares the loaded
+        weights and clients of the model.
+
+        Raises:
+            ValueError: If a parameter can't be set per request or is invalid
+        """
+        unsupported = sorted(set(params) - set(self.request_params))
+        if unsupported:
+            raise ValueError(f"Parameters that can't be set per request: {', '.join(unsupported)}")
+
+        config = getattr(self, "config", None)
+        if config is None:
+            raise ValueError(f"{type(self).__name__} doesn't support per-request parameters")
+
+        model = copy.copy(self)
+        # Validated like the model's own configuration
+        model.config = type(config)(**{**config.dict(), **params})
+        return model
@@ -0,0 +1,58 @@
+from logging import getLogger
+from typing import Dict, Optional, Tuple
+from gourami.core.model import ChatModel
+from gourami.core.registry import ModelSpec, build_model_specs
+
+# Models loaded by the master process before forking the server workers, by name,
+# with their spec. Workers inherit them and share their weights copy-on-write.
+_preloaded: Dict[str, Tuple[ModelSpec, ChatModel]] = {}
+
+
+def can_preload(spec: ModelSpec) -> bool:
+    """
+    Whether a model can be loaded before forking and used by the forked workers.
+
+    Only local models whose weights stay on the CPU qualify: CUDA can't be used
+    in a process forked after initializing it, and API clients hold connections
+    and threads that don't survive a fork.
+    """
+    from gourami.plugins import get_model_class
+
+    ModelClass = get_model_class(spec.model_type)
+    if ModelClass.supports_async:
+        return False
+
+    config = ModelClass.get_config_class()(**spec.model_params)
+    return str(getattr(config, "device", "cpu")) == "cpu"
+
+
+def preload_default_model(settings) -> Optional[str]:
+    """
+    Load the default model in the current process, ahead of forking workers.
+
+    Returns:
+        str: The name of the preloaded model, None if it can't be shared this way
+    """
+    from gourami.plugins import get_model
+
+    logger = getLogger("app")
+    specs, default = build_model_specs(settings)
+    spec = next(spec for spec in specs if spec.name == default)
+
+    if not can_preload(spec):
+        logger.info(f"Model {spec.name} can't be shared across forked workers, each worker will load it")
+        return None
+
+    logger.info(f"Loading model {spec.name} ({spec.model_type}) before forking workers")
+    _preloaded[spec.name] = (spec, get_model(model_type=spec.model_type, model_params=spec.model_params))
+    return spec.name
+
+
+def get_preloaded(spec: ModelSpec) -> Optional[ChatModel]:
+    """
+    Return the model preloaded by the master process for a spec, if any.
+
+    Models reloaded with a different configuration since then aren't preloaded.
+    """
+    preloaded_spec, model = _preloaded.get(spec.name, (None, None))
+    return model if preloaded_spec == spec else None
@@ -0,0 +1,124 @@
+import asyncio
+import cProfile
+import marshal
+import pickle
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, Tuple
+
+# On-demand profiles of the running server, see the /debug endpoints. They are
+# returned as files for the usual tools: pstats (snakeviz, pstats.Stats),
+# collapsed stacks (flamegraph.pl, speedscope) or tracemalloc snapshots.
+
+
+async def profile_event_loop(seconds: float) -> bytes:
+    """
+    Run cProfile on the event loop thread for `seconds`: the request handling,
+    scheduling and async plugins, but not the executor threads.
+
+    Returns:
+        bytes: The profile in the pstats format, as written by Profile.dump_stats
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+    profiler.create_stats()
+    return marshal.dumps(profiler.stats)
+
+
+def _frame_name(code) -> str:
+    # Semicolons separate the frames of collapsed stacks
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})".replace(";", ",")
+
+
+def sample_stacks(seconds: float, interval: float = 0.01) -> Dict[str, int]:
+    """
+    Sample the stacks of every thread of the process (event loop, executor,
+    generation threads...) every `interval` seconds for `seconds`. Blocks, run
+    it on a thread of its own.
+
+    Samples are taken in wall-clock time: idle threads show in the frame they
+    are waiting in, e.g. a queue's get.
+
+    Returns:
+        dict: Number of samples per stack, the thread name first and the innermost frame last
+    """
+    own = threading.get_ident()
+    counts: Counter = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}").replace(";", ","))
+            counts[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return counts
+
+
+def collapse(counts: Dict[str, int]) -> bytes:
+    """
+    Render stack counts in the collapsed format, one `frame;frame;frame count` line per stack.
+    """
+    lines = [f"{stack} {count}" for stack, count in sorted(counts.items())]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+async def trace_allocations(seconds: float, frames: int = 25) -> Tuple[tracemalloc.Snapshot, tracemalloc.Snapshot]:
+    """
+    Trace the memory allocations of the process for `seconds`, keeping
+    `frames` frames of traceback per allocation. Allocations are slower while
+    tracing.
+
+    Returns:
+        tuple: Snapshots of the traced memory at the start and at the end
+    """
+    # Tracing may already be on, e.g. with PYTHONTRACEMALLOC, leave it on then
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(frames)
+
+    loop = asyncio.get_running_loop()
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    try:
+        # Taking a snapshot walks every traced block, keep the event loop responsive meanwhile
+        baseline = await loop.run_in_executor(None, tracemalloc.take_snapshot)
+        await asyncio.sleep(seconds)
+        snapshot = await loop.run_in_executor(None, tracemalloc.take_snapshot)
+    finally:
+        if started:
+            tracemalloc.stop()
+    return baseline.filter_traces(ignore), snapshot.filter_traces(ignore)
+
+
+def collapse_allocations(baseline: tracemalloc.Snapshot, snapshot: tracemalloc.Snapshot) -> bytes:
+    """
+    Render the memory allocated between two snapshots and still held at the
+    second, in bytes per traceback, in the collapsed format.
+    """
+    counts = {}
+    for stat in snapshot.compare_to(baseline, "traceback"):
+        if stat.size_diff <= 0:
+            continue
+        # Tracebacks go from the oldest frame to the most recent one
+        stack = ";".join(f"{frame.filename}:{frame.lineno}".replace(";", ",") for frame in stat.traceback)
+        counts[stack] = counts.get(stack, 0) + stat.size_diff
+    return collapse(counts)
+
+
+def dump_snapshot(snapshot: tracemalloc.Snapshot) -> bytes:
+    """
+    Serialize a snapshot like Snapshot.dump, to be read with tracemalloc.Snapshot.load.
+    """
+    return pickle.dumps(snapshot, pickle.HIGHEST_PROTOCOL)
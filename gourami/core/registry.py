@@ -0,0 +1,424 @@
+import asyncio
+import gc
+import sys
+import time
+from contextlib import asynccontextmanager
+from logging import getLogger
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from gourami.core.engine import ModelEngine
+
+
+def _collect():
+    gc.collect()
+    if "torch" in sys.modules:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+
+class ModelSpec:
+    """
+    A model that can be served: a plugin type and its parameters, under a name.
+    """
+    def __init__(self, name: str, model_type: str, model_params: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.model_type = model_type
+        self.model_params = model_params or {}
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, ModelSpec):
+            return NotImplemented
+        return (self.name, self.model_type, self.model_params) == (other.name, other.model_type, other.model_params)
+
+
+def build_model_specs(settings) -> Tuple[List[ModelSpec], str]:
+    """
+    Read the models to serve from the settings.
+
+    `MODELS` maps names to `{"model_type": ..., "model_params": {...}}`. When it's
+    empty, a single model named after `MODEL_TYPE` is served with `model_params`.
+
+    Returns:
+        tuple: The model specs and the name of the default model
+    """
+    if not settings.MODELS:
+        spec = ModelSpec(settings.MODEL_TYPE, settings.MODEL_TYPE, settings.model_params)
+        return [spec], spec.name
+
+    specs = []
+    for name, params in settings.MODELS.items():
+        if "model_type" not in params:
+            raise ValueError(f"Model {name} has no model_type")
+        specs.append(ModelSpec(name, params["model_type"], params.get("model_params")))
+
+    return specs, settings.DEFAULT_MODEL or specs[0].name
+
+
+class _RegistryEntry:
+    def __init__(self, spec: ModelSpec):
+        self.spec = spec
+        self.engine: Optional[ModelEngine] = None
+        self.loading: Optional[asyncio.Future] = None
+        self.refs = 0
+        # Requests in progress on each engine, the current one and the retired ones
+        self.holders: Dict[ModelEngine, int] = {}
+        # Previous versions of the model, unloaded once their requests complete
+        self.retired: List[ModelEngine] = []
+        self.last_used = 0.0
+        # One of unloaded, loading, warming_up, loaded, reloading or failed
+        self.status = "unloaded"
+        self.error: Optional[str] = None
+        self.status_since = time.monotonic()
+        # Kept after unloading, to make room before the model is loaded again
+        self.footprint = 0
+
+
+class ModelRegistry:
+    """
+    Serves several models side by side.
+
+    Models are loaded on first use, by `load_engine` running off the event loop.
+    Callers hold a reference on a model while they use it (see `use`). When the
+    memory held by the loaded models exceeds `memory_budget` bytes, the least
+    recently used models that nobody holds are unloaded.
+
+    The configuration of the models can be swapped while serving, see `reload`.
+    """
+    def __init__(
+        self,
+        specs: List[ModelSpec],
+        default: str,
+        load_engine: Callable[[ModelSpec], ModelEngine],
+        memory_budget: Optional[int] = None
+    ):
+        self._entries: Dict[str, _RegistryEntry] = {spec.name: _RegistryEntry(spec) for spec in specs}
+        if default not in self._entries:
+            raise ValueError(f"Default model {default} is not configured")
+
+        self.default = default
+        self.load_engine = load_engine
+        self.memory_budget = memory_budget
+        self._reload_lock = asyncio.Lock()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+
+    def names(self) -> List[str]:
+        return list(self._entries)
+
+    def loaded(self) -> Dict[str, ModelEngine]:
+        """
+        Return the engines of the models currently loaded, by name.
+        """
+        return {name: entry.engine for name, entry in self._entries.items() if entry.engine is not None}
+
+    def get_loaded(self, name: Optional[str] = None) -> Optional[ModelEngine]:
+        """
+        Return the engine of a model if it's loaded, without loading it.
+        """
+        return self._entry(name).engine
+
+    async def acquire(self, name: Optional[str] = None) -> ModelEngine:
+        """
+        Return the engine of a model, loading it if needed, and hold a reference on it.
+        Every acquire must be paired with a release of the returned engine.
+        """
+        return await self._acquire(self._entry(name))
+
+    def release(self, name: Optional[str] = None, engine: Optional[ModelEngine] = None):
+        """
+        Release a reference taken by acquire on `engine` (the model's current engine by default).
+        """
+        entry = self._entry(name)
+        self._release(entry, engine or entry.engine)
+
+    @asynccontextmanager
+    async def use(self, name: Optional[str] = None) -> AsyncIterator[ModelEngine]:
+        """
+        Hold a model for the duration of the block, e.g. the generation of a response.
+
+        If the model is reloaded meanwhile, the block keeps the version it started with.
+        """
+        entry = self._entry(name)
+        engine = await self._acquire(entry)
+        try:
+            yield engine
+        finally:
+            self._release(entry, engine)
+
+    async def preload(
+        self,
+        name: Optional[str] = None,
+        warm_up: Optional[Callable[[ModelEngine], Awaitable[None]]] = None
+    ) -> bool:
+        """
+        Load a model ahead of its first request, then optionally warm it up.
+
+        Failures are logged and reported by `stats` rather than raised, as this is
+        meant to run in the background while the server already accepts connections.
+
+        Returns:
+            bool: Whether the model is loaded (and warmed up)
+        """
+        entry = self._entry(name)
+        logger = getLogger("app")
+        try:
+            async with self.use(name) as engine:
+                if warm_up is not None:
+                    self._set_status(entry, "warming_up")
+                    logger.info(f"Warming up model {entry.spec.name}")
+                    started = time.monotonic()
+                    await warm_up(engine)
+                    logger.info(f"Model {entry.spec.name} warmed up in {time.monotonic() - started:.1f}s")
+                    self._set_status(entry, "loaded")
+        except Exception as e:
+            logger.exception(f"Failed to preload model {entry.spec.name}")
+            self._set_status(entry, "failed", error=str(e))
+            return False
+        return True
+
+    def unload(self, name: str) -> bool:
+        """
+        Unload a model nobody holds, returning whether it was unloaded.
+        """
+        entry = self._entry(name)
+        if entry.engine is None or entry.refs > 0:
+            return False
+
+        getLogger("app").info(f"Unloading model {name}")
+        engine, entry.engine = entry.engine, None
+        self._set_status(entry, "unloaded")
+        self._free(engine)
+        return True
+
+    async def reload(
+        self,
+        specs: List[ModelSpec],
+        default: str,
+        warm_up: Optional[Callable[[ModelEngine], Awaitable[None]]] = None
+    ) -> List[str]:
+        """
+        Switch to a new configuration of the models without interrupting the service.
+
+        The new version of each loaded model whose configuration changed is loaded
+        (and warmed up) in the background while the current one keeps serving.
+        Once they are all ready, new requests switch over at once, and each
+        previous version is unloaded when its in-flight requests complete.
+        Models that aren't loaded just take their new configuration, removed
+        models are unloaded once idle.
+
+        Until then, both versions are in memory.
+
+        Raises:
+            Exception: The error loading a new version, in which case nothing is switched
+
+        Returns:
+            list: The names of the models that were added, changed or removed
+        """
+        names = [spec.name for spec in specs]
+        if default not in names:
+            raise ValueError(f"Default model {default} is not configured")
+
+        async with self._reload_lock:
+            logger = getLogger("app")
+            changed = [spec for spec in specs if spec.name not in self._entries or self._entries[spec.name].spec != spec]
+            removed = [name for name in self._entries if name not in names]
+
+            # Loads starting from now use the new configuration
+            previous = {}
+            for spec in changed:
+                entry = self._entries.get(spec.name)
+                if entry is not None:
+                    previous[spec.name] = entry.spec
+                    entry.spec = spec
+
+            engines: Dict[str, ModelEngine] = {}
+            try:
+                for spec in changed:
+                    entry = self._entries.get(spec.name)
+                    if entry is None or entry.engine is None:
+                        continue
+
+                    self._set_status(entry, "reloading")
+                    self._make_room(entry.footprint, keep=entry)
+                    logger.info(f"Loading the new version of model {spec.name} ({spec.model_type})")
+                    loop = asyncio.get_running_loop()
+                    engines[spec.name] = await loop.run_in_executor(None, self.load_engine, spec)
+                    if warm_up is not None:
+                        await warm_up(engines[spec.name])
+            except BaseException as e:
+                logger.exception("Failed to reload the models, keeping the current ones")
+                for name, spec in previous.items():
+                    entry = self._entries[name]
+                    entry.spec = spec
+                    if entry.engine is not None:
+                        self._set_status(entry, "loaded", error=f"Reload failed: {e}")
+                for engine in engines.values():
+                    self._free(engine)
+                raise
+
+            # Switch over, without yielding to the event loop in between
+            for spec in changed:
+                entry = self._entries.get(spec.name)
+                if entry is None:
+                    self._entries[spec.name] = _RegistryEntry(spec)
+                    continue
+
+                engine = engines.get(spec.name)
+                if engine is None:
+                    continue
+                if entry.engine is None and entry.loading is None:
+                    # Unloaded meanwhile to make room, the new version takes its place
+                    entry.engine = engine
+                elif entry.engine is None:
+                    # Being loaded again meanwhile, already with the new configuration
+                    self._free(engine)
+                    continue
+                else:
+                    old, entry.engine = entry.engine, engine
+                    self._retire(entry, old)
+                entry.footprint = engine.model.memory_footprint()
+                self._set_status(entry, "loaded")
+
+            for name in removed:
+                entry = self._entries.pop(name)
+                if entry.engine is not None:
+                    old, entry.engine = entry.engine, None
+                    self._retire(entry, old)
+
+            self.default = default
+            updated = [spec.name for spec in changed] + removed
+            logger.info(f"Models reloaded, changed: {', '.join(updated) or 'none'}")
+            return updated
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "default": self.default,
+            "memory_budget": self.memory_budget,
+            "models": {
+                name: {
+                    "model_type": entry.spec.model_type,
+                    "loaded": entry.engine is not None,
+                    "loading": entry.loading is not None,
+                    "status": entry.status,
+                    "status_seconds": round(time.monotonic() - entry.status_since, 1),
+                    "error": entry.error,
+                    "refs": entry.refs,
+                    "draining": sum(entry.holders.get(engine, 0) for engine in entry.retired),
+                    "memory_footprint": entry.footprint,
+                }
+                for name, entry in self._entries.items()
+            }
+        }
+
+    def _entry(self, name: Optional[str]) -> _RegistryEntry:
+        name = name or self.default
+        if name not in self._entries:
+            raise ValueError(f"Unknown model: {name}")
+        return self._entries[name]
+
+    async def _acquire(self, entry: _RegistryEntry) -> ModelEngine:
+        entry.refs += 1
+        entry.last_used = time.monotonic()
+
+        try:
+            if entry.engine is None:
+                if entry.loading is None:
+                    entry.loading = asyncio.ensure_future(self._load(entry))
+                await asyncio.shield(entry.loading)
+        except BaseException:
+            entry.refs -= 1
+            raise
+
+        engine = entry.engine
+        entry.holders[engine] = entry.holders.get(engine, 0) + 1
+        return engine
+
+    def _release(self, entry: _RegistryEntry, engine: ModelEngine):
+        entry.refs -= 1
+        entry.last_used = time.monotonic()
+
+        entry.holders[engine] -= 1
+        if entry.holders[engine] > 0:
+            return
+        del entry.holders[engine]
+
+        if engine in entry.retired:
+            # The last request on a previous version completed
+            entry.retired.remove(engine)
+            getLogger("app").info(f"Unloading the previous version of model {entry.spec.name}")
+            self._free(engine)
+        elif engine is entry.engine and entry.refs == 0 and self._entries.get(entry.spec.name) is not entry:
+            # Loaded while a reload was removing the model
+            getLogger("app").info(f"Unloading removed model {entry.spec.name}")
+            entry.engine = None
+            self._free(engine)
+
+    async def _load(self, entry: _RegistryEntry):
+        logger = getLogger("app")
+        try:
+            # Make room ahead of time if the model was loaded before
+            self._make_room(entry.footprint, keep=entry)
+
+            logger.info(f"Loading model {entry.spec.name} ({entry.spec.model_type})")
+            self._set_status(entry, "loading")
+            started = time.monotonic()
+            loop = asyncio.get_running_loop()
+            try:
+                entry.engine = await loop.run_in_executor(None, self.load_engine, entry.spec)
+            except Exception as e:
+                self._set_status(entry, "failed", error=str(e))
+                raise
+            entry.footprint = entry.engine.model.memory_footprint()
+            self._set_status(entry, "loaded")
+            logger.info(f"Model {entry.spec.name} loaded in {time.monotonic() - started:.1f}s")
+
+            self._make_room(0, keep=entry)
+        finally:
+            entry.loading = None
+
+    def _retire(self, entry: _RegistryEntry, engine: ModelEngine):
+        in_flight = entry.holders.get(engine, 0)
+        if in_flight:
+            getLogger("app").info(
+                f"Previous version of model {entry.spec.name} is finishing {in_flight} requests"
+            )
+            entry.retired.append(engine)
+        else:
+            self._free(engine)
+
+    def _free(self, engine: ModelEngine):
+        engine.close()
+        del engine
+
+        # Give the memory back now rather than at the next collection, which
+        # takes a while after a large model: off the event loop when serving
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            _collect()
+            return
+        loop.run_in_executor(None, _collect)
+
+    def _set_status(self, entry: _RegistryEntry, status: str, error: Optional[str] = None):
+        entry.status = status
+        entry.error = error
+        entry.status_since = time.monotonic()
+
+    def _make_room(self, needed: int, keep: _RegistryEntry):
+        if self.memory_budget is None:
+            return
+
+        loaded = [e for e in self._entries.values() if e.engine is not None and e is not keep]
+        total = needed + sum(e.footprint for e in loaded) + (keep.footprint if keep.engine is not None else 0)
+
+        for entry in sorted(loaded, key=lambda e: e.last_used):
+            if total <= self.memory_budget:
+                return
+            if self.unload(entry.spec.name):
+                total -= entry.footprint
+
+        if total > self.memory_budget:
+            getLogger("app").warning(
+                f"Loaded models use {total} bytes, over the budget of {self.memory_budget} bytes"
+            )
@@ -0,0 +1,236 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from logging import getLogger
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class SemanticCache:
+    """
+    Response cache matching messages by meaning rather than by exact text.
+
+    Messages are embedded with a small sentence-transformers model running on
+    CPU. Embeddings are kept in a NumPy matrix and a lookup returns the cached
+    response of the most similar message, if its cosine similarity reaches
+    `threshold`. Entries are scoped by namespace (a model and its configuration,
+    see `config_fingerprint`), so a response is never served for another model.
+
+    The index holds at most `capacity` entries, the least recently used entry is
+    replaced when it's full. When a `path` is given, the index is loaded from it
+    by `load` and saved back by `save`, which also runs in the background every
+    `save_every` new entries so that a crash loses at most those.
+
+    Nothing is loaded until `load` is called, messages miss the cache meanwhile.
+
+    Requires the `semantic-cache` extra (numpy, sentence-transformers).
+    """
+    def __init__(
+        self,
+        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        threshold: float = 0.92,
+        capacity: int = 10000,
+        path: Optional[str] = None,
+        save_every: int = 0
+    ):
+        self.model_name = model_name
+        self.threshold = threshold
+        self.capacity = capacity
+        self.path = path
+        self.save_every = save_every
+
+        self._embedder = None
+        self._vectors = None
+        self._last_used = None
+        self._namespace_ids = None
+        self._responses: List[Optional[str]] = []
+        self._namespaces: Dict[str, int] = {}
+        self._size = 0
+        # Entries added since the index was last saved
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._embedder is not None
+
+    def load(self):
+        """
+        Load the embedding model, then the index from `path` if it exists. Slow
+        (it imports torch), run it off the event loop.
+        """
+        import numpy as np
+        from sentence_transformers import SentenceTransformer
+
+        embedder = SentenceTransformer(self.model_name, device="cpu")
+        dimension = embedder.get_sentence_embedding_dimension()
+
+        self._vectors = np.zeros((self.capacity, dimension), dtype=np.float32)
+        self._last_used = np.zeros(self.capacity, dtype=np.float64)
+        self._namespace_ids = np.full(self.capacity, -1, dtype=np.int32)
+        self._responses = [None] * self.capacity
+
+        if self.path and os.path.exists(self.path):
+            self._load(self.path)
+        # Last, lookups start once the index is in place
+        self._embedder = embedder
+
+    def embed(self, message: str):
+        """
+        Return the normalized embedding of a message.
+        """
+        return self._embedder.encode(message, normalize_embeddings=True, convert_to_numpy=True)
+
+    def lookup(self, namespace: str, embedding) -> Optional[str]:
+        """
+        Return the cached response of the most similar message in the namespace,
+        or None if none is similar enough.
+        """
+        import numpy as np
+
+        with self._lock:
+            namespace_id = self._namespaces.get(namespace)
+            if namespace_id is None or self._size == 0:
+                self.misses += 1
+                return None
+
+            similarities = self._vectors[:self._size] @ embedding
+            similarities[self._namespace_ids[:self._size] != namespace_id] = -1.0
+            best = int(np.argmax(similarities))
+
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            self._last_used[best] = time.time()
+            self.hits += 1
+            return self._responses[best]
+
+    def add(self, namespace: str, embedding, response: str):
+        """
+        Cache the response to a message, evicting the least recently used entry if full.
+        """
+        import numpy as np
+
+        with self._lock:
+            namespace_id = self._namespaces.setdefault(namespace, len(self._namespaces))
+
+            if self._size < self.capacity:
+                slot = self._size
+                self._size += 1
+            else:
+                slot = int(np.argmin(self._last_used))
+                self.evictions += 1
+
+            self._vectors[slot] = embedding
+            self._last_used[slot] = time.time()
+            self._namespace_ids[slot] = namespace_id
+            self._responses[slot] = response
+            self._unsaved += 1
+
+    async def alookup(self, namespace: str, message: str) -> Tuple[Optional[str], Any]:
+        """
+        Embed a message and look it up, off the event loop.
+
+        Returns:
+            tuple: The cached response (or None) and the message embedding, to be
+            passed to `aadd`, None until the cache is loaded
+        """
+        if not self.ready:
+            return None, None
+
+        def run():
+            embedding = self.embed(message)
+            return self.lookup(namespace, embedding), embedding
+
+        return await asyncio.get_running_loop().run_in_executor(None, run)
+
+    async def aadd(self, namespace: str, embedding, response: str):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.add, namespace, embedding, response)
+        if self.path and self.save_every and self._unsaved >= self.save_every and not self._save_lock.locked():
+            # In the background, the response is already complete
+            loop.run_in_executor(None, self._autosave)
+
+    def _autosave(self):
+        try:
+            self.save()
+        except Exception as e:
+            getLogger("app").error(f"Error saving semantic cache index to {self.path}: {e}")
+
+    def save(self, path: Optional[str] = None):
+        """
+        Persist the index, to `path` or to the path given at creation.
+        """
+        path = path or self.path
+        # Not loaded yet, the index on disk is still the latest
+        if not path or not self.ready:
+            return
+
+        with self._save_lock:
+            self._save(path)
+
+    def _save(self, path: str):
+        import numpy as np
+
+        with self._lock:
+            self._unsaved = 0
+            size = self._size
+            metadata = json.dumps({"responses": self._responses[:size], "namespaces": self._namespaces})
+            vectors = self._vectors[:size].copy()
+            last_used = self._last_used[:size].copy()
+            namespace_ids = self._namespace_ids[:size].copy()
+
+        # Write to a temporary file first, so that a crash never leaves a truncated index
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                vectors=vectors,
+                last_used=last_used,
+                namespace_ids=namespace_ids,
+                metadata=np.array(metadata)
+            )
+        os.replace(tmp_path, path)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "ready": self.ready,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": self._size,
+                "capacity": self.capacity,
+            }
+
+    def _load(self, path: str):
+        import numpy as np
+
+        try:
+            with np.load(path) as data:
+                vectors = data["vectors"]
+                if vectors.shape[1] != self._vectors.shape[1]:
+                    raise ValueError("index was built with a different embedding model")
+
+                metadata = json.loads(str(data["metadata"]))
+                # Keep the most recently used entries if the capacity shrank
+                keep = np.argsort(data["last_used"])[::-1][:self.capacity]
+                size = len(keep)
+
+                self._vectors[:size] = vectors[keep]
+                self._last_used[:size] = data["last_used"][keep]
+                self._namespace_ids[:size] = data["namespace_ids"][keep]
+                self._responses[:size] = [metadata["responses"][i] for i in keep]
+                self._namespaces = metadata["namespaces"]
+                self._size = size
+        except Exception as e:
+            getLogger("app").error(f"Error loading semantic cache index from {path}: {e}")
@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+
+class Session:
+    """
+    A conversation with one client.
+
+    `messages` holds the conversation history in chat format
+    (`{"role": "user" | "assistant", "content": ...}`). Plugins that support
+    sessions may keep derived state in `state`, such as the KV cache of the
+    transcript so far, and report its size in `state_bytes`. That state can be
+    dropped at any time by the SessionCache, plugins must then rebuild it from
+    `messages`.
+    """
+    def __init__(self, session_id: Optional[str] = None):
+        self.id = session_id or uuid.uuid4().hex
+        self.messages: List[Dict[str, str]] = []
+        self.state: Any = None
+        self.state_bytes: int = 0
+
+        # Turns of a conversation are generated one at a time
+        self.lock = asyncio.Lock()
+
+    def conversation(self, message: str) -> List[Dict[str, str]]:
+        """
+        Return the history followed by a new user message.
+        """
+        return self.messages + [{"role": "user", "content": message}]
+
+    def add_turn(self, message: str, response: str):
+        self.messages.append({"role": "user", "content": message})
+        self.messages.append({"role": "assistant", "content": response})
+
+    def drop_state(self):
+        self.state = None
+        self.state_bytes = 0
+
+
+class SessionCache:
+    """
+    Tracks open sessions and bounds the memory held by their state.
+
+    When the total `state_bytes` exceeds `max_bytes`, or more than `max_states`
+    sessions hold state, the state of the least recently used sessions is
+    dropped. Their history is kept, so the next turn recomputes the state.
+    """
+    def __init__(self, max_bytes: int = 2 * 1024 ** 3, max_states: int = 64):
+        self.max_bytes = max_bytes
+        self.max_states = max_states
+
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def open(self, session_id: Optional[str] = None) -> Session:
+        """
+        Return the session with the given id, creating it if needed.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session = Session(session_id)
+                self._sessions[session.id] = session
+            self._sessions.move_to_end(session.id)
+            return session
+
+    def close(self, session_id: str):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None:
+            session.drop_state()
+
+    def touch(self, session: Session):
+        """
+        Mark a session as just used and enforce the memory budget.
+        """
+        with self._lock:
+            if session.id in self._sessions:
+                self._sessions.move_to_end(session.id)
+
+            holding = [s for s in self._sessions.values() if s.state is not None]
+            total = sum(s.state_bytes for s in holding)
+            count = len(holding)
+
+            for candidate in holding:
+                if total <= self.max_bytes and count <= self.max_states:
+                    break
+                # Never pull the state from under a turn being generated
+                if candidate is session or candidate.lock.locked():
+                    continue
+                total -= candidate.state_bytes
+                count -= 1
+                candidate.drop_state()
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            holding = [s for s in self._sessions.values() if s.state is not None]
+            return {
+                "sessions": len(self._sessions),
+                "sessions_with_state": len(holding),
+                "state_bytes": sum(s.state_bytes for s in holding),
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,51 @@
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+# Per-request traces of /chat (?trace=true): when a message went through each
+# hop of the server. The route marks the hops it sees (receive, send), the
+# engine those of the model call.
+
+HOPS = ("receive", "enqueue", "start", "first_token", "finish", "send")
+
+
+class Trace:
+    """
+    Timestamps of a message's hops:
+
+    - receive: the frame was read from the connection
+    - enqueue: the model call asked for admission (after the caches missed)
+    - start: it was admitted
+    - first_token: the first chunk of a streamed response was produced
+    - finish: the model call completed
+    - send: the last frame of the response was sent
+
+    Hops a message skipped, e.g. the model call of a cache hit, are missing.
+    """
+    def __init__(self):
+        self.received_at = time.time()
+        self._origin = time.perf_counter()
+        self.hops: Dict[str, float] = {"receive": self._origin}
+
+    def mark(self, hop: str, at: Optional[float] = None):
+        """
+        Record a hop, at `at` (a time.perf_counter() value) or now. Only the first time counts.
+        """
+        self.hops.setdefault(hop, at if at is not None else time.perf_counter())
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        The hops in milliseconds since the message was received, and when it was (a UNIX timestamp).
+        """
+        return {
+            "received_at": self.received_at,
+            "hops_ms": {
+                hop: round((self.hops[hop] - self._origin) * 1000, 3)
+                for hop in HOPS
+                if hop in self.hops
+            },
+        }
+
+
+# The trace of the message being served in the current context, if it's traced
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
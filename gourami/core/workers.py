@@ -0,0 +1,108 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from logging import getLogger
+from typing import Any, Dict, List, Optional
+from gourami.core.cpu import limit_torch_threads
+from gourami.core.model import ChatModel
+from gourami.core.sessions import Session
+
+# Model owned by the current pool worker, set once by init_worker
+_worker_model: Optional[ChatModel] = None
+
+
+def init_worker(
+    model: Optional[ChatModel] = None,
+    model_type: Optional[str] = None,
+    model_params: Optional[Dict[str, Any]] = None,
+    threads: Optional[int] = None
+):
+    """
+    Process pool initializer: make a model resident in the worker.
+
+    Args:
+        model (ChatModel): A model whose weights live in shared memory, received once at startup
+        model_type (str): The plugin to load inside the worker when no shared model is given
+        model_params (dict): The parameters of that plugin
+        threads (int): Intra-op threads of the worker's torch operations
+    """
+    global _worker_model
+
+    if model is not None:
+        _worker_model = model
+    else:
+        from gourami.plugins import get_model
+        _worker_model = get_model(model_type=model_type, model_params=model_params)
+
+    limit_torch_threads(threads)
+
+
+def _model(overrides: Optional[Dict[str, Any]]) -> ChatModel:
+    return _worker_model.with_overrides(overrides) if overrides else _worker_model
+
+
+def worker_predict(message: str, overrides: Optional[Dict[str, Any]] = None) -> str:
+    """Run ChatModel.predict on the worker's resident model, with per-request parameters if given."""
+    return _model(overrides).predict(message)
+
+
+def worker_predict_batch(messages: List[str], overrides: Optional[Dict[str, Any]] = None) -> List[str]:
+    """Run ChatModel.predict_batch on the worker's resident model, with per-request parameters if given."""
+    return _model(overrides).predict_batch(messages)
+
+
+def worker_predict_session(
+    messages: List[Dict[str, str]],
+    message: str,
+    overrides: Optional[Dict[str, Any]] = None
+) -> str:
+    """
+    Run ChatModel.predict on the worker's resident model, for a conversation.
+
+    Session state can't be kept across processes, so only the history is sent
+    and the conversation is processed from scratch.
+    """
+    session = Session()
+    session.messages = messages
+    return _model(overrides).predict(message, session=session)
+
+
+def create_process_pool(
+    model: ChatModel,
+    model_type: str,
+    pool_size: int,
+    model_params: Optional[Dict[str, Any]] = None,
+    threads: Optional[int] = None
+) -> ProcessPoolExecutor:
+    """
+    Create a process pool whose workers each hold the model for their whole lifetime.
+
+    Requests then only carry the message, not the model. When the plugin can move
+    its weights to shared memory, the already loaded model is handed to the workers
+    so that they all map the same weights. Otherwise each worker loads its own copy.
+
+    Args:
+        model (ChatModel): The model loaded in the server process
+        model_type (str): The plugin type, used by workers that load their own copy
+        model_params (dict): The plugin parameters, used by workers that load their own copy
+        pool_size (int): Number of worker processes
+        threads (int): Intra-op threads of each worker, torch's default (all cores) if None
+
+    Returns:
+        ProcessPoolExecutor: The pool, to be used with worker_predict/worker_predict_batch
+    """
+    logger = getLogger("app")
+
+    if model.share_memory():
+        logger.info("Model weights moved to shared memory, workers will map them")
+        initargs = (model, None, None, threads)
+    else:
+        logger.info("Model can't be shared, each worker will load its own copy")
+        initargs = (None, model_type, model_params, threads)
+
+    # Spawn, as forking a process that already runs threads (or CUDA) is unsafe
+    return ProcessPoolExecutor(
+        max_workers=pool_size,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=initargs
+    )
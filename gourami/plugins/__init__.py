@@ -1,38 +1,120 @@
+import threading
+from typing import Any, Dict, List, Optional, Type
 from gourami.core.model import ChatModel
-from importlib.metadata import entry_points
+from importlib.metadata import EntryPoint, entry_points
 from gourami.core.config import get_settings
 
-def get_model(model_type: str) -> ChatModel:
+ENTRY_POINT_GROUP = "gourami.model_plugins"
+
+# Model types of the form custom.<name> are loaded from <name>.py in the custom
+# plugins directory, see CustomModelLoader
+CUSTOM_PREFIX = "custom."
+
+
+class PluginRegistry:
+    """
+    Resolves model types to the ChatModel classes implementing them.
+
+    The installed plugins are indexed once from their entry points, as listing
+    them scans every installed distribution. A plugin is only imported when its
+    type is requested, so the SDKs of unused plugins are never imported, and
+    its class is kept for later requests. Custom plugins are loaded again when
+    their file changes.
+    """
+    def __init__(self, group: str = ENTRY_POINT_GROUP):
+        self.group = group
+        self._index: Optional[Dict[str, EntryPoint]] = None
+        self._classes: Dict[str, Type[ChatModel]] = {}
+        # Models are loaded from executor threads
+        self._lock = threading.Lock()
+
+    def index(self) -> Dict[str, EntryPoint]:
+        """
+        Return the entry points of the installed plugins, by model type.
+        """
+        with self._lock:
+            if self._index is None:
+                self._index = {ep.name: ep for ep in entry_points().select(group=self.group)}
+            return self._index
+
+    def model_types(self) -> List[str]:
+        """
+        Return the model types of the installed plugins and of the custom plugins.
+        """
+        from gourami.plugins.custom_plugin import CustomModelLoader
+
+        custom = [CUSTOM_PREFIX + name for name in CustomModelLoader.list_custom_models()]
+        return list(self.index()) + custom
+
+    def get_model_class(self, model_type: str) -> Type[ChatModel]:
+        """
+        Return the ChatModel class registered for a model type, without instantiating it.
+
+        Raises:
+            ValueError: If no matching model plugin is found
+        """
+        if model_type.startswith(CUSTOM_PREFIX):
+            from gourami.plugins.custom_plugin import CustomModelLoader
+            return CustomModelLoader.load_custom_model_class(model_type[len(CUSTOM_PREFIX):])
+
+        ModelClass = self._classes.get(model_type)
+        if ModelClass is not None:
+            return ModelClass
+
+        entry_point = self.index().get(model_type)
+        if entry_point is None:
+            raise ValueError(f"No model plugin found for {model_type}")
+
+        with self._lock:
+            if model_type not in self._classes:
+                self._classes[model_type] = entry_point.load()
+            return self._classes[model_type]
+
+    def invalidate(self):
+        """
+        Forget the index and the loaded classes, e.g. after installing a plugin.
+        """
+        with self._lock:
+            self._index = None
+            self._classes.clear()
+
+
+plugins = PluginRegistry()
+
+
+def get_model_class(model_type: str) -> Type[ChatModel]:
+    """
+    Return the ChatModel class registered for a model type, without instantiating it.
+
+    Raises:
+        ValueError: If no matching model plugin is found
+    """
+    return plugins.get_model_class(model_type)
+
+def get_model(model_type: str, model_params: Optional[Dict[str, Any]] = None) -> ChatModel:
     """
     Dynamically load a model plugin based on model type and name.
-    
+
     Args:
-        model_type (str): The type of model (e.g., 'openai')
-    
+        model_type (str): The type of model (e.g., 'openai', or 'custom.<name>' for a custom plugin)
+        model_params (dict): Parameters of the model, defaults to the `model_params` setting
+
     Returns:
         ChatModel: An instantiated model that implements the ChatModel interface
-    
+
     Raises:
         ValueError: If no matching model plugin is found
     """
-    settings = get_settings()
+    if model_params is None:
+        model_params = get_settings().model_params
 
     try:
-        # Select entry points for the specified group
-        eps = entry_points().select(group='gourami.model_plugins')
-        
-        # Look for an entry point that matches the model type and name
-        for ep in eps:
-            if f"{model_type}" == ep.name:
-                ModelClass = ep.load()
-                 # Get the config class from the model
-                ConfigClass = ModelClass.get_config_class()       
-                # Create config instance with settings
-                config = ConfigClass(**settings.model_params)
-                return ModelClass(config)
-        
-        # If no entry point is found, raise an error
-        raise ValueError(f"No model plugin found for {model_type}")
-    
+        ModelClass = get_model_class(model_type)
+        # Get the config class from the model
+        ConfigClass = ModelClass.get_config_class()
+        # Create config instance with settings
+        config = ConfigClass(**model_params)
+        return ModelClass(config)
+
     except Exception as e:
-        raise ValueError(f"Error loading model plugin: {e}")
\ No newline at end of file
+        raise ValueError(f"Error loading model plugin: {e}")
@@ -1,5 +1,10 @@
-from typing import Optional, Type
+from typing import AsyncIterator, Iterator, Optional, Type
+from gourami.core.cancellation import abort_on_cancel
+from gourami.core.metrics import record_tokens, stage
 from gourami.core.model import BaseModelConfig, ChatModel
+from gourami.core.config import get_settings
+from gourami.core.sessions import Session
+from gourami.plugins.http_transport import Hedger, async_http_client, http_client, upstream_timeout
 from pydantic import Field
 
 class AnthropicConfig(BaseModelConfig):
@@ -9,6 +14,10 @@ class AnthropicConfig(BaseModelConfig):
     top_k: Optional[int] = Field(default=None, ge=0)
 
 class AnthropicModel(ChatModel):
+    supports_async = True
+    supports_sessions = True
+    request_params = ChatModel.request_params + ("top_p", "top_k")
+
     @classmethod
     def get_config_class(cls) -> Type[BaseModelConfig]:
         return AnthropicConfig
@@ -20,16 +29,76 @@ class AnthropicModel(ChatModel):
         if not api_key:
             raise ValueError("Anthropic API key is required")
         
-        self.client = anthropic.Anthropic(api_key=api_key)
+        # Pooled connections shared with the other API plugins, the SDK retries with jittered backoff
+        max_retries = get_settings().UPSTREAM_MAX_RETRIES
+        self.client = anthropic.Anthropic(
+            api_key=api_key,
+            http_client=http_client(),
+            timeout=upstream_timeout(),
+            max_retries=max_retries
+        )
+        self.async_client = anthropic.AsyncAnthropic(
+            api_key=api_key,
+            http_client=async_http_client(),
+            timeout=upstream_timeout(),
+            max_retries=max_retries
+        )
+        self.hedger = Hedger.from_settings()
         self.config = config
     
-    def predict(self, message: str) -> str:
-        kwargs = {k: v for k, v in self.config.dict().items() 
-                 if v is not None and k not in ['api_key']}
-        
-        response = self.client.messages.create(
+    def _messages(self, message: str, session: Optional[Session]) -> list:
+        if session is not None:
+            return session.conversation(message)
+        return [{"role": "user", "content": message}]
+
+    def _request_kwargs(self) -> dict:
+        return {k: v for k, v in self.config.dict().items() 
+                if v is not None and k not in ['api_key', 'model_name']}
+
+    def _record_usage(self, usage):
+        record_tokens(input_tokens=usage.input_tokens, output_tokens=usage.output_tokens)
+
+    def predict(self, message: str, session: Optional[Session] = None) -> str:
+        with stage("upstream"):
+            response = self.client.messages.create(
+                model=self.config.model_name,
+                messages=self._messages(message, session),
+                **self._request_kwargs()
+            )
+        self._record_usage(response.usage)
+        return response.content[0].text
+
+    def stream(self, message: str, session: Optional[Session] = None) -> Iterator[str]:
+        with stage("upstream"), self.client.messages.stream(
             model=self.config.model_name,
-            messages=[{"role": "user", "content": message}],
-            **kwargs
-        )
-        return response.content[0].text
\ No newline at end of file
+            messages=self._messages(message, session),
+            **self._request_kwargs()
+        ) as stream, abort_on_cancel(stream.close):
+            # Closing the stream interrupts a read waiting for the next chunk
+            for text in stream.text_stream:
+                yield text
+            self._record_usage(stream.get_final_message().usage)
+
+    async def apredict(self, message: str, session: Optional[Session] = None) -> str:
+        def call():
+            return self.async_client.messages.create(
+                model=self.config.model_name,
+                messages=self._messages(message, session),
+                **self._request_kwargs()
+            )
+
+        with stage("upstream"):
+            response = await (self.hedger.run(call) if self.hedger is not None else call())
+        self._record_usage(response.usage)
+        return response.content[0].text
+
+    async def astream(self, message: str, session: Optional[Session] = None) -> AsyncIterator[str]:
+        with stage("upstream"):
+            async with self.async_client.messages.stream(
+                model=self.config.model_name,
+                messages=self._messages(message, session),
+                **self._request_kwargs()
+            ) as stream:
+                async for text in stream.text_stream:
+                    yield text
+                self._record_usage((await stream.get_final_message()).usage)
@@ -1,120 +1,143 @@
 import os
 import importlib.util
 import sys
-from pathlib import Path
-from typing import Optional
+import threading
+from typing import Dict, List, Optional, Tuple, Type
 from gourami.core.model import ChatModel
 
 class CustomModelLoader:
     """
     Manages loading of custom model plugins from a designated directory.
+
+    A plugin is a `<name>.py` file defining a ChatModel subclass, served with
+    the model type `custom.<name>`. Loaded classes are kept until their file
+    is modified.
     """
     DEFAULT_PLUGIN_DIR = os.path.expanduser("~/.gourami/plugins")
 
+    # Classes loaded from plugin files, by path, with the modification time of the file
+    _classes: Dict[str, Tuple[int, Type[ChatModel]]] = {}
+    _lock = threading.Lock()
+
     @classmethod
     def ensure_plugin_dir(cls) -> str:
         """
-        Ensure the custom plugins directory exists.
-        
+        Ensure the custom plugins directory exists, with a sample template when it's created.
+
         Returns:
             str: Path to the custom plugins directory
         """
+        if os.path.isdir(cls.DEFAULT_PLUGIN_DIR):
+            return cls.DEFAULT_PLUGIN_DIR
+
         os.makedirs(cls.DEFAULT_PLUGIN_DIR, exist_ok=True)
-        
-        # Create a sample template if no plugins exist
+
         template_path = os.path.join(cls.DEFAULT_PLUGIN_DIR, 'custom_model_template.py')
-        if not os.path.exists(template_path):
-            with open(template_path, 'w') as f:
-                f.write("""from gourami.core.model import ChatModel
+        with open(template_path, 'w') as f:
+            f.write("""from typing import Type
+from gourami.core.model import BaseModelConfig, ChatModel
 
 class CustomChatModel(ChatModel):
+    @classmethod
+    def get_config_class(cls) -> Type[BaseModelConfig]:
+        return BaseModelConfig
+
+    def __init__(self, config: BaseModelConfig):
+        self.config = config
+
     def predict(self, message: str, **kwargs) -> str:
         \"\"\"
         Implement your custom model's prediction logic here.
-        
+
         Args:
             message (str): The input message to process
             **kwargs: Additional generation parameters
-        
+
         Returns:
             str: The model's response
         \"\"\"
         # Example implementation
         return f"Custom model response to: {message}"
 """)
-        
+
         return cls.DEFAULT_PLUGIN_DIR
 
     @classmethod
-    def load_custom_model(cls, model_name: str) -> Optional[ChatModel]:
+    def list_custom_models(cls) -> List[str]:
         """
-        Dynamically load a custom model plugin from the plugins directory.
-        
+        Return the names of the plugins in the custom plugins directory.
+        """
+        if not os.path.isdir(cls.DEFAULT_PLUGIN_DIR):
+            return []
+        return sorted(
+            name[:-len(".py")]
+            for name in os.listdir(cls.DEFAULT_PLUGIN_DIR)
+            if name.endswith(".py") and not name.startswith("_")
+        )
+
+    @classmethod
+    def load_custom_model_class(cls, model_name: str) -> Type[ChatModel]:
+        """
+        Return the ChatModel subclass defined by a custom plugin, importing its
+        file if it wasn't imported yet or was modified since.
+
         Args:
             model_name (str): Name of the model file (without .py extension)
-        
+
         Returns:
-            Optional[ChatModel]: Instantiated custom model or None if not found
+            Type[ChatModel]: The first ChatModel subclass defined in the file
+
+        Raises:
+            ValueError: If the file doesn't exist or defines no ChatModel subclass
         """
-        plugin_dir = cls.ensure_plugin_dir()
-        plugin_path = os.path.join(plugin_dir, f"{model_name}.py")
-        
-        if not os.path.exists(plugin_path):
-            return None
-        
+        plugin_path = os.path.join(cls.DEFAULT_PLUGIN_DIR, f"{model_name}.py")
         try:
-            # Dynamically import the module
-            spec = importlib.util.spec_from_file_location(model_name, plugin_path)
+            mtime = os.stat(plugin_path).st_mtime_ns
+        except FileNotFoundError:
+            raise ValueError(f"Custom model {model_name} not found in {cls.ensure_plugin_dir()}")
+
+        with cls._lock:
+            cached = cls._classes.get(plugin_path)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+
+            # Dynamically import the module, under a name that can't shadow another module
+            module_name = f"gourami_custom_plugins.{model_name}"
+            spec = importlib.util.spec_from_file_location(module_name, plugin_path)
             module = importlib.util.module_from_spec(spec)
-            sys.modules[model_name] = module
-            spec.loader.exec_module(module)
-            
-            # Find and instantiate the first ChatModel subclass
-            for name, cls in module.__dict__.items():
-                if (isinstance(cls, type) and 
-                    issubclass(cls, ChatModel) and 
-                    cls is not ChatModel):
-                    return cls()
-            
+            sys.modules[module_name] = module
+            try:
+                spec.loader.exec_module(module)
+            except BaseException:
+                del sys.modules[module_name]
+                raise
+
+            # Find the first ChatModel subclass defined in the file
+            for value in module.__dict__.values():
+                if (isinstance(value, type) and
+                    issubclass(value, ChatModel) and
+                    value.__module__ == module_name):
+                    cls._classes[plugin_path] = (mtime, value)
+                    return value
+
             raise ValueError(f"No ChatModel subclass found in {model_name}.py")
-        
-        except Exception as e:
+
+    @classmethod
+    def load_custom_model(cls, model_name: str, model_params: Optional[dict] = None) -> Optional[ChatModel]:
+        """
+        Dynamically load a custom model plugin from the plugins directory.
+
+        Args:
+            model_name (str): Name of the model file (without .py extension)
+            model_params (dict): Parameters of the model
+
+        Returns:
+            Optional[ChatModel]: Instantiated custom model or None if not found
+        """
+        from gourami.plugins import CUSTOM_PREFIX, get_model
+
+        try:
+            return get_model(CUSTOM_PREFIX + model_name, model_params or {})
+        except ValueError as e:
             print(f"Error loading custom model {model_name}: {e}")
             return None
-
-# Modified plugin loading function
-def get_model(model_type: str, model_name: str) -> ChatModel:
-    """
-    Unified model loading function supporting entry point and custom plugins.
-    
-    Args:
-        model_type (str): Type of model (e.g., 'openai', 'anthropic', 'custom')
-        model_name (str): Name of the specific model
-    
-    Returns:
-        ChatModel: Instantiated model
-    
-    Raises:
-        ValueError: If no suitable model is found
-    """
-    if model_type == 'custom':
-        # Try loading from custom plugins directory
-        custom_model = CustomModelLoader.load_custom_model(model_name)
-        if custom_model:
-            return custom_model
-        raise ValueError(f"Custom model {model_name} not found")
-    
-    # Fallback to entry point loading for other model types
-    try:
-        from importlib.metadata import entry_points
-        
-        eps = entry_points().select(group='gourami.model_plugins')
-        for ep in eps:
-            if f"{model_type}.{model_name}" == ep.name:
-                ModelClass = ep.load()
-                return ModelClass()
-        
-        raise ValueError(f"No model plugin found for {model_type}.{model_name}")
-    
-    except Exception as e:
-        raise ValueError(f"Error loading model plugin: {e}")
\ No newline at end of file
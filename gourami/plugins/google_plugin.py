@@ -1,5 +1,9 @@
-from typing import Optional, Type
+from typing import AsyncIterator, Iterator, Optional, Type
+from gourami.core.metrics import record_tokens, stage
 from gourami.core.model import BaseModelConfig, ChatModel
+from gourami.core.config import get_settings
+from gourami.core.sessions import Session
+from gourami.plugins.http_transport import Hedger
 from pydantic import Field
 
 class GoogleConfig(BaseModelConfig):
@@ -10,6 +14,10 @@ class GoogleConfig(BaseModelConfig):
     top_k: Optional[int] = Field(default=None, ge=0)
 
 class GoogleModel(ChatModel):
+    supports_async = True
+    supports_sessions = True
+    request_params = ChatModel.request_params + ("top_p", "top_k")
+
     @classmethod
     def get_config_class(cls) -> Type[BaseModelConfig]:
         return GoogleConfig
@@ -23,14 +31,90 @@ class GoogleModel(ChatModel):
         
         genai.configure(api_key=api_key)
         self.model = genai.GenerativeModel(config.model_name)
+        self.hedger = Hedger.from_settings()
         self.config = config
     
-    def predict(self, message: str) -> str:
-        generation_config = {k: v for k, v in self.config.dict().items() 
-                           if v is not None and k not in ['api_key', 'model_name']}
-        
-        response = self.model.generate_content(
-            message, 
-            generation_config=generation_config
-        )
-        return response.text
\ No newline at end of file
+    def _contents(self, message: str, session: Optional[Session]):
+        if session is None:
+            return message
+        # Gemini names the assistant role "model"
+        return [
+            {"role": "model" if turn["role"] == "assistant" else "user", "parts": [turn["content"]]}
+            for turn in session.conversation(message)
+        ]
+
+    def _generation_config(self) -> dict:
+        return {k: v for k, v in self.config.dict().items() 
+                if v is not None and k not in ['api_key', 'model_name']}
+
+    def _request_options(self, asynchronous: bool = False) -> dict:
+        # The SDK talks gRPC over its own channel, only deadlines and retries can be set
+        from google.api_core import retry, retry_async
+
+        settings = get_settings()
+        options = {"timeout": settings.UPSTREAM_TIMEOUT}
+        if settings.UPSTREAM_MAX_RETRIES:
+            # Exponential backoff with jitter, for as long as the attempts could take
+            retry_class = retry_async.AsyncRetry if asynchronous else retry.Retry
+            options["retry"] = retry_class(
+                predicate=retry.if_transient_error,
+                initial=0.5,
+                maximum=8,
+                timeout=settings.UPSTREAM_TIMEOUT * (settings.UPSTREAM_MAX_RETRIES + 1)
+            )
+        return options
+
+    def _record_usage(self, response):
+        # Streamed responses aggregate the usage once fully iterated
+        usage = response.usage_metadata
+        if usage:
+            record_tokens(input_tokens=usage.prompt_token_count, output_tokens=usage.candidates_token_count)
+
+    def predict(self, message: str, session: Optional[Session] = None) -> str:
+        with stage("upstream"):
+            response = self.model.generate_content(
+                self._contents(message, session), 
+                generation_config=self._generation_config(),
+                request_options=self._request_options()
+            )
+        self._record_usage(response)
+        return response.text
+
+    def stream(self, message: str, session: Optional[Session] = None) -> Iterator[str]:
+        with stage("upstream"):
+            response = self.model.generate_content(
+                self._contents(message, session),
+                generation_config=self._generation_config(),
+                stream=True,
+                request_options=self._request_options()
+            )
+            for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+        self._record_usage(response)
+
+    async def apredict(self, message: str, session: Optional[Session] = None) -> str:
+        def call():
+            return self.model.generate_content_async(
+                self._contents(message, session),
+                generation_config=self._generation_config(),
+                request_options=self._request_options(asynchronous=True)
+            )
+
+        with stage("upstream"):
+            response = await (self.hedger.run(call) if self.hedger is not None else call())
+        self._record_usage(response)
+        return response.text
+
+    async def astream(self, message: str, session: Optional[Session] = None) -> AsyncIterator[str]:
+        with stage("upstream"):
+            response = await self.model.generate_content_async(
+                self._contents(message, session),
+                generation_config=self._generation_config(),
+                stream=True,
+                request_options=self._request_options(asynchronous=True)
+            )
+            async for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+        self._record_usage(response)
@@ -0,0 +1,141 @@
+import asyncio
+import functools
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional, TypeVar
+from gourami.core.config import get_settings
+
+T = TypeVar("T")
+
+# HTTP clients shared by the remote-API plugins, created on first use
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _shared_client(kind: str):
+    import httpx
+
+    with _clients_lock:
+        if kind not in _clients:
+            settings = get_settings()
+            limits = httpx.Limits(
+                max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.UPSTREAM_MAX_KEEPALIVE,
+                keepalive_expiry=settings.UPSTREAM_KEEPALIVE_EXPIRY
+            )
+            client_class = httpx.AsyncClient if kind == "async" else httpx.Client
+            _clients[kind] = client_class(limits=limits, timeout=upstream_timeout(), follow_redirects=True)
+        return _clients[kind]
+
+
+def http_client():
+    """
+    The pooled, keep-alive httpx.Client shared by the synchronous API clients.
+    """
+    return _shared_client("sync")
+
+
+def async_http_client():
+    """
+    The pooled, keep-alive httpx.AsyncClient shared by the asynchronous API clients.
+    """
+    return _shared_client("async")
+
+
+def upstream_timeout():
+    """
+    Per-attempt timeout of upstream requests, as an httpx.Timeout.
+    """
+    import httpx
+
+    settings = get_settings()
+    return httpx.Timeout(settings.UPSTREAM_TIMEOUT, connect=settings.UPSTREAM_CONNECT_TIMEOUT)
+
+
+class Hedger:
+    """
+    Hedges slow requests: when a request hasn't completed after the `percentile`
+    of recent latencies, an identical one is sent and whichever completes first wins.
+
+    Nothing is hedged until `min_samples` latencies have been observed. Roughly
+    (100 - percentile)% of requests are sent twice, which is billed upstream.
+    The latencies are those of the first requests sent, from when they were
+    sent: a first request beaten by its hedge is left to complete in the
+    background so that its latency counts too, otherwise the slowest ones
+    would never be sampled and requests would be hedged more and more often.
+    """
+    def __init__(
+        self,
+        percentile: float = 95,
+        min_samples: int = 20,
+        window: int = 256,
+        min_delay: float = 0.05
+    ):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self._latencies: Deque[float] = deque(maxlen=window)
+
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    @classmethod
+    def from_settings(cls) -> Optional["Hedger"]:
+        """Return a Hedger if hedging is enabled in the settings, None otherwise."""
+        settings = get_settings()
+        if not settings.UPSTREAM_HEDGING:
+            return None
+        return cls(percentile=settings.UPSTREAM_HEDGE_PERCENTILE)
+
+    def delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, None while there are too few samples."""
+        if len(self._latencies) < self.min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return max(self.min_delay, ordered[index])
+
+    async def run(self, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Await `call()`, calling it a second time if the first call is slow.
+
+        Raises:
+            Exception: The error of the last call to fail, if none succeeds
+        """
+        self.requests += 1
+        sent = time.monotonic()
+        primary = asyncio.ensure_future(call())
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.delay())
+            if not done:
+                self.hedged += 1
+                tasks.append(asyncio.ensure_future(call()))
+
+            while True:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tasks.remove(task)
+                    if task.exception() is None:
+                        if task is primary:
+                            self._latencies.append(time.monotonic() - sent)
+                        else:
+                            self.hedge_wins += 1
+                            if primary in tasks:
+                                # Left to complete, its latency is sampled then
+                                tasks.remove(primary)
+                                primary.add_done_callback(functools.partial(self._sample, sent))
+                        return task.result()
+                    if not tasks:
+                        raise task.exception()
+        finally:
+            # The hedge lost, or the caller went away
+            for task in tasks:
+                task.cancel()
+
+    def _sample(self, sent: float, primary: asyncio.Future):
+        if primary.cancelled() or primary.exception() is not None:
+            return
+        self._latencies.append(time.monotonic() - sent)
@@ -1,5 +1,17 @@
-from typing import Optional, Type
+from typing import Iterator, List, Literal, Optional, Type
 from gourami.core.model import BaseModelConfig, ChatModel
+from gourami.core.metrics import stage
+from gourami.core.sessions import Session
+from gourami.plugins.transformers_common import (
+    cancellation_kwargs,
+    encode_conversation,
+    generate_session,
+    optimize_for_cpu,
+    record_generation,
+    speculative_generate_kwargs,
+    stream_generate,
+    stream_session,
+)
 from pydantic import Field
 
 class HuggingFaceConfig(BaseModelConfig):
@@ -10,8 +22,16 @@ class HuggingFaceConfig(BaseModelConfig):
     num_beams: int = Field(default=1, ge=1)
     device: str = Field(default="cpu")
     hf_token: Optional[str] = Field(default=None)
+    quantization: Optional[Literal["int8"]] = Field(default=None)
+    torch_compile: bool = Field(default=False)
+    assistant_model_name: Optional[str] = Field(default=None)
+    prompt_lookup_num_tokens: Optional[int] = Field(default=None, gt=0)
 
 class HuggingFaceModel(ChatModel):
+    supports_batching = True
+    supports_sessions = True
+    request_params = ChatModel.request_params + ("top_p", "top_k", "repetition_penalty")
+
     @classmethod
     def get_config_class(cls) -> Type[BaseModelConfig]:
         return HuggingFaceConfig
@@ -28,18 +48,118 @@ class HuggingFaceModel(ChatModel):
             self.model = AutoModelForCausalLM.from_pretrained(config.model_name)
         
         self.model.to(config.device)
+
+        if config.quantization or config.torch_compile:
+            if config.device != "cpu":
+                raise ValueError("Quantization and torch_compile are only supported on CPU")
+            self.model = optimize_for_cpu(self.model, config.quantization, config.torch_compile)
+
+        assistant_model = None
+        if config.assistant_model_name:
+            if config.hf_token:
+                assistant_model = AutoModelForCausalLM.from_pretrained(config.assistant_model_name, token=config.hf_token)
+            else:
+                assistant_model = AutoModelForCausalLM.from_pretrained(config.assistant_model_name)
+            assistant_model.to(config.device)
+
+        self.speculation = speculative_generate_kwargs(self.model, assistant_model, config.prompt_lookup_num_tokens)
+        if self.speculation:
+            if config.num_beams > 1:
+                raise ValueError("Speculative decoding doesn't support beam search")
+            # Drafts are verified one sequence at a time
+            self.supports_batching = False
+
+        # Decoder-only models must be padded on the left to be generated in batch
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
     
-    def predict(self, message: str) -> str:
-        inputs = self.tokenizer(message, return_tensors="pt").to(self.config.device)
-        
-        outputs = self.model.generate(
+    def share_memory(self) -> bool:
+        # Quantized weights aren't tensors of the model and compiled code can't be
+        # pickled, each worker then quantizes or compiles its own copy
+        if self.config.quantization or self.config.torch_compile:
+            return False
+
+        # CPU tensors move to shared memory, CUDA tensors are shared through IPC handles
+        self.model.share_memory()
+        return True
+
+    def memory_footprint(self) -> int:
+        return self.model.get_memory_footprint()
+
+    def count_tokens(self, message: str) -> Optional[int]:
+        return len(self.tokenizer.encode(message))
+
+    def _generate_kwargs(self, inputs) -> dict:
+        return dict(
             **inputs,
-            max_length=len(inputs.input_ids[0]) + self.config.max_tokens,
+            max_length=len(inputs["input_ids"][0]) + self.config.max_tokens,
             temperature=self.config.temperature,
             repetition_penalty=self.config.repetition_penalty,
             top_p=self.config.top_p,
             top_k=self.config.top_k,
             num_beams=self.config.num_beams,
+            **self.speculation,
+            **cancellation_kwargs(),
         )
+
+    def _session_generate_kwargs(self, session: Session, message: str) -> dict:
+        with stage("tokenize"):
+            input_ids = encode_conversation(self.tokenizer, session.conversation(message), self.config.device)
+        return self._generate_kwargs({"input_ids": input_ids})
+
+    def predict(self, message: str, session: Optional[Session] = None) -> str:
+        if session is not None:
+            generate_kwargs = self._session_generate_kwargs(session, message)
+            if self.config.num_beams == 1:
+                return generate_session(self.model, self.tokenizer, session, generate_kwargs)
+
+            # Beam search reorders the KV cache, it can't be carried over to the next turn
+            with stage("generate"):
+                outputs = self.model.generate(**generate_kwargs)
+            record_generation(generate_kwargs["input_ids"], outputs)
+            prompt_length = generate_kwargs["input_ids"].shape[1]
+            return self.tokenizer.decode(outputs[0][prompt_length:], skip_special_tokens=True).strip()
+
+        with stage("tokenize"):
+            inputs = self.tokenizer(message, return_tensors="pt").to(self.config.device)
         
-        return self.tokenizer.decode(outputs[0], skip_special_tokens=True)
\ No newline at end of file
+        with stage("generate"):
+            outputs = self.model.generate(**self._generate_kwargs(inputs))
+        record_generation(inputs["input_ids"], outputs)
+
+        # Only the reply, like stream and the session path
+        prompt_length = inputs["input_ids"].shape[1]
+        return self.tokenizer.decode(outputs[0][prompt_length:], skip_special_tokens=True).strip()
+
+    def predict_batch(self, messages: List[str]) -> List[str]:
+        if self.speculation:
+            return super().predict_batch(messages)
+
+        inputs = self.tokenizer(messages, return_tensors="pt", padding=True).to(self.config.device)
+
+        outputs = self.model.generate(**self._generate_kwargs(inputs))
+
+        # The prompts are left-padded to the same length, the replies follow them
+        responses = self.tokenizer.batch_decode(outputs[:, inputs["input_ids"].shape[1]:], skip_special_tokens=True)
+        return [response.strip() for response in responses]
+
+    def stream(self, message: str, session: Optional[Session] = None) -> Iterator[str]:
+        # Beam search can't be streamed, fall back to a single chunk
+        if self.config.num_beams > 1:
+            yield from super().stream(message, session=session)
+            return
+
+        if session is not None:
+            yield from stream_session(
+                self.model,
+                self.tokenizer,
+                session,
+                self._session_generate_kwargs(session, message)
+            )
+            return
+
+        with stage("tokenize"):
+            inputs = self.tokenizer(message, return_tensors="pt").to(self.config.device)
+
+        yield from stream_generate(self.model, self.tokenizer, self._generate_kwargs(inputs))
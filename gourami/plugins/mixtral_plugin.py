@@ -1,5 +1,16 @@
-from typing import Optional, Type
+from typing import Iterator, List, Optional, Type
 from gourami.core.model import BaseModelConfig, ChatModel
+from gourami.core.metrics import stage
+from gourami.core.sessions import Session
+from gourami.plugins.transformers_common import (
+    cancellation_kwargs,
+    encode_conversation,
+    generate_session,
+    record_generation,
+    speculative_generate_kwargs,
+    stream_generate,
+    stream_session,
+)
 from pydantic import Field
 
 class MixtralConfig(BaseModelConfig):
@@ -11,8 +22,14 @@ class MixtralConfig(BaseModelConfig):
     torch_dtype: str = Field(default="float16")
     low_cpu_mem_usage: bool = Field(default=True)
     hf_token: Optional[str] = Field(default=None)
+    assistant_model_name: Optional[str] = Field(default=None)
+    prompt_lookup_num_tokens: Optional[int] = Field(default=None, gt=0)
 
 class MixtralModel(ChatModel):
+    supports_batching = True
+    supports_sessions = True
+    request_params = ChatModel.request_params + ("do_sample", "top_p", "top_k")
+
     @classmethod
     def get_config_class(cls) -> Type[BaseModelConfig]:
         return MixtralConfig
@@ -43,31 +60,126 @@ class MixtralModel(ChatModel):
             **model_kwargs
         )
         
+        assistant_model = None
+        if config.assistant_model_name:
+            assistant_model = AutoModelForCausalLM.from_pretrained(
+                config.assistant_model_name,
+                **model_kwargs
+            )
+
+        self.speculation = speculative_generate_kwargs(self.model, assistant_model, config.prompt_lookup_num_tokens)
+        if self.speculation:
+            # Drafts are verified one sequence at a time
+            self.supports_batching = False
+        
         self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.tokenizer.padding_side = "left"
         self.config = config
     
-    def predict(self, message: str) -> str:
+    def share_memory(self) -> bool:
+        # CPU tensors move to shared memory, CUDA tensors are shared through IPC handles
+        self.model.share_memory()
+        return True
+
+    def memory_footprint(self) -> int:
+        return self.model.get_memory_footprint()
+
+    def count_tokens(self, message: str) -> Optional[int]:
+        return len(self.tokenizer.encode(message))
+
+    def _generate_kwargs(self) -> dict:
+        generate_kwargs = {k: v for k, v in self.config.dict().items() 
+                         if v is not None and k not in ['model_name', 'device', 'torch_dtype', 'low_cpu_mem_usage', 'hf_token', 'max_tokens',
+                                                        'assistant_model_name', 'prompt_lookup_num_tokens']}
+        generate_kwargs['max_new_tokens'] = self.config.max_tokens
+        generate_kwargs.update(self.speculation)
+        generate_kwargs.update(cancellation_kwargs())
+        return generate_kwargs
+
+    def _encode(self, message: str):
+        with stage("tokenize"):
+            messages = [{"role": "user", "content": message}]
+            return self.tokenizer.apply_chat_template(
+                messages, 
+                return_tensors="pt", 
+                add_generation_prompt=True
+            ).to(self.model.device)
+
+    def _session_generate_kwargs(self, session: Session, message: str) -> dict:
+        with stage("tokenize"):
+            input_ids = encode_conversation(self.tokenizer, session.conversation(message), self.model.device)
+        return {'input_ids': input_ids, **self._generate_kwargs()}
+
+    def predict(self, message: str, session: Optional[Session] = None) -> str:
         import torch
+
+        if session is not None:
+            return generate_session(
+                self.model,
+                self.tokenizer,
+                session,
+                self._session_generate_kwargs(session, message)
+            )
         
-        messages = [{"role": "user", "content": message}]
-        inputs = self.tokenizer.apply_chat_template(
-            messages, 
-            return_tensors="pt", 
-            add_generation_prompt=True
-        ).to(self.model.device)
-        
-        generate_kwargs = {k: v for k, v in self.config.dict().items() 
-                         if v is not None and k not in ['model_name', 'device', 'torch_dtype', 'low_cpu_mem_usage', 'hf_token']}
+        inputs = self._encode(message)
         
-        with torch.no_grad():
+        with stage("generate"), torch.no_grad():
             outputs = self.model.generate(
                 inputs, 
-                **generate_kwargs
+                **self._generate_kwargs()
             )
+        record_generation(inputs, outputs)
         
         response = self.tokenizer.decode(
             outputs[0][inputs.shape[1]:], 
             skip_special_tokens=True
         ).strip()
         
-        return response
\ No newline at end of file
+        return response
+
+    def predict_batch(self, messages: List[str]) -> List[str]:
+        if self.speculation:
+            return super().predict_batch(messages)
+
+        import torch
+
+        conversations = [[{"role": "user", "content": message}] for message in messages]
+        inputs = self.tokenizer.apply_chat_template(
+            conversations,
+            return_tensors="pt",
+            return_dict=True,
+            padding=True,
+            add_generation_prompt=True
+        ).to(self.model.device)
+
+        with torch.no_grad():
+            outputs = self.model.generate(
+                inputs["input_ids"],
+                attention_mask=inputs["attention_mask"],
+                **self._generate_kwargs()
+            )
+
+        responses = self.tokenizer.batch_decode(
+            outputs[:, inputs["input_ids"].shape[1]:],
+            skip_special_tokens=True
+        )
+        return [response.strip() for response in responses]
+
+    def stream(self, message: str, session: Optional[Session] = None) -> Iterator[str]:
+        if session is not None:
+            yield from stream_session(
+                self.model,
+                self.tokenizer,
+                session,
+                self._session_generate_kwargs(session, message)
+            )
+            return
+
+        inputs = self._encode(message)
+
+        # generate() runs under no_grad on its own thread
+        yield from stream_generate(
+            self.model,
+            self.tokenizer,
+            {'input_ids': inputs, **self._generate_kwargs()}
+        )
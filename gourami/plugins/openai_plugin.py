@@ -1,5 +1,10 @@
-from typing import Optional, Type
+from typing import AsyncIterator, Iterator, Optional, Type
+from gourami.core.cancellation import abort_on_cancel
+from gourami.core.metrics import record_tokens, stage
 from gourami.core.model import BaseModelConfig, ChatModel
+from gourami.core.config import get_settings
+from gourami.core.sessions import Session
+from gourami.plugins.http_transport import Hedger, async_http_client, http_client, upstream_timeout
 from pydantic import Field
 
 class OpenAIConfig(BaseModelConfig):
@@ -10,6 +15,10 @@ class OpenAIConfig(BaseModelConfig):
 
 
 class OpenAIModel(ChatModel):
+    supports_async = True
+    supports_sessions = True
+    request_params = ChatModel.request_params + ("presence_penalty", "frequency_penalty")
+
     @classmethod
     def get_config_class(cls) -> Type[BaseModelConfig]:
         return OpenAIConfig
@@ -21,16 +30,88 @@ class OpenAIModel(ChatModel):
         if not api_key:
             raise ValueError("OpenAI API key is required.")
         
-        self.client = openai.OpenAI(api_key=api_key)
+        # Pooled connections shared with the other API plugins, the SDK retries with jittered backoff
+        max_retries = get_settings().UPSTREAM_MAX_RETRIES
+        self.client = openai.OpenAI(
+            api_key=api_key,
+            http_client=http_client(),
+            timeout=upstream_timeout(),
+            max_retries=max_retries
+        )
+        self.async_client = openai.AsyncOpenAI(
+            api_key=api_key,
+            http_client=async_http_client(),
+            timeout=upstream_timeout(),
+            max_retries=max_retries
+        )
+        self.hedger = Hedger.from_settings()
         self.config = config
     
-    def predict(self, message: str) -> str:
-        kwargs = {k: v for k, v in self.config.dict().items() 
-                 if v is not None and k not in ['api_key', 'model_name']}
-        
-        response = self.client.chat.completions.create(
-            model=self.config.model_name,
-            messages=[{"role": "user", "content": message}],
-            **kwargs
-        )
-        return response.choices[0].message.content
\ No newline at end of file
+    def _messages(self, message: str, session: Optional[Session]) -> list:
+        if session is not None:
+            return session.conversation(message)
+        return [{"role": "user", "content": message}]
+
+    def _request_kwargs(self) -> dict:
+        return {k: v for k, v in self.config.dict().items() 
+                if v is not None and k not in ['api_key', 'model_name']}
+
+    def _record_usage(self, usage):
+        if usage is not None:
+            record_tokens(input_tokens=usage.prompt_tokens, output_tokens=usage.completion_tokens)
+
+    def predict(self, message: str, session: Optional[Session] = None) -> str:
+        with stage("upstream"):
+            response = self.client.chat.completions.create(
+                model=self.config.model_name,
+                messages=self._messages(message, session),
+                **self._request_kwargs()
+            )
+        self._record_usage(response.usage)
+        return response.choices[0].message.content
+
+    def stream(self, message: str, session: Optional[Session] = None) -> Iterator[str]:
+        with stage("upstream"):
+            response = self.client.chat.completions.create(
+                model=self.config.model_name,
+                messages=self._messages(message, session),
+                stream=True,
+                # The usage comes in a last chunk without choices
+                stream_options={"include_usage": True},
+                **self._request_kwargs()
+            )
+            # Closing the response interrupts a read waiting for the next chunk
+            with response, abort_on_cancel(response.close):
+                for chunk in response:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+                    self._record_usage(chunk.usage)
+
+    async def apredict(self, message: str, session: Optional[Session] = None) -> str:
+        def call():
+            return self.async_client.chat.completions.create(
+                model=self.config.model_name,
+                messages=self._messages(message, session),
+                **self._request_kwargs()
+            )
+
+        with stage("upstream"):
+            response = await (self.hedger.run(call) if self.hedger is not None else call())
+        self._record_usage(response.usage)
+        return response.choices[0].message.content
+
+    async def astream(self, message: str, session: Optional[Session] = None) -> AsyncIterator[str]:
+        with stage("upstream"):
+            response = await self.async_client.chat.completions.create(
+                model=self.config.model_name,
+                messages=self._messages(message, session),
+                stream=True,
+                stream_options={"include_usage": True},
+                **self._request_kwargs()
+            )
+            # Also closes the upstream stream when the request is cancelled
+            async with response:
+                async for chunk in response:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+                    self._record_usage(chunk.usage)
@@ -0,0 +1,67 @@
+import hashlib
+import random
+from typing import Iterator, List, Optional, Type
+from gourami.core import cancellation
+from gourami.core.metrics import record_tokens
+from gourami.core.model import BaseModelConfig, ChatModel
+from gourami.core.sessions import Session
+from pydantic import Field
+
+# Words the synthetic responses are made of
+_VOCABULARY = (
+    "the a gourami swims in warm water near plants and bubbles while light falls on "
+    "leaves of the tank every morning before food arrives from above quietly"
+).split()
+
+class SyntheticConfig(BaseModelConfig):
+    output_tokens: int = Field(default=64, gt=0)
+    first_token_latency_ms: float = Field(default=50, ge=0)
+    token_latency_ms: float = Field(default=10, ge=0)
+    seed: int = Field(default=0)
+
+class SyntheticModel(ChatModel):
+    """
+    A model that doesn't need a GPU nor the network, to benchmark the server.
+
+    Responses are made of `min(output_tokens, max_tokens)` words, picked
+    deterministically from the message and the seed. Generation sleeps for
+    `first_token_latency_ms`, then `token_latency_ms` per word. A batch is
+    generated in the time of its longest response, like on a GPU. Generation
+    stops early when the request is cancelled.
+    """
+    supports_batching = True
+    supports_sessions = True
+    request_params = ChatModel.request_params + ("output_tokens",)
+
+    @classmethod
+    def get_config_class(cls) -> Type[BaseModelConfig]:
+        return SyntheticConfig
+
+    def __init__(self, config: SyntheticConfig):
+        self.config = config
+
+    def _tokens(self, message: str) -> List[str]:
+        digest = hashlib.sha256(f"{self.config.seed}:{message}".encode("utf-8")).digest()
+        rng = random.Random(digest)
+        count = min(self.config.output_tokens, self.config.max_tokens)
+        return [rng.choice(_VOCABULARY) for _ in range(count)]
+
+    def predict(self, message: str, session: Optional[Session] = None) -> str:
+        return "".join(self.stream(message, session=session))
+
+    def predict_batch(self, messages: List[str]) -> List[str]:
+        responses = [self._tokens(message) for message in messages]
+        longest = max(len(tokens) for tokens in responses)
+        cancellation.sleep((self.config.first_token_latency_ms + longest * self.config.token_latency_ms) / 1000)
+        return [" ".join(tokens) for tokens in responses]
+
+    def stream(self, message: str, session: Optional[Session] = None) -> Iterator[str]:
+        tokens = self._tokens(message)
+        record_tokens(input_tokens=len(message.split()), output_tokens=len(tokens))
+
+        if cancellation.sleep(self.config.first_token_latency_ms / 1000):
+            return
+        for index, token in enumerate(tokens):
+            if cancellation.sleep(self.config.token_latency_ms / 1000):
+                return
+            yield token if index == 0 else " " + token
@@ -0,0 +1,326 @@
+import functools
+import weakref
+from contextvars import copy_context
+from threading import Thread
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from gourami.core.cancellation import CancellationToken, current_token
+from gourami.core.metrics import count_forward, record_tokens, stage
+from gourami.core.sessions import Session
+
+
+def _count_target_forward(module, args, output):
+    count_forward()
+
+
+def _count_draft_forward(module, args, output):
+    count_forward(draft=True)
+
+
+def speculative_generate_kwargs(model, assistant_model=None, prompt_lookup_num_tokens: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Set up speculative decoding: a small draft model (assisted generation), or
+    drafts looked up in the prompt (prompt lookup decoding) proposes several
+    tokens that the model verifies in a single forward pass.
+
+    Forward passes are counted, so that the acceptance rate is reported in the
+    request metrics.
+
+    Args:
+        model: The target transformers model
+        assistant_model: A smaller model sharing the target's tokenizer
+        prompt_lookup_num_tokens (int): Length of the drafts looked up in the prompt
+
+    Returns:
+        dict: The keyword arguments enabling it in `generate`, empty if neither is given
+    """
+    if assistant_model is not None and prompt_lookup_num_tokens is not None:
+        raise ValueError("Use either a draft model or prompt lookup decoding, not both")
+    if assistant_model is None and prompt_lookup_num_tokens is None:
+        return {}
+
+    # Module level hooks, as the model may be pickled for process pool workers
+    model.register_forward_hook(_count_target_forward)
+    if assistant_model is not None:
+        assistant_model.register_forward_hook(_count_draft_forward)
+        return {"assistant_model": assistant_model}
+    return {"prompt_lookup_num_tokens": prompt_lookup_num_tokens}
+
+
+@functools.lru_cache(maxsize=None)
+def _cancellation_criteria_class():
+    # transformers is only imported by the plugins using it
+    import torch
+    from transformers import StoppingCriteria
+
+    class CancellationCriteria(StoppingCriteria):
+        """Stops every sequence of the generation once its request is cancelled."""
+        def __init__(self, token: CancellationToken):
+            self.token = token
+
+        def __call__(self, input_ids, scores, **kwargs):
+            return torch.full((input_ids.shape[0],), self.token.cancelled, dtype=torch.bool, device=input_ids.device)
+
+    return CancellationCriteria
+
+
+def cancellation_kwargs() -> Dict[str, Any]:
+    """
+    Make `generate` stop after the current decoding step once the current
+    request is cancelled (see gourami.core.cancellation), instead of going on
+    to `max_tokens`.
+
+    Returns:
+        dict: The keyword arguments to pass to `generate`, empty outside of a request
+    """
+    token = current_token.get()
+    if token is None:
+        return {}
+
+    from transformers import StoppingCriteriaList
+
+    return {"stopping_criteria": StoppingCriteriaList([_cancellation_criteria_class()(token)])}
+
+
+def optimize_for_cpu(model, quantization: Optional[str] = None, torch_compile: bool = False):
+    """
+    Speed up a model running on CPU.
+
+    Args:
+        model: A transformers model, already on the CPU
+        quantization (str): "int8" to quantize the weights of the linear layers
+            to 8 bits, their activations are quantized on the fly (dynamic
+            quantization). This reduces their memory 4x and uses integer kernels.
+        torch_compile (bool): Compile the forward pass with torch.compile. The first
+            generations, and those with new input shapes, are slower while it compiles.
+
+    Returns:
+        The optimized model
+    """
+    import torch
+
+    if quantization == "int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    elif quantization is not None:
+        raise ValueError(f"Unsupported quantization: {quantization}")
+
+    if torch_compile:
+        # Prompt and cache lengths change with every call
+        model.forward = torch.compile(model.forward, dynamic=True)
+
+    return model
+
+
+def record_generation(input_ids, outputs):
+    """
+    Report the token counts of a generation to the current request's metrics.
+
+    Args:
+        input_ids (torch.Tensor): The prompt, with shape (1, length)
+        outputs (torch.Tensor): The token ids returned by generate, prompt included
+    """
+    record_tokens(input_tokens=input_ids.shape[1], output_tokens=outputs.shape[1] - input_ids.shape[1])
+
+
+def stream_generate(
+    model,
+    tokenizer,
+    generate_kwargs: Dict[str, Any],
+    on_complete: Optional[Callable[[Any], None]] = None
+) -> Iterator[str]:
+    """
+    Run `model.generate` in a background thread and yield decoded text deltas.
+
+    Args:
+        model: A transformers model exposing `generate`
+        tokenizer: The tokenizer used to decode the generated tokens
+        generate_kwargs (dict): Keyword arguments forwarded to `generate`
+        on_complete (callable): Called with the output of `generate` once it's done
+
+    Yields:
+        str: Newly generated text, excluding the prompt
+    """
+    from transformers import TextIteratorStreamer
+
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    results = []
+    errors = []
+
+    def run():
+        try:
+            outputs = model.generate(**generate_kwargs, streamer=streamer)
+            results.append(outputs)
+            if on_complete is not None:
+                on_complete(outputs)
+        except Exception as e:
+            # Unblock the consumer, otherwise it would wait forever on the streamer
+            errors.append(e)
+            streamer.end()
+
+    with stage("generate"):
+        # Run in the request's context, for the forward pass counters
+        thread = Thread(target=copy_context().run, args=(run,), daemon=True)
+        thread.start()
+        try:
+            for text in streamer:
+                if text:
+                    yield text
+        finally:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+    record_generation(generate_kwargs["input_ids"], results[0])
+
+
+def encode_conversation(tokenizer, messages: List[Dict[str, str]], device):
+    """
+    Tokenize a conversation, ready for the model to generate the next assistant turn.
+
+    Uses the tokenizer's chat template when it has one, otherwise the turns are
+    simply joined by new lines.
+
+    Returns:
+        torch.Tensor: The input ids, with shape (1, length)
+    """
+    if tokenizer.chat_template:
+        return tokenizer.apply_chat_template(
+            messages,
+            return_tensors="pt",
+            add_generation_prompt=True
+        ).to(device)
+
+    transcript = "\n".join(message["content"] for message in messages) + "\n"
+    return tokenizer(transcript, return_tensors="pt").input_ids.to(device)
+
+
+class KVCacheState:
+    """
+    Session state of the transformers plugins: the KV cache of the transcript,
+    the token ids it was computed from and the model that computed it.
+    """
+    def __init__(self, model):
+        from transformers import DynamicCache
+
+        self.cache = DynamicCache()
+        self.token_ids = None
+        self.model_ref = weakref.ref(model)
+
+    def nbytes(self) -> int:
+        return sum(
+            tensor.numel() * tensor.element_size()
+            for tensor in self.cache.key_cache + self.cache.value_cache
+        )
+
+
+def reuse_kv_cache(session: Session, model, input_ids):
+    """
+    Return the KV cache of a session, trimmed to the tokens it shares with `input_ids`.
+
+    Generation then only needs to prefill the new tokens. If the session has no
+    state, because it's new or its state was evicted, an empty cache is
+    returned and the whole conversation is recomputed.
+
+    Args:
+        session (Session): The conversation
+        model: The model about to generate the next turn
+        input_ids (torch.Tensor): The tokenized conversation, with shape (1, length)
+
+    Returns:
+        KVCacheState: The state to pass to generate and then to save_kv_cache
+    """
+    state = session.state
+    # The conversation may have moved to another model since the cache was computed
+    if not isinstance(state, KVCacheState) or state.token_ids is None or state.model_ref() is not model:
+        return KVCacheState(model)
+
+    cached_length = state.cache.get_seq_length()
+    previous = state.token_ids[:cached_length].to(input_ids.device)
+    current = input_ids[0, :cached_length]
+
+    # Length of the common prefix of the cached tokens and the new input
+    length = min(previous.shape[0], current.shape[0])
+    mismatches = (previous[:length] != current[:length]).nonzero()
+    common = int(mismatches[0]) if len(mismatches) else length
+
+    # At least one token has to go through the model to generate from it
+    common = min(common, input_ids.shape[1] - 1)
+    if common < cached_length:
+        state.cache.crop(common)
+
+    return state
+
+
+def save_kv_cache(session: Session, state: KVCacheState, sequences):
+    """
+    Store the KV cache updated by generate in the session.
+
+    Args:
+        session (Session): The conversation
+        state (KVCacheState): The state returned by reuse_kv_cache
+        sequences (torch.Tensor): The token ids returned by generate, prompt included
+    """
+    state.token_ids = sequences[0].detach()
+    session.state = state
+    session.state_bytes = state.nbytes()
+
+
+def generate_session(model, tokenizer, session: Session, generate_kwargs: Dict[str, Any]) -> str:
+    """
+    Generate the next turn of a conversation, reusing the session's KV cache.
+
+    Args:
+        model: A transformers model exposing `generate`
+        tokenizer: The tokenizer used to decode the generated tokens
+        session (Session): The conversation
+        generate_kwargs (dict): Keyword arguments forwarded to `generate`, including
+            the `input_ids` of the whole conversation (see encode_conversation)
+
+    Returns:
+        str: The response
+    """
+    import torch
+
+    input_ids = generate_kwargs["input_ids"]
+    state = reuse_kv_cache(session, model, input_ids)
+
+    try:
+        with stage("generate"), torch.no_grad():
+            outputs = model.generate(
+                **generate_kwargs,
+                attention_mask=torch.ones_like(input_ids),
+                past_key_values=state.cache
+            )
+    except Exception:
+        # The cache may have been partially updated
+        session.drop_state()
+        raise
+
+    save_kv_cache(session, state, outputs)
+    record_generation(input_ids, outputs)
+    return tokenizer.decode(outputs[0][input_ids.shape[1]:], skip_special_tokens=True).strip()
+
+
+def stream_session(model, tokenizer, session: Session, generate_kwargs: Dict[str, Any]) -> Iterator[str]:
+    """
+    Like generate_session, but yield the response as text deltas.
+    """
+    import torch
+
+    input_ids = generate_kwargs["input_ids"]
+    state = reuse_kv_cache(session, model, input_ids)
+    generate_kwargs = {
+        **generate_kwargs,
+        "attention_mask": torch.ones_like(input_ids),
+        "past_key_values": state.cache
+    }
+
+    try:
+        yield from stream_generate(
+            model,
+            tokenizer,
+            generate_kwargs,
+            on_complete=lambda outputs: save_kv_cache(session, state, outputs)
+        )
+    except Exception:
+        session.drop_state()
+        raise
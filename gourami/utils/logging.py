@@ -1,20 +1,32 @@
-import datetime
+import atexit
+import copy
 import json
 import logging
+import queue
+import random
 import sys
+import threading
+import time
 from uvicorn.logging import DefaultFormatter
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
+from typing import Optional
 from gourami.core.config import get_settings
 
+# Logger of the per-message lines (received, sent...), which can be sampled
+MESSAGES_LOGGER = "app.messages"
+
+# Writes the records queued by the application on a background thread
+_listener: Optional[QueueListener] = None
+
+
 class CustomFormatter(logging.Formatter):
     """
-    Custom formatter that includes timestamp and log level.
+    Formats records as JSON lines, with a UTC timestamp and the log level.
     """
     def format(self, record):
-        timestamp = datetime.utcnow().isoformat()
         log_data = {
-            "timestamp": timestamp,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
             "level": record.levelname,
             "message": record.getMessage(),
             "module": record.module,
@@ -22,16 +34,107 @@ class CustomFormatter(logging.Formatter):
         }
 
         # Add exception info if present
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            log_data["exception"] = record.exc_text
+
+        return json.dumps(log_data, ensure_ascii=False)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Hands records over to the QueueListener without ever waiting on it.
+
+    When the queue is full, e.g. because the disk can't keep up, records are
+    dropped and counted rather than stalling the caller.
+    """
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Render the message now, as its arguments may change before the listener
+        # gets to it, but keep the traceback apart for the JSON formatter
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
         if record.exc_info:
-            log_data["exception"] = self.formatException(record.exc_info)
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Lets through a fraction of the records below WARNING.
+    """
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class StreamToLogger:
+    """
+    File-like object forwarding what is written to it to a logger, a record per
+    line. Lines keep their indentation, so that tables (e.g. pstats reports)
+    stay readable, and a line written in several calls (as print does) is
+    logged once complete.
+    """
+    def __init__(self, logger, level=logging.INFO):
+        self.logger = logger
+        self.level = level
+        self._buffer = ""
+        self._lock = threading.Lock()
+
+    def write(self, message):
+        with self._lock:
+            *lines, self._buffer = (self._buffer + message).split("\n")
+        for line in lines:
+            if line.strip():  # Avoid logging empty lines
+                self.logger.log(self.level, line.rstrip())
+        return len(message)
+
+    def flush(self):
+        with self._lock:
+            line, self._buffer = self._buffer, ""
+        if line.strip():
+            self.logger.log(self.level, line.rstrip())
+
+    def isatty(self):
+        return False
+
+
+def stop_logging():
+    """
+    Write out the queued records and stop the background writer.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
 
-        return json.dumps(log_data)
 
 def setup_logging():
     """
     Set up logging configuration.
+
+    The application only puts records on a queue. Formatting and writing to the
+    console and log files happen on a QueueListener thread, so logging never
+    blocks the event loop.
     """
-    settings = get_settings()  
+    settings = get_settings()
+
+    stop_logging()
 
     # Create logger
     logger = logging.getLogger("app")
@@ -41,22 +144,26 @@ def setup_logging():
     if logger.hasHandlers():
         logger.handlers.clear()
 
-    # Console handler with color formatting
-    console_handler = logging.StreamHandler(sys.stdout)
+    handlers = []
+
+    # Console handler with color formatting, bound to the real stdout in case it gets captured below
+    console_handler = logging.StreamHandler(sys.__stdout__)
     console_handler.setLevel(logging.INFO)
     console_handler.setFormatter(DefaultFormatter(
         fmt="%(levelprefix)s %(message)s",
         use_colors=True
     ))
-    logger.addHandler(console_handler)
+    handlers.append(console_handler)
 
     # Skip file handlers if DISABLE_LOGGING is set to True
     if not settings.DISABLE_LOGGING:
-        
+
         # Create logs directory if it doesn't exist
         logs_dir = Path("logs")
         logs_dir.mkdir(exist_ok=True)
 
+        formatter = CustomFormatter()
+
         # File handlers for info and error logs
         info_handler = RotatingFileHandler(
             "logs/info.log",
@@ -65,8 +172,8 @@ def setup_logging():
             encoding="utf-8"
         )
         info_handler.setLevel(logging.INFO)
-        info_handler.setFormatter(CustomFormatter())
-        logger.addHandler(info_handler)
+        info_handler.setFormatter(formatter)
+        handlers.append(info_handler)
 
         error_handler = RotatingFileHandler(
             "logs/error.log",
@@ -75,26 +182,29 @@ def setup_logging():
             encoding="utf-8"
         )
         error_handler.setLevel(logging.ERROR)
-        error_handler.setFormatter(CustomFormatter())
-        logger.addHandler(error_handler)
-    else:
-        logger.info("Logging is disabled. Log files won't be generated.")
+        error_handler.setFormatter(formatter)
+        handlers.append(error_handler)
 
-    # Force lib logs to use application logger
-    class StreamToLogger:
-        def __init__(self, logger, level=logging.INFO):
-            self.logger = logger
-            self.level = level
+    log_queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    logger.addHandler(NonBlockingQueueHandler(log_queue))
 
-        def write(self, message):
-            if message.strip():  # Avoid logging empty messages
-                self.logger.log(self.level, message.strip())
+    global _listener
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
 
-        def flush(self):
-            pass
+    if settings.DISABLE_LOGGING:
+        logger.info("Logging is disabled. Log files won't be generated.")
 
-    sys.stdout = StreamToLogger(logger, logging.INFO)
-    sys.stderr = StreamToLogger(logger, logging.ERROR)
+    # Per-message lines can be sampled under load, warnings and errors are always kept
+    messages_logger = logging.getLogger(MESSAGES_LOGGER)
+    messages_logger.filters.clear()
+    if settings.LOG_SAMPLE_RATE < 1:
+        messages_logger.addFilter(SamplingFilter(settings.LOG_SAMPLE_RATE))
 
-    return logger
+    # Optionally force lib output (prints, progress bars...) to go through the logger
+    if settings.CAPTURE_STDOUT:
+        sys.stdout = StreamToLogger(logger, logging.INFO)
+        sys.stderr = StreamToLogger(logger, logging.ERROR)
 
+    return logger
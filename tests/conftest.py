@@ -0,0 +1,47 @@
+import time
+import pytest
+
+ADMIN_TOKEN = "admin-secret"
+
+# The server the route tests talk to, serving the synthetic plugin
+SERVER_SETTINGS = {
+    "model_type": "synthetic",
+    "model_params": {"output_tokens": 8, "first_token_latency_ms": 5, "token_latency_ms": 5},
+    "pool_size": 2,
+    "max_in_flight_per_connection": 2,
+    "admin_token": ADMIN_TOKEN,
+}
+
+
+@pytest.fixture(scope="session")
+def app():
+    """
+    The FastAPI app, configured with SERVER_SETTINGS. The routes read their
+    settings when imported, so it's created once for the whole session.
+    """
+    pytest.importorskip("fastapi")
+    pytest.importorskip("httpx")
+    from gourami.core.config import configure_settings
+    configure_settings(params=SERVER_SETTINGS)
+
+    from gourami.plugins import plugins
+    from gourami.plugins.synthetic_plugin import SyntheticModel
+    # Runs from a checkout too, where the plugins' entry points aren't installed
+    plugins._classes.setdefault("synthetic", SyntheticModel)
+
+    from gourami.api.main import app
+    return app
+
+
+@pytest.fixture
+def client(app):
+    """
+    A client of the app, started (the default model preloaded) and stopped around the test.
+    """
+    from fastapi.testclient import TestClient
+    with TestClient(app) as client:
+        deadline = time.monotonic() + 10
+        while client.get("/readyz").status_code != 200:
+            assert time.monotonic() < deadline, "The default model wasn't preloaded in time"
+            time.sleep(0.01)
+        yield client
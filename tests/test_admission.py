@@ -0,0 +1,102 @@
+import asyncio
+import pytest
+from gourami.core.admission import AdmissionController, Overloaded
+
+
+async def hold(admission: AdmissionController, release: asyncio.Event, order: list, name: str, **kwargs):
+    async with admission.admit(**kwargs):
+        order.append(name)
+        await release.wait()
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_rejects_when_queue_full():
+    async def run():
+        admission = AdmissionController(max_concurrency=1, max_queue=1)
+        release = asyncio.Event()
+        order = []
+        running = asyncio.create_task(hold(admission, release, order, "running"))
+        waiting = asyncio.create_task(hold(admission, release, order, "waiting"))
+        await settle()
+        assert admission.stats()["running"] == 1 and admission.queue_depth == 1
+
+        with pytest.raises(Overloaded):
+            async with admission.admit():
+                pass
+        assert admission.rejected == 1
+
+        release.set()
+        await asyncio.gather(running, waiting)
+        assert order == ["running", "waiting"]
+        assert admission.stats()["running"] == 0 and admission.queue_depth == 0
+
+    asyncio.run(run())
+
+
+def test_queue_wait_times_out():
+    async def run():
+        admission = AdmissionController(max_concurrency=1, max_queue=4, queue_timeout=0.05)
+        release = asyncio.Event()
+        running = asyncio.create_task(hold(admission, release, [], "running"))
+        await settle()
+
+        with pytest.raises(Overloaded):
+            async with admission.admit():
+                pass
+        assert admission.timed_out == 1
+        assert admission.queue_depth == 0
+
+        release.set()
+        await running
+        assert admission.stats()["running"] == 0
+
+    asyncio.run(run())
+
+
+def test_cancel_while_queued_leaves_the_queue():
+    async def run():
+        admission = AdmissionController(max_concurrency=1, max_queue=4)
+        release = asyncio.Event()
+        order = []
+        running = asyncio.create_task(hold(admission, release, order, "running"))
+        cancelled = asyncio.create_task(hold(admission, release, order, "cancelled", client="a"))
+        waiting = asyncio.create_task(hold(admission, release, order, "waiting"))
+        await settle()
+        assert admission.queue_depth == 2
+
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        assert admission.queue_depth == 1
+        # Its client no longer counts against the per-client limit
+        assert admission._per_client == {}
+
+        release.set()
+        await asyncio.gather(running, waiting)
+        assert order == ["running", "waiting"]
+        assert admission.stats()["running"] == 0
+
+    asyncio.run(run())
+
+
+def test_per_client_limit():
+    async def run():
+        admission = AdmissionController(max_concurrency=4, max_per_client=1)
+        release = asyncio.Event()
+        first = asyncio.create_task(hold(admission, release, [], "first", client="a"))
+        await settle()
+
+        with pytest.raises(Overloaded):
+            async with admission.admit(client="a"):
+                pass
+        # Other clients are still admitted
+        async with admission.admit(client="b"):
+            pass
+
+        release.set()
+        await first
+
+    asyncio.run(run())
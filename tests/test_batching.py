@@ -0,0 +1,89 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from gourami.core.batching import BatchScheduler
+from gourami.core.engine import ModelEngine
+from gourami.plugins.synthetic_plugin import SyntheticConfig, SyntheticModel
+
+
+class RecordingModel:
+    def __init__(self, fail: bool = False):
+        self.batches = []
+        self.fail = fail
+
+    def predict_batch(self, messages):
+        self.batches.append(list(messages))
+        if self.fail:
+            raise RuntimeError("model failed")
+        return [message.upper() for message in messages]
+
+
+def test_concurrent_requests_run_as_one_batch():
+    async def run():
+        model = RecordingModel()
+        scheduler = BatchScheduler(model.predict_batch, ThreadPoolExecutor(max_workers=1), max_batch_size=4, window_ms=50)
+        responses = await asyncio.gather(*(scheduler.submit(f"m{i}") for i in range(6)))
+        assert responses == [f"M{i}" for i in range(6)]
+        # Full batches leave right away, the rest after the window
+        assert model.batches == [["m0", "m1", "m2", "m3"], ["m4", "m5"]]
+
+    asyncio.run(run())
+
+
+def test_a_lone_request_waits_for_the_window_only():
+    async def run():
+        model = RecordingModel()
+        scheduler = BatchScheduler(model.predict_batch, ThreadPoolExecutor(max_workers=1), max_batch_size=8, window_ms=10)
+        assert await asyncio.wait_for(scheduler.submit("alone"), timeout=1) == "ALONE"
+        assert model.batches == [["alone"]]
+
+    asyncio.run(run())
+
+
+def test_errors_reach_every_request_of_the_batch():
+    async def run():
+        scheduler = BatchScheduler(RecordingModel(fail=True).predict_batch, ThreadPoolExecutor(max_workers=1), max_batch_size=2)
+        results = await asyncio.gather(scheduler.submit("a"), scheduler.submit("b"), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+    asyncio.run(run())
+
+
+def test_requests_gone_before_the_batch_runs_are_left_out():
+    async def run():
+        model = RecordingModel()
+        scheduler = BatchScheduler(model.predict_batch, ThreadPoolExecutor(max_workers=1), max_batch_size=8, window_ms=20)
+        leaving = asyncio.create_task(scheduler.submit("leaving"))
+        staying = asyncio.create_task(scheduler.submit("staying"))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        assert await staying == "STAYING"
+        assert model.batches == [["staying"]]
+
+    asyncio.run(run())
+
+
+def test_invalid_batch_size():
+    with pytest.raises(ValueError):
+        BatchScheduler(RecordingModel().predict_batch, ThreadPoolExecutor(max_workers=1), max_batch_size=0)
+
+
+class RecordingSynthetic(SyntheticModel):
+    def __init__(self, config):
+        super().__init__(config)
+        self.batches = []
+
+    def predict_batch(self, messages):
+        self.batches.append(len(messages))
+        return super().predict_batch(messages)
+
+
+def test_engine_batches_concurrent_predictions():
+    async def run():
+        model = RecordingSynthetic(SyntheticConfig(output_tokens=4, first_token_latency_ms=0, token_latency_ms=0))
+        engine = ModelEngine(model, ThreadPoolExecutor(max_workers=1), batch_max_size=4, batch_window_ms=50)
+        responses = await asyncio.gather(*(engine.predict(f"m{i}") for i in range(4)))
+        assert responses == [model.predict(f"m{i}") for i in range(4)]
+        assert model.batches == [4]
+
+    asyncio.run(run())
@@ -0,0 +1,97 @@
+import asyncio
+import json
+from gourami.cli.batch import run_job
+from gourami.core.bulk import load_checkpoint, parse_items, run_bulk
+from gourami.plugins.synthetic_plugin import SyntheticConfig, SyntheticModel
+
+
+def items_of(*lines):
+    return [(item.id, item.message, item.error) for item in parse_items(lines)]
+
+
+def test_ids_default_to_the_line_number():
+    lines = ["plain text", "", '{"message": "no id"}', '{"id": 1, "message": "explicit"}']
+    assert items_of(*lines) == [
+        ("line-1", "plain text", None),
+        ("line-3", "no id", None),
+        (1, "explicit", None),
+    ]
+
+
+def test_unreadable_lines_are_reported_by_line():
+    results = items_of('{"id": [1], "message": "a"}', '{"id": true, "message": "b"}', "{nope", '{"id": "x"}')
+    assert [item_id for item_id, message, error in results if message is None and error] == ["line-1", "line-2", "line-3", "line-4"]
+
+
+def test_duplicate_ids_are_rejected():
+    results = items_of('{"id": "line-2", "message": "a"}', "b", '{"id": 7, "message": "c"}', '{"id": 7, "message": "d"}')
+    assert results == [
+        ("line-2", "a", None),
+        ("line-2", None, "Duplicate id: line-2"),
+        (7, "c", None),
+        ("line-4", None, "Duplicate id: 7"),
+    ]
+
+
+async def echo_batch(messages):
+    return [message.upper() for message in messages]
+
+
+async def run(items, **kwargs):
+    return [result async for result in run_bulk(items, echo_batch, **kwargs)]
+
+
+def test_run_bulk_answers_every_message_once():
+    lines = [f'{{"id": {i}, "message": "{"x" * (i % 7)}m{i}"}}' for i in range(50)] + ["{bad"]
+    results = asyncio.run(run(parse_items(lines), batch_size=4, concurrency=3, window=16))
+    answered = {result["id"]: result["response"] for result in results if "response" in result}
+    assert answered == {i: ("x" * (i % 7) + f"m{i}").upper() for i in range(50)}
+    assert [result["id"] for result in results if "error" in result] == ["line-51"]
+
+
+def test_run_bulk_skips_answered_messages():
+    results = asyncio.run(run(parse_items(["a", "b", "c"]), skip={"line-2"}))
+    assert sorted(result["id"] for result in results) == ["line-1", "line-3"]
+
+
+def test_failed_batches_become_error_results():
+    async def fail(messages):
+        raise RuntimeError("model failed")
+
+    async def run_failing():
+        return [result async for result in run_bulk(parse_items(["a", "b"]), fail)]
+
+    assert asyncio.run(run_failing()) == [{"id": "line-1", "error": "model failed"}, {"id": "line-2", "error": "model failed"}]
+
+
+def test_resumed_job_skips_answered_messages(tmp_path):
+    source = tmp_path / "messages.jsonl"
+    source.write_text("\n".join(['{"id": "a", "message": "first"}', "second", '{"message": "third"}']) + "\n")
+    output = tmp_path / "results.jsonl"
+    # Interrupted while writing its second result
+    output.write_text(json.dumps({"id": "a", "response": "done"}) + "\n" + '{"id": "line-2", "resp')
+
+    assert load_checkpoint(str(output)) == {"a"}
+    model = SyntheticModel(SyntheticConfig(output_tokens=2, first_token_latency_ms=0, token_latency_ms=0))
+    report = asyncio.run(run_job(model, str(source), str(output), 8, 2, 1024, resume=True))
+
+    assert report["answered"] == 2 and report["skipped"] == 1
+    results = [json.loads(line) for line in output.read_text().splitlines()]
+    assert sorted(result["id"] for result in results) == ["a", "line-2", "line-3"]
+
+
+def test_batch_endpoint(client):
+    body = "\n".join(['{"id": "q1", "message": "hello"}', "plain", '{"id": "q1", "message": "again"}']) + "\n"
+    response = client.post("/batch", content=body.encode("utf-8"), params={"batch_size": 2})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    results = {result["id"]: result for result in map(json.loads, response.text.splitlines())}
+    assert set(results) == {"q1", "line-2", "line-3"}
+    assert "response" in results["q1"] and "response" in results["line-2"]
+    assert results["line-3"]["error"] == "Duplicate id: q1"
+
+
+def test_batch_endpoint_rejects_invalid_bodies(client):
+    assert client.post("/batch", content=b"\xff\xfe").status_code == 400
+    assert client.post("/batch", params={"model": "unknown"}, content=b"hello").status_code == 404
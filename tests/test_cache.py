@@ -0,0 +1,90 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from gourami.core.cache import ResponseCache, make_cache_key
+from gourami.core.engine import ModelEngine
+from gourami.plugins.synthetic_plugin import SyntheticConfig, SyntheticModel
+
+
+def test_key_depends_on_model_and_message():
+    config = {"model_name": "opt", "temperature": 0.7}
+    key = make_cache_key("huggingface", config, "hello")
+    assert key == make_cache_key("huggingface", dict(config), "hello")
+    assert key != make_cache_key("huggingface", {**config, "temperature": 0.2}, "hello")
+    assert key != make_cache_key("openai", config, "hello")
+    assert key != make_cache_key("huggingface", config, "hello!")
+
+
+def test_secrets_dont_change_the_key():
+    assert make_cache_key("openai", {"model_name": "gpt-4o", "api_key": "a"}, "hi") == \
+        make_cache_key("openai", {"model_name": "gpt-4o", "api_key": "b"}, "hi")
+
+
+def test_predictions_and_streams_are_keyed_apart():
+    assert make_cache_key("synthetic", {}, "hi") == make_cache_key("synthetic", {}, "hi", "predict")
+    assert make_cache_key("synthetic", {}, "hi", "stream") != make_cache_key("synthetic", {}, "hi")
+
+
+def test_least_recently_used_entries_evicted():
+    cache = ResponseCache(max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == ("1", "3")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_bounded_by_size():
+    cache = ResponseCache(max_bytes=10)
+    cache.set("a", "12345")
+    cache.set("b", "123456")
+    assert cache.get("a") is None and cache.get("b") == "123456"
+    # Larger than the whole cache, not kept
+    cache.set("c", "x" * 11)
+    assert cache.get("c") is None
+    assert cache.stats()["bytes"] == 6
+
+
+def test_entries_expire(monkeypatch):
+    cache = ResponseCache(ttl=10)
+    cache.set("a", "1")
+    now = time.time()
+    monkeypatch.setattr("gourami.core.cache.time.time", lambda: now + 11)
+    assert cache.get("a") is None
+
+
+def test_responses_survive_a_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    ResponseCache(path=path).set("a", "1")
+
+    restarted = ResponseCache(path=path)
+    assert restarted.get("a") == "1"
+    assert restarted.stats()["disk_hits"] == 1
+
+
+class CountingModel(SyntheticModel):
+    def __init__(self, config):
+        super().__init__(config)
+        # Shared with the copies made for per-request parameters
+        self.calls = []
+
+    def predict(self, message, session=None):
+        self.calls.append(message)
+        return super().predict(message, session=session)
+
+
+def test_engine_serves_repeated_messages_from_the_cache():
+    async def run():
+        model = CountingModel(SyntheticConfig(output_tokens=4, first_token_latency_ms=0, token_latency_ms=0))
+        engine = ModelEngine(model, ThreadPoolExecutor(max_workers=1), model_type="synthetic", cache=ResponseCache())
+        first = await engine.predict("hello")
+        assert await engine.predict("hello") == first
+        assert len(model.calls) == 1
+
+        # Other parameters, other responses
+        await engine.with_overrides({"output_tokens": 2}).predict("hello")
+        assert len(model.calls) == 2
+
+    asyncio.run(run())
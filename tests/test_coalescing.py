@@ -0,0 +1,140 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from gourami.core.coalescing import SingleFlight
+from gourami.core.engine import ModelEngine
+from gourami.plugins.synthetic_plugin import SyntheticConfig, SyntheticModel
+
+
+class Producer:
+    """A computation streaming `chunks`, one per `step` event, recording how often it started and whether it was cancelled."""
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.started = 0
+        self.cancelled = False
+        self.step = asyncio.Event()
+
+    async def produce(self):
+        self.started += 1
+        try:
+            for chunk in self.chunks:
+                await self.step.wait()
+                self.step.clear()
+                yield chunk
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+    async def run_to_end(self):
+        for _ in self.chunks:
+            self.step.set()
+            for _ in range(5):
+                await asyncio.sleep(0)
+
+
+async def collect(chunks):
+    return [chunk async for chunk in chunks]
+
+
+def test_concurrent_requests_share_one_computation():
+    async def run():
+        flight = SingleFlight()
+        producer = Producer(["a", "b", "c"])
+        first = asyncio.create_task(collect(flight.join("key", producer.produce)))
+        await asyncio.sleep(0)
+        producer.step.set()
+        await asyncio.sleep(0.01)
+        # Joins after the first chunk, and gets it too
+        second = asyncio.create_task(collect(flight.join("key", producer.produce)))
+        await producer.run_to_end()
+
+        assert await first == ["a", "b", "c"]
+        assert await second == ["a", "b", "c"]
+        assert producer.started == 1
+        assert flight.stats() == {"in_flight": 0, "started": 1, "coalesced": 1}
+
+    asyncio.run(run())
+
+
+def test_errors_reach_every_waiter():
+    async def run():
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("model failed")
+            yield
+
+        waiters = [asyncio.create_task(collect(flight.join("key", fail))) for _ in range(2)]
+        for waiter in waiters:
+            with pytest.raises(RuntimeError):
+                await waiter
+
+    asyncio.run(run())
+
+
+def test_computation_continues_while_a_waiter_remains():
+    async def run():
+        flight = SingleFlight()
+        producer = Producer(["a", "b"])
+        leaving = asyncio.create_task(collect(flight.join("key", producer.produce)))
+        staying = asyncio.create_task(collect(flight.join("key", producer.produce)))
+        await asyncio.sleep(0.01)
+
+        leaving.cancel()
+        await asyncio.gather(leaving, return_exceptions=True)
+        await producer.run_to_end()
+
+        assert await staying == ["a", "b"]
+        assert not producer.cancelled
+
+    asyncio.run(run())
+
+
+def test_computation_cancelled_once_every_waiter_left():
+    async def run():
+        flight = SingleFlight()
+        producer = Producer(["a", "b"])
+        waiters = [asyncio.create_task(collect(flight.join("key", producer.produce))) for _ in range(2)]
+        await asyncio.sleep(0.01)
+
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0.01)
+
+        assert producer.cancelled
+        assert flight.stats()["in_flight"] == 0
+
+        # The next request starts afresh
+        again = Producer(["c"])
+        request = asyncio.create_task(collect(flight.join("key", again.produce)))
+        await asyncio.sleep(0.01)
+        await again.run_to_end()
+        assert await request == ["c"]
+
+    asyncio.run(run())
+
+
+class CountingSynthetic(SyntheticModel):
+    def __init__(self, config):
+        super().__init__(config)
+        self.calls = []
+
+    def stream(self, message, session=None):
+        self.calls.append(message)
+        yield from super().stream(message, session)
+
+
+def test_engine_coalesces_identical_requests():
+    async def run():
+        model = CountingSynthetic(SyntheticConfig(output_tokens=4, first_token_latency_ms=20, token_latency_ms=5))
+        engine = ModelEngine(model, ThreadPoolExecutor(max_workers=4), model_type="synthetic", coalesce=True)
+        predicted = await asyncio.gather(engine.predict("hello"), engine.predict("hello"), engine.predict("other"))
+        streamed = "".join([chunk async for chunk in engine.stream("hello")])
+
+        assert predicted[0] == predicted[1] == streamed
+        # One prediction per distinct message, and the stream apart
+        assert sorted(model.calls) == ["hello", "hello", "other"]
+
+    asyncio.run(run())
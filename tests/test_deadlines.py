@@ -0,0 +1,66 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from gourami.core import cancellation
+from gourami.core.engine import ModelEngine
+from gourami.plugins.synthetic_plugin import SyntheticConfig, SyntheticModel
+
+
+def engine(coalesce: bool = False, request_timeout=None, **params) -> ModelEngine:
+    model = SyntheticModel(SyntheticConfig(**{"output_tokens": 10, "first_token_latency_ms": 10, "token_latency_ms": 20, **params}))
+    return ModelEngine(
+        model,
+        ThreadPoolExecutor(max_workers=2),
+        model_type="synthetic",
+        coalesce=coalesce,
+        request_timeout=request_timeout
+    )
+
+
+def test_deadline_stops_the_generation():
+    async def run():
+        served = engine()
+        with pytest.raises(cancellation.DeadlineExceeded):
+            await served.predict("hello", timeout=0.05)
+
+    asyncio.run(run())
+
+
+def test_stream_yields_the_chunks_produced_before_the_deadline():
+    async def run():
+        served = engine(request_timeout=0.1)
+        chunks = []
+        with pytest.raises(cancellation.DeadlineExceeded):
+            async for chunk in served.stream("hello"):
+                chunks.append(chunk)
+        assert 0 < len(chunks) < 10
+
+    asyncio.run(run())
+
+
+def test_coalesced_requests_keep_their_own_deadlines():
+    async def run():
+        served = engine(coalesce=True)
+        hurried = asyncio.create_task(served.predict("hello", timeout=0.05))
+        patient = asyncio.create_task(served.predict("hello"))
+
+        with pytest.raises(cancellation.DeadlineExceeded):
+            await hurried
+        # The shared generation went on for the request without a deadline
+        assert await patient == await engine().predict("hello")
+        assert served.single_flight.stats()["coalesced"] == 1
+
+    asyncio.run(run())
+
+
+def test_coalesced_generation_cancelled_once_every_request_expired():
+    async def run():
+        served = engine(coalesce=True)
+        requests = [asyncio.create_task(served.predict("hello", timeout=0.05)) for _ in range(2)]
+        for request in requests:
+            with pytest.raises(cancellation.DeadlineExceeded):
+                await request
+        await asyncio.sleep(0.01)
+        assert served.single_flight.stats()["in_flight"] == 0
+
+    asyncio.run(run())
@@ -0,0 +1,33 @@
+import asyncio
+
+
+def test_probes(client):
+    assert client.get("/livez").json() == {"status": "alive"}
+
+    ready = client.get("/readyz")
+    assert ready.status_code == 200
+    assert ready.json()["model"]["status"] == "loaded"
+    assert client.get("/health").json() == {"status": "healthy", "model_loaded": True}
+
+
+def test_not_ready_while_loading_or_after_a_failure(client, monkeypatch):
+    # Imported once the app is configured
+    from gourami.api import routes
+
+    loop = asyncio.new_event_loop()
+    try:
+        preload = loop.create_future()
+        monkeypatch.setattr(routes, "preload_task", preload)
+        assert client.get("/readyz").json()["status"] == "starting"
+
+        preload.set_result(False)
+        response = client.get("/readyz")
+        assert response.status_code == 503 and response.json()["status"] == "failed"
+
+        cancelled = loop.create_future()
+        cancelled.cancel()
+        monkeypatch.setattr(routes, "preload_task", cancelled)
+        response = client.get("/readyz")
+        assert response.status_code == 503 and response.json()["status"] == "cancelled"
+    finally:
+        loop.close()
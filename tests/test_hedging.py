@@ -0,0 +1,62 @@
+import asyncio
+from gourami.plugins.http_transport import Hedger
+
+
+def test_not_hedged_until_enough_samples():
+    async def run():
+        hedger = Hedger(min_samples=3)
+        calls = []
+
+        async def call():
+            calls.append(None)
+            return "ok"
+
+        for _ in range(3):
+            assert hedger.delay() is None
+            assert await hedger.run(call) == "ok"
+        assert len(calls) == 3 and hedger.hedged == 0
+        assert hedger.delay() == hedger.min_delay
+
+    asyncio.run(run())
+
+
+def test_slow_request_hedged_and_still_sampled():
+    async def run():
+        hedger = Hedger(percentile=50, min_samples=2, min_delay=0.01)
+        hedger._latencies.extend([0.01, 0.01])
+        latencies = iter([0.2, 0.01])
+
+        async def call():
+            await asyncio.sleep(next(latencies))
+            return "ok"
+
+        assert await hedger.run(call) == "ok"
+        assert (hedger.hedged, hedger.hedge_wins) == (1, 1)
+        assert len(hedger._latencies) == 2
+
+        # The first request was left to complete, its latency counts
+        await asyncio.sleep(0.25)
+        assert len(hedger._latencies) == 3
+        assert hedger._latencies[-1] >= 0.2
+
+    asyncio.run(run())
+
+
+def test_failures_fall_back_to_the_other_request():
+    async def run():
+        hedger = Hedger(min_samples=1, min_delay=0.01)
+        hedger._latencies.append(0.01)
+        attempts = []
+
+        async def call():
+            attempts.append(None)
+            if len(attempts) == 1:
+                await asyncio.sleep(0.05)
+                raise RuntimeError("upstream failed")
+            await asyncio.sleep(0.1)
+            return "ok"
+
+        assert await hedger.run(call) == "ok"
+        assert len(attempts) == 2
+
+    asyncio.run(run())
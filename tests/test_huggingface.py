@@ -0,0 +1,75 @@
+import pytest
+from gourami.plugins.huggingface_plugin import HuggingFaceConfig, HuggingFaceModel
+
+np = pytest.importorskip("numpy")
+
+PAD = 0
+REPLY = ["fine", "thanks"]
+
+
+class FakeEncoding(dict):
+    def to(self, device):
+        return self
+
+    @property
+    def input_ids(self):
+        return self["input_ids"]
+
+
+class FakeTokenizer:
+    """Splits on spaces, decodes tokens with a leading space like subword tokenizers do."""
+    pad_token = "<pad>"
+    eos_token = "<pad>"
+    chat_template = None
+
+    def __init__(self):
+        self.words = ["<pad>"]
+
+    def _id(self, word):
+        if word not in self.words:
+            self.words.append(word)
+        return self.words.index(word)
+
+    def encode(self, text):
+        return [self._id(word) for word in text.split()]
+
+    def __call__(self, text, return_tensors=None, padding=False):
+        texts = text if isinstance(text, list) else [text]
+        rows = [self.encode(text) for text in texts]
+        length = max(len(row) for row in rows)
+        # Padded on the left, like the plugin asks
+        return FakeEncoding(input_ids=np.array([[PAD] * (length - len(row)) + row for row in rows]))
+
+    def decode(self, ids, skip_special_tokens=False):
+        return "".join(" " + self.words[i] for i in ids if i != PAD)
+
+    def batch_decode(self, rows, skip_special_tokens=False):
+        return [self.decode(row, skip_special_tokens) for row in rows]
+
+
+class FakeCausalLM:
+    """Continues every prompt with REPLY."""
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+
+    def generate(self, input_ids, **kwargs):
+        reply = [self.tokenizer._id(word) for word in REPLY]
+        return np.array([list(row) + reply for row in input_ids])
+
+
+def plugin():
+    model = HuggingFaceModel.__new__(HuggingFaceModel)
+    model.config = HuggingFaceConfig()
+    model.tokenizer = FakeTokenizer()
+    model.model = FakeCausalLM(model.tokenizer)
+    model.speculation = {}
+    return model
+
+
+def test_predict_returns_only_the_reply():
+    assert plugin().predict("how are you") == "fine thanks"
+
+
+def test_predict_batch_returns_only_the_replies():
+    # Prompts of different lengths, padded to the longest
+    assert plugin().predict_batch(["hi", "how are you today"]) == ["fine thanks", "fine thanks"]
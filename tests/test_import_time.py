@@ -0,0 +1,46 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("pydantic_settings")
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Heavy modules that only the plugins using them may import, see benchmarks/import_time.py
+LAZY_MODULES = [
+    "openai",
+    "anthropic",
+    "google.generativeai",
+    "torch",
+    "transformers",
+    "sentence_transformers",
+    "numpy",
+]
+
+
+def imported_modules(module: str, tmp_path: Path) -> set:
+    """
+    Import a module in a new interpreter, with the default settings, and list what it imported.
+    """
+    env = {key: value for key, value in os.environ.items() if not key.startswith("GOURAMI_")}
+    env["PYTHONPATH"] = str(ROOT)
+    result = subprocess.run(
+        [sys.executable, "-c", f"import json, sys, {module}; sys.__stdout__.write(json.dumps(sorted(sys.modules)))"],
+        capture_output=True,
+        text=True,
+        cwd=tmp_path,
+        env=env
+    )
+    assert result.returncode == 0, result.stderr
+    # The last line, the server may log to stdout
+    return set(json.loads(result.stdout.strip().splitlines()[-1]))
+
+
+@pytest.mark.parametrize("module", ["gourami.cli.main", "gourami.api.main"])
+def test_startup_imports_no_plugin_sdk(module, tmp_path):
+    imported = imported_modules(module, tmp_path)
+    assert [name for name in LAZY_MODULES if name in imported] == []
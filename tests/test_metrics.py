@@ -0,0 +1,57 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from gourami.core import metrics
+from gourami.core.engine import ModelEngine
+from gourami.plugins.synthetic_plugin import SyntheticConfig, SyntheticModel
+
+
+def test_counter_renders_one_series_per_labels():
+    counter = metrics.Counter("test_total", "A test counter.", ["model", "outcome"])
+    counter.inc("a", "completed")
+    counter.inc("a", "completed")
+    counter.inc("b", 'quoted "x"', amount=0.5)
+    assert counter.render() == [
+        "# HELP test_total A test counter.",
+        "# TYPE test_total counter",
+        'test_total{model="a",outcome="completed"} 2',
+        'test_total{model="b",outcome="quoted \\"x\\""} 0.5',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram("test_seconds", "A test histogram.", ["model"], [0.1, 1.0])
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value, "a")
+    assert histogram.render()[2:] == [
+        'test_seconds_bucket{model="a",le="0.1"} 1',
+        'test_seconds_bucket{model="a",le="1.0"} 3',
+        'test_seconds_bucket{model="a",le="+Inf"} 4',
+        'test_seconds_sum{model="a"} 4.25',
+        'test_seconds_count{model="a"} 4',
+    ]
+
+
+def test_requests_recorded_by_served_model():
+    async def run():
+        model = SyntheticModel(SyntheticConfig(output_tokens=4, first_token_latency_ms=0, token_latency_ms=0))
+        engine = ModelEngine(model, ThreadPoolExecutor(max_workers=1), name="served-as", model_type="synthetic")
+        await engine.predict("hello")
+        assert "".join([chunk async for chunk in engine.stream("hello")])
+
+    asyncio.run(run())
+    rendered = metrics.render()
+    assert 'gourami_requests_total{model="served-as",model_type="synthetic",outcome="completed"} 2' in rendered
+    assert 'gourami_request_duration_seconds_count{model="served-as",model_type="synthetic",mode="stream"} 1' in rendered
+    assert 'gourami_time_to_first_token_seconds_count{model="served-as",model_type="synthetic"}' in rendered
+
+
+def test_metrics_endpoint(client):
+    with client.websocket_connect("/chat") as websocket:
+        websocket.send_text("hello")
+        websocket.receive_text()
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'model_type="synthetic",outcome="completed"}' in response.text
+    assert "# TYPE gourami_request_duration_seconds histogram" in response.text
@@ -0,0 +1,64 @@
+import json
+import pytest
+from gourami.api.protocol import InvalidRequest, parse_envelope
+
+
+def test_envelopes_are_validated():
+    request = parse_envelope('{"id": "r1", "message": "hi", "stream": true, "params": {"temperature": 0}, "timeout": 2}')
+    assert (request.id, request.message, request.stream, request.params, request.timeout) == ("r1", "hi", True, {"temperature": 0}, 2)
+    assert parse_envelope('{"id": "r2", "message": "hi"}').params == {}
+
+    with pytest.raises(InvalidRequest) as missing_id:
+        parse_envelope('{"message": "hi"}')
+    assert missing_id.value.request_id is None
+
+    for invalid in ('{"message": 1}', '{"message": "hi", "stream": "yes"}', '{"message": "hi", "timeout": 0}', '{"message": "hi", "timeout": true}'):
+        with pytest.raises(InvalidRequest) as error:
+            parse_envelope('{"id": "r3", ' + invalid[1:])
+        # Answered as an error of that request
+        assert error.value.request_id == "r3"
+
+
+def receive(websocket) -> dict:
+    return json.loads(websocket.receive_text())
+
+
+def test_responses_carry_the_id_of_their_request(client):
+    with client.websocket_connect("/chat?protocol=mux") as websocket:
+        websocket.send_text(json.dumps({"id": "slow", "message": "first", "params": {"output_tokens": 40}}))
+        websocket.send_text(json.dumps({"id": "fast", "message": "second", "stream": True}))
+        frames = [receive(websocket) for _ in range(10)]
+
+    # The fast request completes while the slow one is still generating
+    assert [frame["type"] for frame in frames] == ["delta"] * 8 + ["end", "message"]
+    assert {frame["id"] for frame in frames[:9]} == {"fast"} and frames[9]["id"] == "slow"
+    assert len(frames[9]["content"].split()) == 40
+
+
+def test_requests_over_the_in_flight_limit_are_busy(client):
+    with client.websocket_connect("/chat?protocol=mux") as websocket:
+        for i in range(3):
+            websocket.send_text(json.dumps({"id": f"r{i}", "message": f"message {i}", "params": {"output_tokens": 40}}))
+        frames = {frame["id"]: frame for frame in (receive(websocket) for _ in range(3))}
+
+    assert frames["r2"]["type"] == "busy" and frames["r2"]["retry_after"] > 0
+    assert frames["r0"]["type"] == frames["r1"]["type"] == "message"
+
+
+def test_invalid_and_expired_requests_are_errors(client):
+    with client.websocket_connect("/chat?protocol=mux") as websocket:
+        websocket.send_text("{nope")
+        assert receive(websocket)["type"] == "error"
+        websocket.send_text(json.dumps({"id": "r1", "message": "hi", "model": "unknown"}))
+        assert receive(websocket) == {"id": "r1", "type": "error", "message": "Unknown model: unknown"}
+        websocket.send_text(json.dumps({"id": "r2", "message": "slow", "params": {"output_tokens": 40}, "timeout": 0.05}))
+        assert receive(websocket) == {"id": "r2", "type": "error", "message": "Deadline exceeded"}
+
+
+def test_plain_clients_may_pipeline_messages(client):
+    # More than max_in_flight_per_connection: the reader waits rather than closing the connection
+    with client.websocket_connect("/chat") as websocket:
+        for i in range(8):
+            websocket.send_text(f"message {i}")
+        responses = [websocket.receive_text() for _ in range(8)]
+    assert all(len(response.split()) == 8 for response in responses)
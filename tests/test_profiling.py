@@ -0,0 +1,56 @@
+import json
+import threading
+from gourami.core import profiling, tracing
+from tests.conftest import ADMIN_TOKEN
+
+ADMIN = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
+
+
+def test_trace_reports_hops_since_receive():
+    trace = tracing.Trace()
+    origin = trace.hops["receive"]
+    trace.mark("start", origin + 0.002)
+    trace.mark("start", origin + 1)
+    trace.mark("send", origin + 0.005)
+
+    # Only the first mark counts, hops come in order
+    assert trace.to_dict()["hops_ms"] == {"receive": 0.0, "start": 2.0, "send": 5.0}
+
+
+def test_sampled_stacks_are_collapsed():
+    stop = threading.Event()
+    worker = threading.Thread(target=stop.wait, name="waiting;worker")
+    worker.start()
+    try:
+        samples = profiling.sample_stacks(0.05, interval=0.01)
+    finally:
+        stop.set()
+        worker.join()
+
+    assert any(stack.startswith("waiting,worker;") and "wait (" in stack for stack in samples)
+    lines = profiling.collapse(samples).decode("utf-8").splitlines()
+    assert len(lines) == len(samples)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+
+def test_profiles_are_for_admins(client):
+    assert client.post("/debug/profile", params={"seconds": 0.05}).status_code == 401
+    assert client.post("/debug/allocations", params={"seconds": 0.05}).status_code == 401
+
+    response = client.post("/debug/profile", params={"seconds": 0.05}, headers=ADMIN)
+    assert response.status_code == 200
+    assert response.headers["content-disposition"].endswith('.collapsed"')
+    assert response.content
+
+    response = client.post("/debug/allocations", params={"seconds": 0.05, "format": "snapshot"}, headers=ADMIN)
+    assert response.status_code == 200
+    assert response.headers["content-disposition"].endswith('.tracemalloc"')
+
+
+def test_traced_requests_get_a_trace_frame(client):
+    with client.websocket_connect("/chat?protocol=mux") as websocket:
+        websocket.send_text(json.dumps({"id": "r1", "message": "traced", "trace": True}))
+        response, trace = json.loads(websocket.receive_text()), json.loads(websocket.receive_text())
+
+    assert response["type"] == "message" and trace["type"] == "trace" and trace["id"] == "r1"
+    assert list(trace["hops_ms"]) == ["receive", "enqueue", "start", "finish", "send"]
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import pytest
+from gourami.core import registry as registry_module
+from gourami.core.registry import ModelRegistry, ModelSpec
+
+
+class FakeModel:
+    def __init__(self, footprint: int):
+        self.footprint = footprint
+
+    def memory_footprint(self) -> int:
+        return self.footprint
+
+
+class FakeEngine:
+    """Stands for the engine of a model, recording whether it was closed."""
+    def __init__(self, spec: ModelSpec):
+        self.spec = spec
+        self.model = FakeModel(spec.model_params.get("footprint", 0))
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class Loader:
+    def __init__(self):
+        self.loaded = []
+
+    def __call__(self, spec: ModelSpec) -> FakeEngine:
+        engine = FakeEngine(spec)
+        self.loaded.append(engine)
+        return engine
+
+
+def specs(**footprints):
+    return [ModelSpec(name, "fake", {"footprint": footprint}) for name, footprint in footprints.items()]
+
+
+def test_models_load_once_on_first_use():
+    async def run():
+        load = Loader()
+        registry = ModelRegistry(specs(a=1, b=1), "a", load)
+        assert registry.get_loaded() is None
+
+        async with registry.use() as first, registry.use("a") as second:
+            assert first is second
+            assert registry.stats()["models"]["a"]["refs"] == 2
+        assert [engine.spec.name for engine in load.loaded] == ["a"]
+        assert registry.stats()["models"]["a"]["status"] == "loaded"
+
+        with pytest.raises(ValueError):
+            async with registry.use("c"):
+                pass
+
+    asyncio.run(run())
+
+
+def test_least_recently_used_model_unloaded_over_budget():
+    async def run():
+        load = Loader()
+        registry = ModelRegistry(specs(a=60, b=60, c=60), "a", load, memory_budget=130)
+        async with registry.use("a"):
+            pass
+        async with registry.use("b"):
+            pass
+        async with registry.use("c"):
+            pass
+
+        assert set(registry.loaded()) == {"b", "c"}
+        assert load.loaded[0].closed
+
+    asyncio.run(run())
+
+
+def test_models_in_use_are_not_unloaded():
+    async def run():
+        registry = ModelRegistry(specs(a=60, b=60), "a", Loader(), memory_budget=100)
+        async with registry.use("a"):
+            async with registry.use("b"):
+                assert set(registry.loaded()) == {"a", "b"}
+            assert not registry.unload("a")
+
+    asyncio.run(run())
+
+
+def test_reload_keeps_in_flight_requests_on_the_previous_version():
+    async def run():
+        load = Loader()
+        registry = ModelRegistry(specs(a=1), "a", load)
+        async with registry.use("a") as previous:
+            changed = await registry.reload(specs(a=2), "a")
+            assert changed == ["a"]
+            async with registry.use("a") as current:
+                assert current is not previous and current.model.footprint == 2
+            assert not previous.closed
+            assert registry.stats()["models"]["a"]["draining"] == 1
+        assert previous.closed
+
+    asyncio.run(run())
+
+
+def test_memory_collected_off_the_event_loop(monkeypatch):
+    threads = []
+    monkeypatch.setattr(registry_module, "_collect", lambda: threads.append(threading.current_thread()))
+
+    async def run():
+        registry = ModelRegistry(specs(a=1), "a", Loader())
+        async with registry.use("a"):
+            pass
+        assert registry.unload("a")
+        await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+    assert threads and threads[0] is not threading.main_thread()
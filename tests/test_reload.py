@@ -0,0 +1,31 @@
+import json
+from gourami.core import config
+from tests.conftest import ADMIN_TOKEN
+
+
+def test_reload_applies_the_model_settings_only(tmp_path, monkeypatch):
+    # Leave the settings of the other tests alone
+    monkeypatch.setattr(config, "_settings_instance", None)
+    monkeypatch.setattr(config, "_configuration", (None, None))
+    monkeypatch.setattr(config, "_configured_env", [])
+    for name in ("GOURAMI_MODEL_TYPE", "GOURAMI_MODEL_PARAMS", "GOURAMI_POOL_SIZE"):
+        monkeypatch.delenv(name, raising=False)
+
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"model_type": "synthetic", "model_params": {"seed": 1}, "pool_size": 2}))
+    settings = config.configure_settings(config_path=str(path))
+    path.write_text(json.dumps({"model_type": "openai", "model_params": {"seed": 2}, "pool_size": 8}))
+
+    assert config.reload_settings() is settings
+    assert settings.MODEL_TYPE == "openai"
+    assert settings.model_params == {"seed": 2}
+    assert settings.POOL_SIZE == 2
+
+
+def test_admin_reload(client):
+    assert client.post("/admin/reload").status_code == 401
+
+    response = client.post("/admin/reload", headers={"Authorization": f"Bearer {ADMIN_TOKEN}"})
+    assert response.status_code == 200
+    # The configuration didn't change
+    assert response.json() == {"status": "reloaded", "changed": []}
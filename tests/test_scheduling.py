@@ -0,0 +1,90 @@
+import asyncio
+import pytest
+from gourami.core.admission import AdmissionController
+
+
+async def hold(admission: AdmissionController, release: asyncio.Event, order: list, name: str, **kwargs):
+    async with admission.admit(**kwargs):
+        order.append(name)
+        await release.wait()
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def instant(admission: AdmissionController, order: list, name: str, **kwargs):
+    async with admission.admit(**kwargs):
+        order.append(name)
+
+
+async def order_of(admission: AdmissionController, requests: list) -> list:
+    release = asyncio.Event()
+    blocker = asyncio.create_task(hold(admission, release, [], "blocker"))
+    await settle()
+    order = []
+    tasks = []
+    for name, kwargs in requests:
+        tasks.append(asyncio.create_task(instant(admission, order, name, **kwargs)))
+        await settle()
+    release.set()
+    await asyncio.gather(blocker, *tasks)
+    return order
+
+
+def test_tenants_take_turns():
+    async def run():
+        admission = AdmissionController(max_concurrency=1, max_queue=16)
+        requests = [(f"a{i}", {"tenant": "a"}) for i in range(3)] + [(f"b{i}", {"tenant": "b"}) for i in range(2)]
+        return await order_of(admission, requests)
+
+    assert asyncio.run(run()) == ["a0", "b0", "a1", "b1", "a2"]
+
+
+def test_fifo_without_fair_queuing():
+    async def run():
+        admission = AdmissionController(max_concurrency=1, max_queue=16, fair=False)
+        requests = [(f"a{i}", {"tenant": "a"}) for i in range(3)] + [(f"b{i}", {"tenant": "b"}) for i in range(2)]
+        return await order_of(admission, requests)
+
+    assert asyncio.run(run()) == ["a0", "a1", "a2", "b0", "b1"]
+
+
+def test_higher_priority_goes_first():
+    async def run():
+        admission = AdmissionController(max_concurrency=1, max_queue=16, priority_classes={"default": 0, "high": 1})
+        requests = [
+            ("low0", {"tenant": "a"}),
+            ("low1", {"tenant": "b"}),
+            ("high0", {"tenant": "c", "priority": "high"}),
+        ]
+        return await order_of(admission, requests)
+
+    assert asyncio.run(run()) == ["high0", "low0", "low1"]
+
+
+def test_unknown_priority_class():
+    async def run():
+        admission = AdmissionController(max_concurrency=1)
+        with pytest.raises(ValueError):
+            async with admission.admit(priority="urgent"):
+                pass
+
+    asyncio.run(run())
+
+
+def test_cost_aware_turns_favor_short_prompts():
+    async def run():
+        admission = AdmissionController(max_concurrency=1, max_queue=16, quantum=100)
+        requests = [
+            ("long0", {"tenant": "long", "cost": 100}),
+            ("long1", {"tenant": "long", "cost": 100}),
+            ("short0", {"tenant": "short", "cost": 25}),
+            ("short1", {"tenant": "short", "cost": 25}),
+            ("short2", {"tenant": "short", "cost": 25}),
+            ("short3", {"tenant": "short", "cost": 25}),
+        ]
+        return await order_of(admission, requests)
+
+    assert asyncio.run(run()) == ["long0", "short0", "short1", "short2", "short3", "long1"]
@@ -0,0 +1,87 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from gourami.core.cache import ResponseCache
+from gourami.core.engine import ModelEngine
+from gourami.core.sessions import SessionCache
+from gourami.plugins.synthetic_plugin import SyntheticConfig, SyntheticModel
+
+
+class EchoHistoryModel(SyntheticModel):
+    """Answers with the number of turns it was given, to tell whether it saw the history."""
+    def stream(self, message, session=None):
+        yield f"turn {len(session.messages) // 2 + 1 if session is not None else 0}"
+
+
+def engine(sessions=None, **kwargs) -> ModelEngine:
+    model = EchoHistoryModel(SyntheticConfig())
+    return ModelEngine(model, ThreadPoolExecutor(max_workers=1), model_type="synthetic", sessions=sessions, **kwargs)
+
+
+def test_turns_are_answered_in_the_conversation():
+    async def run():
+        sessions = SessionCache()
+        served = engine(sessions, cache=ResponseCache())
+        session = sessions.open()
+        assert await served.predict("hi", session=session) == "turn 1"
+        # Not served from the cache: the conversation moved on
+        assert await served.predict("hi", session=session) == "turn 2"
+        assert "".join([chunk async for chunk in served.stream("and now", session=session)]) == "turn 3"
+        assert [message["role"] for message in session.messages] == ["user", "assistant"] * 3
+        assert session.messages[-2:] == [{"role": "user", "content": "and now"}, {"role": "assistant", "content": "turn 3"}]
+
+    asyncio.run(run())
+
+
+def test_sessions_are_kept_apart():
+    async def run():
+        sessions = SessionCache()
+        served = engine(sessions)
+        first, second = sessions.open(), sessions.open()
+        await served.predict("hi", session=first)
+        assert await served.predict("hi", session=second) == "turn 1"
+
+    asyncio.run(run())
+
+
+def test_least_recently_used_states_dropped_over_budget():
+    sessions = SessionCache(max_bytes=100, max_states=8)
+    opened = [sessions.open() for _ in range(3)]
+    for session in opened:
+        session.state, session.state_bytes = object(), 40
+        sessions.touch(session)
+
+    # The oldest state went, its history stays
+    assert opened[0].state is None and opened[1].state is not None and opened[2].state is not None
+    assert sessions.stats()["evictions"] == 1 and sessions.stats()["sessions"] == 3
+
+
+def test_states_of_turns_in_progress_are_kept():
+    async def run():
+        sessions = SessionCache(max_bytes=1000, max_states=1)
+        busy, idle = sessions.open(), sessions.open()
+        busy.state, busy.state_bytes = object(), 1
+        async with busy.lock:
+            idle.state, idle.state_bytes = object(), 1
+            sessions.touch(idle)
+            assert busy.state is not None
+        sessions.touch(busy)
+        assert idle.state is None
+
+    asyncio.run(run())
+
+
+def test_reopening_a_session_by_id():
+    sessions = SessionCache()
+    session = sessions.open()
+    assert sessions.open(session.id) is session
+    sessions.close(session.id)
+    assert sessions.open(session.id) is not session
+
+
+def test_chat_session_lasts_the_connection(client):
+    with client.websocket_connect("/chat?session=true") as websocket:
+        for message in ("hello", "again"):
+            websocket.send_text(message)
+            assert websocket.receive_text()
+        assert client.get("/stats").json()["sessions"]["sessions"] == 1
+    assert client.get("/stats").json()["sessions"]["sessions"] == 0
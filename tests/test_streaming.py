@@ -0,0 +1,60 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from gourami.core.engine import ModelEngine
+from gourami.plugins.synthetic_plugin import SyntheticConfig, SyntheticModel
+
+
+def synthetic(**params) -> SyntheticModel:
+    return SyntheticModel(SyntheticConfig(**{"output_tokens": 8, "first_token_latency_ms": 0, "token_latency_ms": 0, **params}))
+
+
+def test_stream_yields_the_deltas_of_the_response():
+    async def run():
+        engine = ModelEngine(synthetic(), ThreadPoolExecutor(max_workers=1), model_type="synthetic")
+        chunks = [chunk async for chunk in engine.stream("hello")]
+        assert len(chunks) == 8
+        assert "".join(chunks) == await engine.predict("hello")
+
+    asyncio.run(run())
+
+
+def test_closing_a_stream_stops_the_generation():
+    async def run():
+        executor = ThreadPoolExecutor(max_workers=1)
+        engine = ModelEngine(synthetic(output_tokens=1000, token_latency_ms=5), executor)
+        chunks = engine.stream("hello")
+        assert await chunks.__anext__()
+        await chunks.aclose()
+        # The worker is free again rather than generating the remaining 5 seconds
+        await asyncio.wait_for(asyncio.get_running_loop().run_in_executor(executor, lambda: None), timeout=1)
+
+    asyncio.run(run())
+
+
+def test_chat_streams_delta_frames(client):
+    with client.websocket_connect("/chat?stream=true") as websocket:
+        for message in ("hello", "again"):
+            websocket.send_text(message)
+            frames = []
+            while not frames or frames[-1]["type"] != "end":
+                frames.append(json.loads(websocket.receive_text()))
+            deltas = [frame["content"] for frame in frames if frame["type"] == "delta"]
+            assert len(deltas) == 8 and len(frames) == 9
+
+
+def test_chat_answers_plain_text_by_default(client):
+    with client.websocket_connect("/chat") as websocket:
+        websocket.send_text("hello")
+        response = websocket.receive_text()
+        assert len(response.split()) == 8
+
+    with client.websocket_connect("/chat?stream=true") as websocket:
+        websocket.send_text("hello")
+        streamed = ""
+        while True:
+            frame = json.loads(websocket.receive_text())
+            if frame["type"] == "end":
+                break
+            streamed += frame["content"]
+    assert streamed == response